@@ -0,0 +1,83 @@
+"""
+Product filter benchmark: list-of-dicts scan vs the columnar catalog
+Runs the get_products filter combinations used by the storefront over a
+synthetic catalog and reports per-query latency for both paths, plus the
+build time and memory of the columnar index.
+
+    cd backend
+    python -m benchmarks.bench_catalog --products 100000
+"""
+
+import argparse
+import logging
+import os
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks import datasets
+
+# (label, filters) pairs matching typical storefront queries
+QUERIES = [
+    ("all", {}),
+    ("category", {"category": "Ayakkabı"}),
+    ("price_range", {"min_price": 500, "max_price": 1500}),
+    ("search", {"search": "deri"}),
+    ("category_price", {"category": "Bot", "min_price": 1000}),
+    ("category_search_price", {"category": "Spor Ayakkabı", "search": "sneaker", "max_price": 2500}),
+]
+
+def list_filter(products, category=None, search=None, min_price=None, max_price=None):
+    """The original get_products filter chain"""
+    products = products.copy()
+    if category:
+        products = [p for p in products if p.get('category') == category]
+    if search:
+        search_lower = search.lower()
+        products = [p for p in products if search_lower in p.get('name', '').lower()]
+    if min_price is not None:
+        products = [p for p in products if p.get('price', 0) >= min_price]
+    if max_price is not None:
+        products = [p for p in products if p.get('price', float('inf')) <= max_price]
+    return products
+
+def best_of(func, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return min(samples) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare list and columnar product filtering")
+    parser.add_argument("--products", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="chenki-catalog-"))
+    logging.disable(logging.INFO)
+    import server
+
+    size = next((name for name, counts in datasets.SIZES.items() if counts["products"] >= args.products), "100k")
+    products = datasets.generate(size)["products"][:args.products]
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    catalog = server.ColumnarCatalog(products, version=0)
+    build_ms = (time.perf_counter() - started) * 1000
+    index_mb = tracemalloc.get_traced_memory()[0] / 2**20
+    tracemalloc.stop()
+
+    print(f"{len(products)} products, columnar build {build_ms:.1f} ms, index memory {index_mb:.1f} MB")
+    print(f"{'query':<24}{'rows':>8}{'list ms':>12}{'columnar ms':>14}{'speedup':>10}")
+    for label, filters in QUERIES:
+        expected = list_filter(products, **filters)
+        result = catalog.filter(**filters)
+        assert [p["id"] for p in result] == [p["id"] for p in expected], label
+        list_ms = best_of(lambda: list_filter(products, **filters), args.repeat)
+        columnar_ms = best_of(lambda: catalog.filter(**filters), args.repeat)
+        print(f"{label:<24}{len(result):>8}{list_ms:>12.2f}{columnar_ms:>14.2f}{list_ms / columnar_ms:>9.1f}x")
+
+if __name__ == "__main__":
+    main()
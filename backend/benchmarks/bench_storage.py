@@ -0,0 +1,187 @@
+"""
+PersistentDB microbenchmarks
+Measures cold-start import time of server.py, PersistentDB._load_all time,
+per-collection save time and bytes, peak memory, and how alternative
+serialization formats compare on the same data, across dataset sizes.
+
+    cd backend
+    python -m benchmarks.bench_storage --size 1k --size 10k
+    python -m benchmarks.bench_storage --size 100k --repeat 3 --output storage.json
+
+Every size runs in a fresh subprocess, so import time and peak memory are not
+polluted by earlier runs.
+"""
+
+from pathlib import Path
+import argparse
+import gzip
+import json
+import os
+import pickle
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks import datasets
+
+BACKEND_DIR = Path(__file__).parent.parent
+
+def _json_default(obj):
+    # Mirrors server.json_default without importing server before DATA_DIR is set
+    to_dict = getattr(obj, "to_dict", None)
+    return to_dict() if to_dict else str(obj)
+
+COLLECTIONS = ["users", "products", "carts", "orders", "variants", "shipping", "returns"]
+
+# name -> (serialize, deserialize); "json-indent2" is what PersistentDB writes today
+FORMATS = {
+    "json-indent2": (
+        lambda data: json.dumps(data, indent=2, ensure_ascii=False, default=_json_default).encode("utf-8"),
+        lambda raw: json.loads(raw),
+    ),
+    "json-compact": (
+        lambda data: json.dumps(data, separators=(",", ":"), ensure_ascii=False, default=_json_default).encode("utf-8"),
+        lambda raw: json.loads(raw),
+    ),
+    "json-compact-gzip": (
+        lambda data: gzip.compress(
+            json.dumps(data, separators=(",", ":"), ensure_ascii=False, default=_json_default).encode("utf-8"), 1
+        ),
+        lambda raw: json.loads(gzip.decompress(raw)),
+    ),
+    "pickle": (
+        lambda data: pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL),
+        lambda raw: pickle.loads(raw),
+    ),
+}
+
+def timed(func, repeat: int) -> float:
+    """Best-of-N wall time in milliseconds"""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return round(min(samples) * 1000, 3)
+
+def measure_import(data_dir: Path, repeat: int) -> dict:
+    """Import server.py in fresh interpreters, as a serverless cold start does"""
+    code = "import time; t = time.perf_counter(); import server; print(time.perf_counter() - t)"
+    env = dict(os.environ, DATA_DIR=str(data_dir))
+    samples = []
+    for _ in range(repeat):
+        out = subprocess.run(
+            [sys.executable, "-c", code], cwd=BACKEND_DIR, env=env,
+            capture_output=True, text=True, check=True
+        ).stdout
+        samples.append(float(out.strip().splitlines()[-1]) * 1000)
+    return {"min_ms": round(min(samples), 3), "median_ms": round(statistics.median(samples), 3)}
+
+def run_worker(size: str, data_dir: Path, repeat: int) -> dict:
+    """Measure one dataset size (runs inside a dedicated subprocess)"""
+    import logging
+    os.environ["DATA_DIR"] = str(data_dir)
+    logging.disable(logging.INFO)
+
+    result = {"size": size, "import": measure_import(data_dir, repeat)}
+
+    # Timing comes from the subprocess runs above: tracemalloc slows imports down a lot
+    tracemalloc.start()
+    import server
+    result["import_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2**20, 1)
+    tracemalloc.stop()
+
+    database = server.database
+    result["load_all_ms"] = timed(database._load_all, repeat)
+
+    tracemalloc.start()
+    database._load_all()
+    result["load_all_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2**20, 1)
+    tracemalloc.stop()
+
+    saves = {}
+    for name in COLLECTIONS:
+        save = getattr(database, f"save_{name}")
+        save_ms = timed(save, repeat)
+        if name == "carts":
+            size = sum(path.stat().st_size for path in server.CARTS_DIR.glob("*.json"))
+        else:
+            size = (server.DATA_DIR / f"{name}.json").stat().st_size
+        saves[name] = {"save_ms": save_ms, "bytes": size, "records": len(getattr(database, name))}
+    if database.carts:
+        # What a cart request actually writes: one user's cart file
+        user_id = next(iter(database.carts))
+        saves["cart (one)"] = {
+            "save_ms": timed(lambda: database.save_cart(user_id), repeat),
+            "bytes": (server.CARTS_DIR / f"{user_id}.json").stat().st_size,
+            "records": 1,
+        }
+    result["saves"] = saves
+
+    formats = {}
+    for fmt, (serialize, deserialize) in FORMATS.items():
+        total = {"dump_ms": 0.0, "load_ms": 0.0, "bytes": 0}
+        for name in COLLECTIONS:
+            data = getattr(database, name)
+            raw = serialize(data)
+            total["dump_ms"] += timed(lambda: serialize(data), repeat)
+            total["load_ms"] += timed(lambda: deserialize(raw), repeat)
+            total["bytes"] += len(raw)
+        tracemalloc.start()
+        for name in COLLECTIONS:
+            deserialize(serialize(getattr(database, name)))
+        total["peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2**20, 1)
+        tracemalloc.stop()
+        formats[fmt] = {k: round(v, 3) if isinstance(v, float) else v for k, v in total.items()}
+    result["formats"] = formats
+    return result
+
+def print_report(result: dict):
+    print(f"\n== {result['size']} ==")
+    print(f"import server (cold, subprocess): min {result['import']['min_ms']} ms, "
+          f"median {result['import']['median_ms']} ms")
+    print(f"import server peak memory: {result['import_peak_mb']} MB")
+    print(f"_load_all: {result['load_all_ms']} ms, peak {result['load_all_peak_mb']} MB")
+    print(f"{'collection':<12}{'records':>10}{'bytes':>14}{'save ms':>12}")
+    for name, s in result["saves"].items():
+        print(f"{name:<12}{s['records']:>10}{s['bytes']:>14}{s['save_ms']:>12}")
+    print(f"{'format':<20}{'bytes':>14}{'dump ms':>12}{'load ms':>12}{'peak MB':>10}")
+    for fmt, f in result["formats"].items():
+        print(f"{fmt:<20}{f['bytes']:>14}{f['dump_ms']:>12}{f['load_ms']:>12}{f['peak_mb']:>10}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark PersistentDB storage and cold start")
+    parser.add_argument("--size", action="append", choices=list(datasets.SIZES),
+                        help="Dataset size (repeatable, default: 1k and 10k)")
+    parser.add_argument("--repeat", type=int, default=5, help="Repetitions per measurement (best-of)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", type=Path, help="Write the JSON report here")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--data-dir", type=Path, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(args.size[0], args.data_dir, args.repeat)))
+        return
+
+    results = []
+    for size in args.size or ["1k", "10k"]:
+        data_dir = Path(tempfile.mkdtemp(prefix=f"chenki-storage-{size}-"))
+        datasets.write(datasets.generate(size, args.seed), data_dir)
+        out = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_storage", "--worker", "--size", size,
+             "--data-dir", str(data_dir), "--repeat", str(args.repeat)],
+            cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout
+        result = json.loads(out.strip().splitlines()[-1])
+        print_report(result)
+        results.append(result)
+
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
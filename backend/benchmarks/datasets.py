@@ -0,0 +1,209 @@
+"""
+Synthetic dataset generator for benchmarks
+Writes users, products, variants, carts, orders, shipping and returns in the
+same JSON layout PersistentDB reads from DATA_DIR.
+
+    python -m benchmarks.datasets --size 10k --data-dir /tmp/bench-data
+"""
+
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+import argparse
+import json
+import random
+import uuid
+
+import bcrypt
+
+# Named dataset sizes: products, users, orders
+SIZES = {
+    "1k": {"products": 1_000, "users": 1_000, "orders": 1_000},
+    "10k": {"products": 10_000, "users": 10_000, "orders": 10_000},
+    "100k": {"products": 100_000, "users": 100_000, "orders": 100_000},
+}
+
+ADMIN_EMAIL = "admin@chenki.com"
+ADMIN_PASSWORD = "admin123"
+
+CATEGORIES = [
+    "Ayakkabı", "Bot", "Spor Ayakkabı", "Sandalet", "Terlik",
+    "Çanta", "Cüzdan", "Kemer", "Electronics", "Clothing",
+]
+ADJECTIVES = ["Klasik", "Deri", "Süet", "Hafif", "Su Geçirmez", "Günlük", "Ortopedik", "Yazlık", "Kışlık", "Spor"]
+NOUNS = ["Sneaker", "Loafer", "Oxford", "Chelsea Bot", "Koşu Ayakkabısı", "Babet", "Çizme", "Espadril"]
+COLORS = ["Siyah", "Beyaz", "Kahverengi", "Lacivert", "Kırmızı", "Gri"]
+SIZES_EU = ["36", "37", "38", "39", "40", "41", "42", "43", "44", "45"]
+CITIES = ["İstanbul", "Ankara", "İzmir", "Bursa", "Antalya", "Konya", "Adana", "Eskişehir"]
+CARRIERS = ["MNG", "Aras", "Yurtiçi", "Sürat"]
+ORDER_STATUSES = ["pending", "paid", "processing", "shipped", "delivered", "delivered", "delivered", "cancelled"]
+
+USER_PASSWORD = "benchmark"
+
+def _hash_password(password: str) -> str:
+    # Low cost factor: datasets are throwaway and 100k users share one hash anyway
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds=4)).decode("ascii")
+
+def _address(rng: random.Random, name: str) -> dict:
+    city = rng.choice(CITIES)
+    return {
+        "contact_name": name,
+        "address": f"{rng.randint(1, 200)}. Sokak No:{rng.randint(1, 80)}",
+        "city": city,
+        "country": "Turkey",
+        "zip_code": f"{rng.randint(1, 81):02d}{rng.randint(0, 999):03d}",
+    }
+
+def generate(size: str = "1k", seed: int = 42, now: datetime = None) -> dict:
+    """Generate all collections for a named size"""
+    if size not in SIZES:
+        raise ValueError(f"Unknown dataset size {size!r}, expected one of {', '.join(SIZES)}")
+    counts = SIZES[size]
+    rng = random.Random(seed)
+    now = now or datetime.now(timezone.utc)
+
+    def new_id() -> str:
+        return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+    # One hash shared by every synthetic user: hashing 100k passwords would take minutes
+    user_password_hash = _hash_password(USER_PASSWORD)
+    users = {}
+    admin_id = new_id()
+    users[admin_id] = {
+        "id": admin_id,
+        "email": ADMIN_EMAIL,
+        "name": "Admin",
+        "password_hash": _hash_password(ADMIN_PASSWORD),
+        "is_admin": True,
+        "created_at": (now - timedelta(days=400)).isoformat(),
+    }
+    user_ids = []
+    for i in range(counts["users"]):
+        uid = new_id()
+        users[uid] = {
+            "id": uid,
+            "email": f"user{i}@example.com",
+            "name": f"Kullanıcı {i}",
+            "password_hash": user_password_hash,
+            "is_admin": False,
+            "created_at": (now - timedelta(days=rng.uniform(0, 365))).isoformat(),
+        }
+        user_ids.append(uid)
+
+    products = []
+    variants = []
+    for i in range(counts["products"]):
+        pid = new_id()
+        products.append({
+            "id": pid,
+            "name": f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {i}",
+            "description": "Günlük kullanım için rahat ve dayanıklı ürün. " * rng.randint(1, 4),
+            "price": round(rng.uniform(99, 4999), 2),
+            "category": rng.choice(CATEGORIES),
+            "image_url": f"https://images.example.com/products/{i}.jpg",
+            "stock": rng.randint(0, 200),
+            "created_at": (now - timedelta(days=rng.uniform(0, 730))).isoformat(),
+        })
+        # Roughly one product in five has size/color variants
+        if rng.random() < 0.2:
+            for eu_size in rng.sample(SIZES_EU, 3):
+                variants.append({
+                    "id": new_id(),
+                    "product_id": pid,
+                    "size": eu_size,
+                    "color": rng.choice(COLORS),
+                    "sku": f"SKU-{i}-{eu_size}",
+                    "stock": rng.randint(0, 30),
+                    "price_adjustment": rng.choice([0.0, 0.0, 50.0, 100.0]),
+                    "image_url": None,
+                })
+
+    orders = []
+    shipping = []
+    returns = []
+    for _ in range(counts["orders"]):
+        oid = new_id()
+        uid = rng.choice(user_ids)
+        items = []
+        for product in rng.sample(products, rng.randint(1, 4)):
+            items.append({"product_id": product["id"], "quantity": rng.randint(1, 3), "price": product["price"]})
+        created_at = now - timedelta(days=rng.uniform(0, 365))
+        status = rng.choice(ORDER_STATUSES)
+        name = users[uid]["name"]
+        address = _address(rng, name)
+        orders.append({
+            "id": oid,
+            "user_id": uid,
+            "items": items,
+            "total_amount": round(sum(i["price"] * i["quantity"] for i in items), 2),
+            "status": status,
+            "payment_id": str(rng.randint(10**7, 10**8)) if status != "pending" else None,
+            "shipping_address": address,
+            "billing_address": address,
+            "buyer_info": {"name": name, "surname": "Test", "identity_number": "11111111111"},
+            "created_at": created_at.isoformat(),
+        })
+        if status in ("shipped", "delivered"):
+            shipped_at = created_at + timedelta(days=1)
+            shipping.append({
+                "order_id": oid,
+                "carrier": rng.choice(CARRIERS),
+                "tracking_number": f"TR{rng.randint(10**9, 10**10)}",
+                "status": status,
+                "estimated_delivery": None,
+                "shipped_at": shipped_at.isoformat(),
+                "delivered_at": (shipped_at + timedelta(days=2)).isoformat() if status == "delivered" else None,
+            })
+        if status == "delivered" and rng.random() < 0.05:
+            returns.append({
+                "id": new_id(),
+                "order_id": oid,
+                "user_id": uid,
+                "items": items[:1],
+                "reason": "Beden uymadı",
+                "status": rng.choice(["pending", "approved", "processed"]),
+                "created_at": (created_at + timedelta(days=5)).isoformat(),
+                "processed_at": None,
+            })
+
+    # A small share of users have an open cart
+    carts = {}
+    for uid in rng.sample(user_ids, max(1, len(user_ids) // 10)):
+        product = rng.choice(products)
+        carts[uid] = {
+            "id": new_id(),
+            "user_id": uid,
+            "items": [{"product_id": product["id"], "quantity": rng.randint(1, 3), "price": product["price"]}],
+            "updated_at": (now - timedelta(hours=rng.uniform(0, 24 * 60))).isoformat(),
+        }
+
+    return {
+        "users": users,
+        "products": products,
+        "carts": carts,
+        "orders": orders,
+        "variants": variants,
+        "shipping": shipping,
+        "returns": returns,
+    }
+
+def write(data: dict, data_dir: Path, indent=2):
+    """Write collections to DATA_DIR using the server's file names"""
+    data_dir = Path(data_dir)
+    data_dir.mkdir(parents=True, exist_ok=True)
+    for name, collection in data.items():
+        with open(data_dir / f"{name}.json", "w", encoding="utf-8") as f:
+            json.dump(collection, f, indent=indent, ensure_ascii=False)
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic dataset into DATA_DIR")
+    parser.add_argument("--size", choices=list(SIZES), default="1k")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--data-dir", required=True, type=Path)
+    args = parser.parse_args()
+
+    data = generate(args.size, args.seed)
+    write(data, args.data_dir)
+    print(f"Wrote {args.size} dataset to {args.data_dir}: " + ", ".join(f"{k}={len(v)}" for k, v in data.items()))
+
+if __name__ == "__main__":
+    main()
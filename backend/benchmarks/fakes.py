@@ -0,0 +1,72 @@
+"""
+Stand-ins for external services used by the benchmarks
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import time
+import uuid
+
+class FakePayment:
+    """Replacement for iyzipay.Payment that always approves.
+
+    Like the real client it blocks the calling thread, so ``latency`` simulates the
+    round trip to iyzico when the cost of that blocking call is under test.
+    """
+    latency = 0.0
+
+    def create(self, request, options):
+        if self.latency:
+            time.sleep(self.latency)
+        return {
+            "status": "success",
+            "paymentId": str(uuid.uuid4().int)[:8],
+            "conversationId": request.get("conversationId"),
+            "price": request.get("price"),
+        }
+
+class FakeIyzipay:
+    """Drop-in for the ``iyzipay`` module as used by server.process_payment"""
+    Payment = FakePayment
+
+def install_fake_iyzipay(server_module, latency: float = 0.0):
+    """Route server payments to the fake gateway"""
+    FakePayment.latency = latency
+    server_module.iyzipay = FakeIyzipay
+
+class ImageHostHandler(BaseHTTPRequestHandler):
+    """Image host stand-in: paths under /ok/ are images, /html/ is a web page, the rest 404"""
+    latency = 0.0
+
+    def _respond(self, with_body: bool):
+        if self.latency:
+            time.sleep(self.latency)
+        if self.path.startswith("/ok/"):
+            status, content_type = 200, "image/jpeg"
+        elif self.path.startswith("/html/"):
+            status, content_type = 200, "text/html"
+        else:
+            status, content_type = 404, "text/plain"
+        body = b"\xff\xd8\xff" if status == 200 else b"not found"
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if with_body:
+            self.wfile.write(body)
+
+    def do_HEAD(self):
+        self._respond(False)
+
+    def do_GET(self):
+        self._respond(True)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_image_host(latency: float = 0.0, port: int = 0):
+    """Serve the image host stand-in on a background thread; returns (base_url, server)"""
+    handler = type("ImageHost", (ImageHostHandler,), {"latency": latency})
+    httpd = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{httpd.server_address[1]}", httpd
@@ -0,0 +1,372 @@
+"""
+API load benchmark
+Generates a synthetic dataset into DATA_DIR, drives the app with scripted
+scenarios either in-process (ASGI calls, no network) or against a local uvicorn,
+and reports throughput, latency percentiles and memory. Results are compared
+with baselines recorded on this machine; the exit code is 1 when a metric regresses.
+
+    cd backend
+    python -m benchmarks.run_api --size 1k --mode inprocess
+    python -m benchmarks.run_api --size 10k --mode uvicorn --scenario browse_catalog
+    python -m benchmarks.run_api --size 1k --update-baseline
+
+Baselines are machine specific and not committed: the first run of a scenario
+on a machine records its baseline (in baselines.json, git-ignored), later runs
+compare against it. Re-record after intended changes with --update-baseline.
+"""
+
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks import datasets
+from benchmarks.scenarios import SCENARIOS
+
+BENCH_DIR = Path(__file__).parent
+BACKEND_DIR = BENCH_DIR.parent
+BASELINES_FILE = BENCH_DIR / "baselines.json"
+
+# ==================== Clients ====================
+
+class ASGIClient:
+    """Calls the ASGI app directly, measuring the app without socket overhead"""
+    def __init__(self, app):
+        self.app = app
+
+    async def request(self, method: str, path: str, body: bytes, headers: list):
+        path, _, query = path.partition("?")
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": method,
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": query.encode(),
+            "root_path": "",
+            "headers": [(b"host", b"bench")] + headers,
+            "client": ("127.0.0.1", 50000),
+            "server": ("bench", 80),
+        }
+        request_sent = False
+        response_complete = asyncio.Event()
+        status = 0
+        chunks = []
+
+        async def receive():
+            nonlocal request_sent
+            if not request_sent:
+                request_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            # Like a real client, only disconnect once the response has been sent
+            await response_complete.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+                if not message.get("more_body", False):
+                    response_complete.set()
+
+        await self.app(scope, receive, send)
+        return status, b"".join(chunks)
+
+class HTTPClient:
+    """Talks to a running server over keep-alive HTTP connections"""
+    def __init__(self, base_url: str, concurrency: int):
+        import requests
+        self.base_url = base_url
+        self._requests = requests
+        self._executor = ThreadPoolExecutor(max_workers=concurrency)
+        self._sessions = {}
+
+    def _session(self):
+        ident = threading.get_ident()
+        session = self._sessions.get(ident)
+        if session is None:
+            session = self._sessions[ident] = self._requests.Session()
+        return session
+
+    def _send(self, method, path, body, headers):
+        response = self._session().request(
+            method, self.base_url + path, data=body or None,
+            headers={k.decode(): v.decode() for k, v in headers}
+        )
+        return response.status_code, response.content
+
+    async def request(self, method: str, path: str, body: bytes, headers: list):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._send, method, path, body, headers)
+
+class Recorder:
+    """Wraps a client and records latency and status per request label"""
+    def __init__(self, client):
+        self.client = client
+        self.latencies = {}  # label -> [seconds]
+        self.errors = 0
+        self.requests = 0
+
+    async def call(self, label: str, method: str, path: str, body=None, token=None):
+        headers = [(b"content-type", b"application/json"), (b"accept-encoding", b"gzip")]
+        if token:
+            headers.append((b"authorization", f"Bearer {token}".encode()))
+        payload = json.dumps(body).encode() if body is not None else b""
+        started = time.perf_counter()
+        status, content = await self.client.request(method, path, payload, headers)
+        self.latencies.setdefault(label, []).append(time.perf_counter() - started)
+        self.requests += 1
+        if status >= 400:
+            self.errors += 1
+        return status, content
+
+# ==================== Measurement ====================
+
+def percentile(sorted_values: list, pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def summarize(values: list) -> dict:
+    ordered = sorted(values)
+    return {
+        "count": len(ordered),
+        "p50_ms": round(percentile(ordered, 50) * 1000, 3),
+        "p95_ms": round(percentile(ordered, 95) * 1000, 3),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3) if ordered else 0.0,
+    }
+
+def process_memory_mb(pid: int = None) -> dict:
+    """Current and peak RSS of a process (Linux /proc, getrusage fallback for self)"""
+    status_file = Path(f"/proc/{pid or 'self'}/status")
+    try:
+        fields = {}
+        for line in status_file.read_text().splitlines():
+            key, _, value = line.partition(":")
+            if key in ("VmRSS", "VmHWM"):
+                fields[key] = int(value.split()[0]) / 1024
+        return {"rss_mb": round(fields["VmRSS"], 1), "peak_rss_mb": round(fields["VmHWM"], 1)}
+    except (OSError, KeyError):
+        if pid is not None:
+            return {"rss_mb": None, "peak_rss_mb": None}
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        return {"rss_mb": None, "peak_rss_mb": round(peak, 1)}
+
+async def run_scenario(recorder: Recorder, name: str, ctx, iterations: int, concurrency: int, seed: int) -> dict:
+    """Run a scenario with a fixed number of closed-loop workers"""
+    scenario = SCENARIOS[name]
+    per_worker = max(1, iterations // concurrency)
+
+    async def worker(worker_id: int):
+        rng = random.Random(seed * 1000 + worker_id)
+        for _ in range(per_worker):
+            await scenario(recorder, ctx, rng)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    all_latencies = [v for values in recorder.latencies.values() for v in values]
+    return {
+        "requests": recorder.requests,
+        "errors": recorder.errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(recorder.requests / elapsed, 1) if elapsed else 0.0,
+        **summarize(all_latencies),
+        "routes": {label: summarize(values) for label, values in sorted(recorder.latencies.items())},
+    }
+
+# ==================== Context ====================
+
+class ScenarioContext:
+    """Dataset facts and tokens the scenarios pick from"""
+    def __init__(self, data_dir: Path, secret_key: str, max_users: int = 200):
+        from jose import jwt
+
+        with open(data_dir / "products.json", encoding="utf-8") as f:
+            raw_products = json.load(f)
+        self.products = [{"id": p["id"], "price": p["price"]} for p in raw_products]
+        self.product_ids = [p["id"] for p in self.products]
+        self.categories = sorted({p["category"] for p in raw_products})
+        self.search_terms = sorted({word for p in raw_products[:500] for word in p["name"].split()[:2]})
+
+        with open(data_dir / "users.json", encoding="utf-8") as f:
+            users = json.load(f)
+        expire = datetime.now(timezone.utc) + timedelta(hours=6)
+
+        def token(user_id: str) -> str:
+            return jwt.encode({"sub": user_id, "exp": expire}, secret_key, algorithm="HS256")
+
+        admin = next(u for u in users.values() if u.get("is_admin"))
+        self.admin_token = token(admin["id"])
+        customers = [u["id"] for u in users.values() if not u.get("is_admin")][:max_users]
+        self.user_tokens = [token(uid) for uid in customers]
+
+def resolve_secret_key() -> str:
+    """JWT secret the server will use (same lookup as server.py)"""
+    from dotenv import load_dotenv
+    load_dotenv(BACKEND_DIR / ".env")
+    return os.environ.get("JWT_SECRET", "your-secret-key-change-in-production")
+
+# ==================== Modes ====================
+
+async def run_inprocess(args, data_dir: Path) -> dict:
+    import logging
+    import server
+    from benchmarks.fakes import install_fake_iyzipay
+
+    logging.getLogger("server").setLevel(logging.WARNING)
+    install_fake_iyzipay(server, args.iyzico_latency)
+    ctx = ScenarioContext(data_dir, server.SECRET_KEY)
+    results = {}
+    async with server.app.router.lifespan_context(server.app):
+        for name in args.scenario:
+            recorder = Recorder(ASGIClient(server.app))
+            results[name] = await run_scenario(recorder, name, ctx, args.iterations, args.concurrency, args.seed)
+            results[name].update(process_memory_mb())
+    return results
+
+async def run_uvicorn(args, data_dir: Path) -> dict:
+    import requests
+
+    env = dict(os.environ, DATA_DIR=str(data_dir))
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.serve", "--port", str(args.port),
+         "--iyzico-latency", str(args.iyzico_latency)],
+        cwd=BACKEND_DIR, env=env
+    )
+    base_url = f"http://127.0.0.1:{args.port}"
+    try:
+        deadline = time.monotonic() + 120
+        while True:
+            try:
+                if requests.get(f"{base_url}/health", timeout=1).status_code == 200:
+                    break
+            except requests.RequestException:
+                pass
+            if proc.poll() is not None or time.monotonic() > deadline:
+                raise RuntimeError("uvicorn did not start")
+            time.sleep(0.2)
+
+        ctx = ScenarioContext(data_dir, resolve_secret_key())
+        client = HTTPClient(base_url, args.concurrency)
+        results = {}
+        for name in args.scenario:
+            recorder = Recorder(client)
+            results[name] = await run_scenario(recorder, name, ctx, args.iterations, args.concurrency, args.seed)
+            results[name].update(process_memory_mb(proc.pid))
+        return results
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+# ==================== Baselines ====================
+
+# Metrics compared against the baseline and whether higher values are better
+COMPARED_METRICS = {"throughput_rps": True, "p95_ms": False, "p99_ms": False, "peak_rss_mb": False}
+
+def compare(results: dict, baselines: dict, prefix: str, tolerance: float) -> list:
+    """Return human readable regressions beyond the tolerance"""
+    regressions = []
+    for name, result in results.items():
+        baseline = baselines.get(f"{prefix}/{name}")
+        if not baseline:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            current, expected = result.get(metric), baseline.get(metric)
+            if current is None or not expected:
+                continue
+            if higher_is_better and current < expected * (1 - tolerance):
+                regressions.append(f"{prefix}/{name} {metric}: {current} < baseline {expected}")
+            elif not higher_is_better and current > expected * (1 + tolerance):
+                regressions.append(f"{prefix}/{name} {metric}: {current} > baseline {expected}")
+    return regressions
+
+def record_baselines(baselines: dict, results: dict, prefix: str, names: list, path: Path):
+    """Store the compared metrics of the given scenarios as their baselines"""
+    for name in names:
+        baselines[f"{prefix}/{name}"] = {metric: results[name].get(metric) for metric in COMPARED_METRICS}
+    path.write_text(json.dumps(baselines, indent=2, sort_keys=True) + "\n")
+
+def print_report(results: dict, prefix: str):
+    print(f"\n{prefix}")
+    print(f"{'scenario':<16}{'req':>8}{'err':>6}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'peak MB':>10}")
+    for name, r in results.items():
+        print(f"{name:<16}{r['requests']:>8}{r['errors']:>6}{r['throughput_rps']:>10}"
+              f"{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}{str(r.get('peak_rss_mb')):>10}")
+        for label, route in r["routes"].items():
+            print(f"  {label:<22}{route['count']:>8}{'':>16}{route['p50_ms']:>10}{route['p95_ms']:>10}{route['p99_ms']:>10}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the API with synthetic data")
+    parser.add_argument("--size", choices=list(datasets.SIZES), default="1k")
+    parser.add_argument("--mode", choices=["inprocess", "uvicorn"], default="inprocess")
+    parser.add_argument("--scenario", action="append", choices=list(SCENARIOS),
+                        help="Scenario to run (repeatable, default: all)")
+    parser.add_argument("--iterations", type=int, default=200, help="Scenario iterations per run")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--iyzico-latency", type=float, default=0.0,
+                        help="Simulated blocking payment gateway latency in seconds")
+    parser.add_argument("--data-dir", type=Path, help="Dataset directory (default: fresh temp dir)")
+    parser.add_argument("--output", type=Path, help="Write the JSON report here")
+    parser.add_argument("--baseline-file", type=Path, default=BASELINES_FILE)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative regression")
+    args = parser.parse_args()
+    args.scenario = args.scenario or list(SCENARIOS)
+
+    data_dir = args.data_dir or Path(tempfile.mkdtemp(prefix=f"chenki-bench-{args.size}-"))
+    datasets.write(datasets.generate(args.size, args.seed), data_dir)
+    # Must be set before server is imported: DATA_DIR is resolved at import time
+    os.environ["DATA_DIR"] = str(data_dir)
+    # Scenarios log in and write carts far beyond the production rate limit budgets
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "0")
+
+    runner = run_inprocess if args.mode == "inprocess" else run_uvicorn
+    results = asyncio.run(runner(args, data_dir))
+    prefix = f"{args.mode}/{args.size}"
+    print_report(results, prefix)
+
+    if args.output:
+        args.output.write_text(json.dumps({prefix: results}, indent=2))
+
+    baselines = json.loads(args.baseline_file.read_text()) if args.baseline_file.exists() else {}
+    if args.update_baseline:
+        record_baselines(baselines, results, prefix, list(results), args.baseline_file)
+        print(f"\nBaselines updated in {args.baseline_file}")
+        return
+
+    # Scenarios without a baseline on this machine record one instead of comparing
+    missing = [name for name in results if f"{prefix}/{name}" not in baselines]
+    if missing:
+        record_baselines(baselines, results, prefix, missing, args.baseline_file)
+        print(f"\nRecorded first baselines for {', '.join(missing)} in {args.baseline_file}")
+
+    regressions = compare(results, baselines, prefix, args.tolerance)
+    if regressions:
+        print("\nREGRESSIONS:")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+    print("\nNo regressions against baseline")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Scripted API scenarios for the benchmark runner
+Each scenario is an async function running one user journey against a client
+exposing ``await client.call(label, method, path, body=None, token=None)``.
+"""
+
+from urllib.parse import quote
+import json
+import random
+
+async def browse_catalog(client, ctx, rng: random.Random):
+    """Home page, category listing, product detail and its variants"""
+    await client.call("products", "GET", "/api/products")
+    await client.call("categories", "GET", "/api/categories")
+    category = rng.choice(ctx.categories)
+    await client.call("products_by_category", "GET", f"/api/products?category={quote(category)}")
+    product_id = rng.choice(ctx.product_ids)
+    await client.call("product_detail", "GET", f"/api/products/{product_id}")
+    await client.call("product_variants", "GET", f"/api/products/{product_id}/variants")
+
+async def search(client, ctx, rng: random.Random):
+    """Search box queries with and without filters"""
+    term = rng.choice(ctx.search_terms)
+    await client.call("search", "GET", f"/api/products?search={quote(term)}")
+    low = rng.randint(100, 2000)
+    await client.call(
+        "search_filtered", "GET",
+        f"/api/products?search={quote(term)}&min_price={low}&max_price={low + 1000}"
+    )
+
+async def cart_churn(client, ctx, rng: random.Random):
+    """Add, update, read and remove cart lines"""
+    token = rng.choice(ctx.user_tokens)
+    first, second = rng.sample(ctx.products, 2)
+    for product in (first, second):
+        await client.call("cart_add", "POST", "/api/cart", {"product_id": product["id"], "quantity": 1}, token)
+    await client.call("cart_update", "PUT", f"/api/cart/{first['id']}?quantity=3", token=token)
+    await client.call("cart_get", "GET", "/api/cart", token=token)
+    await client.call("cart_remove", "PUT", f"/api/cart/{second['id']}?quantity=0", token=token)
+    await client.call("cart_clear", "DELETE", "/api/cart", token=token)
+
+async def checkout(client, ctx, rng: random.Random):
+    """Cart, order creation and payment against the fake iyzico gateway"""
+    token = rng.choice(ctx.user_tokens)
+    items = [
+        {"product_id": p["id"], "quantity": rng.randint(1, 2), "price": p["price"]}
+        for p in rng.sample(ctx.products, rng.randint(1, 3))
+    ]
+    for item in items:
+        await client.call("cart_add", "POST", "/api/cart", item, token)
+    address = {"contact_name": "Test Kullanıcı", "address": "1. Sokak No:1", "city": "İstanbul",
+               "country": "Turkey", "zip_code": "34000"}
+    status, body = await client.call("order_create", "POST", "/api/orders", {
+        "items": items,
+        "shipping_address": address,
+        "billing_address": address,
+        "buyer_info": {"name": "Test", "surname": "Kullanıcı", "identity_number": "11111111111"},
+    }, token)
+    if status != 200:
+        return
+    order_id = json.loads(body)["id"]
+    await client.call("payment", "POST", "/api/payment/process", {
+        "order_id": order_id,
+        "card_number": "5528790000000008",
+        "card_holder_name": "Test Kullanıcı",
+        "expire_month": "12",
+        "expire_year": "2030",
+        "cvc": "123",
+    }, token)
+
+async def admin_orders(client, ctx, rng: random.Random):
+    """Admin dashboard order and return listings"""
+    await client.call("admin_orders", "GET", "/api/admin/orders", token=ctx.admin_token)
+    await client.call("admin_returns", "GET", "/api/admin/returns", token=ctx.admin_token)
+
+SCENARIOS = {
+    "browse_catalog": browse_catalog,
+    "search": search,
+    "cart_churn": cart_churn,
+    "checkout": checkout,
+    "admin_orders": admin_orders,
+}
@@ -0,0 +1,32 @@
+"""
+Run the API under uvicorn with the fake iyzico gateway, for out-of-process benchmarks
+DATA_DIR must point at a generated dataset before this module is started.
+
+    DATA_DIR=/tmp/bench-data python -m benchmarks.serve --port 8765
+"""
+
+import argparse
+import logging
+import os
+
+import uvicorn
+
+# Load generators exceed the production rate limit budgets by design
+os.environ.setdefault("RATE_LIMIT_ENABLED", "0")
+
+import server
+from benchmarks.fakes import install_fake_iyzipay
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the API for benchmarking")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--iyzico-latency", type=float, default=0.0)
+    args = parser.parse_args()
+
+    install_fake_iyzipay(server, args.iyzico_latency)
+    logging.getLogger("server").setLevel(logging.WARNING)
+    uvicorn.run(server.app, host=args.host, port=args.port, log_level="warning", access_log=False)
+
+if __name__ == "__main__":
+    main()
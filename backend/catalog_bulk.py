@@ -0,0 +1,98 @@
+"""
+Bulk catalog sync: send product and variant upserts/deletes to the bulk endpoint
+Input is NDJSON (one operation per line) or JSON (a list of operations or
+{"operations": [...]}). Each operation looks like:
+
+    {"op": "upsert", "type": "product", "id": "...", "data": {"price": 1299.0}}
+    {"op": "delete", "type": "variant", "id": "..."}
+
+    python catalog_bulk.py products.ndjson --api http://127.0.0.1:8000 --dry-run
+    ADMIN_TOKEN=... python catalog_bulk.py products.ndjson --batch-size 5000
+
+Each batch is applied atomically by the server; separate batches are not.
+"""
+
+from itertools import islice
+from pathlib import Path
+import argparse
+import json
+import os
+import sys
+
+import requests
+
+def read_operations(path: Path):
+    """Yield operations from an NDJSON or JSON file"""
+    with path.open(encoding="utf-8") as f:
+        first = f.read(1)
+        f.seek(0)
+        if first in ("[", "{") and path.suffix == ".json":
+            data = json.load(f)
+            yield from data["operations"] if isinstance(data, dict) else data
+            return
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def get_token(session: requests.Session, api: str, args) -> str:
+    """Use ADMIN_TOKEN, or log in with the given admin credentials"""
+    token = args.token or os.environ.get("ADMIN_TOKEN")
+    if token:
+        return token
+    if not (args.email and args.password):
+        sys.exit("Set ADMIN_TOKEN or pass --email and --password")
+    response = session.post(f"{api}/api/auth/login", json={"email": args.email, "password": args.password})
+    response.raise_for_status()
+    return response.json()["token"]
+
+def send_batch(session: requests.Session, api: str, batch: list,
+               dry_run: bool = False, atomic: bool = True, timeout: float = 120) -> dict:
+    """POST one batch of operations as NDJSON and return the per-row report"""
+    body = "".join(json.dumps(op, ensure_ascii=False) + "\n" for op in batch).encode("utf-8")
+    response = session.post(
+        f"{api}/api/admin/catalog/bulk",
+        params={"dry_run": str(dry_run).lower(), "atomic": str(atomic).lower()},
+        data=body,
+        headers={"Content-Type": "application/x-ndjson"},
+        timeout=timeout
+    )
+    response.raise_for_status()
+    return response.json()
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk upsert/delete products and variants")
+    parser.add_argument("file", type=Path, help="NDJSON or JSON file of operations")
+    parser.add_argument("--api", default=os.environ.get("API_URL", "http://127.0.0.1:8000"))
+    parser.add_argument("--token", help="Admin JWT (default: ADMIN_TOKEN env)")
+    parser.add_argument("--email", default=os.environ.get("ADMIN_EMAIL"))
+    parser.add_argument("--password", default=os.environ.get("ADMIN_PASSWORD"))
+    parser.add_argument("--batch-size", type=int, default=5000, help="Operations per request")
+    parser.add_argument("--dry-run", action="store_true", help="Validate only, write nothing")
+    parser.add_argument("--no-atomic", action="store_true", help="Apply valid rows even if some are rejected")
+    parser.add_argument("--timeout", type=float, default=120)
+    args = parser.parse_args()
+
+    api = args.api.rstrip("/")
+    session = requests.Session()
+    session.headers["Authorization"] = f"Bearer {get_token(session, api, args)}"
+
+    operations = read_operations(args.file)
+    totals = {"total": 0, "errors": 0, "applied_batches": 0}
+    offset = 0
+    while batch := list(islice(operations, args.batch_size)):
+        result = send_batch(session, api, batch, args.dry_run, not args.no_atomic, args.timeout)
+        totals["total"] += result["total"]
+        totals["errors"] += result["errors"]
+        totals["applied_batches"] += int(result["applied"])
+        for row in result["results"]:
+            if row["status"] == "error":
+                print(f"line {offset + row['line']}: {row.get('type', '?')} {row.get('id') or ''} - {row['error']}")
+        offset += len(batch)
+
+    print(f"{totals['total']} operations, {totals['errors']} rejected, "
+          f"{totals['applied_batches']} batch(es) applied{' (dry run)' if args.dry_run else ''}")
+    if totals["errors"]:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
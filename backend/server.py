@@ -3,29 +3,48 @@ E-Commerce Backend API
 FastAPI-based REST API for e-commerce platform
 """
 
+from collections import Counter, OrderedDict, deque, namedtuple
 from contextlib import asynccontextmanager
+from functools import lru_cache
 from datetime import datetime, timezone, timedelta
 from pathlib import Path
-from typing import List, Optional
+from typing import Awaitable, List, Optional
 import os
 import logging
 import uuid
 import json
+import gzip
+import zlib
+import hashlib
+import hmac
+import heapq
+import itertools
+import math
+import random
+import bisect
+import csv
+import io
+import time
+import sys
 import asyncio
+import threading
+import weakref
+import sqlite3
+import traceback
+from concurrent.futures import ThreadPoolExecutor
 from threading import Lock
 
 from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, UploadFile, File, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from starlette.concurrency import run_in_threadpool
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.requests import Request as StarletteRequest
-from starlette.responses import Response
-from pydantic import BaseModel, Field, ConfigDict, EmailStr
+from starlette.responses import Response, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field, ConfigDict, EmailStr, ValidationError
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from dotenv import load_dotenv
-import iyzipay
 
 # ==================== Configuration ====================
 
@@ -49,7 +68,25 @@ SECRET_KEY = os.environ.get('JWT_SECRET', 'your-secret-key-change-in-production'
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 10080  # 7 days
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# passlib and iyzipay are imported on first use to keep them off the cold-start path
+_pwd_context = None
+iyzipay = None
+
+def get_pwd_context():
+    """Get the password hashing context, importing passlib on first use"""
+    global _pwd_context
+    if _pwd_context is None:
+        from passlib.context import CryptContext
+        _pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    return _pwd_context
+
+def get_iyzipay():
+    """Get the iyzipay client module, importing it on first payment"""
+    global iyzipay
+    if iyzipay is None:
+        import iyzipay as iyzipay_module
+        iyzipay = iyzipay_module
+    return iyzipay
 security = HTTPBearer()
 
 # Upload Directory - Vercel için /tmp kullan
@@ -59,8 +96,10 @@ else:
     UPLOAD_DIR = ROOT_DIR / 'uploads'
 UPLOAD_DIR.mkdir(exist_ok=True, parents=True)
 
-# Data Directory - Vercel için /tmp kullan
-if IS_VERCEL:
+# Data Directory - Vercel için /tmp kullan (DATA_DIR overrides, e.g. for benchmarks)
+if os.environ.get('DATA_DIR'):
+    DATA_DIR = Path(os.environ['DATA_DIR'])
+elif IS_VERCEL:
     DATA_DIR = Path('/tmp/data')
 else:
     DATA_DIR = ROOT_DIR / 'data'
@@ -69,29 +108,620 @@ DATA_DIR.mkdir(exist_ok=True, parents=True)
 # JSON Database Files
 USERS_FILE = DATA_DIR / 'users.json'
 PRODUCTS_FILE = DATA_DIR / 'products.json'
-CARTS_FILE = DATA_DIR / 'carts.json'
+CARTS_FILE = DATA_DIR / 'carts.json'  # Legacy single file, only read to migrate into CARTS_DIR
+CARTS_DIR = DATA_DIR / 'carts'  # One file per user's cart
 ORDERS_FILE = DATA_DIR / 'orders.json'
 VARIANTS_FILE = DATA_DIR / 'variants.json'
 SHIPPING_FILE = DATA_DIR / 'shipping.json'
 RETURNS_FILE = DATA_DIR / 'returns.json'
+JOBS_FILE = DATA_DIR / 'jobs.json'  # Pending and dead-lettered background jobs
+
+# ==================== Metrics ====================
+
+# Request latency buckets in seconds (Prometheus histogram "le" bounds)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# JSON file saves range from sub-millisecond (carts) to seconds (large order histories)
+SAVE_DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+class Histogram:
+    """Cumulative histogram in the Prometheus exposition model"""
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def render(self, name: str, labels: str) -> List[str]:
+        """Render bucket, sum and count samples"""
+        sep = ',' if labels else ''
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels}{sep}le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels}{sep}le="+Inf"}} {self.count}')
+        lines.append(f'{name}_sum{{{labels}}} {self.sum}')
+        lines.append(f'{name}_count{{{labels}}} {self.count}')
+        return lines
+
+class MetricsRegistry:
+    """In-process metrics rendered in the Prometheus text format.
+
+    Counters are updated from the event loop and from save threads, so every
+    mutation goes through one lock.
+    """
+    def __init__(self):
+        self._lock = Lock()
+        self.request_count = {}  # (method, route, status) -> count
+        self.request_latency = {}  # (method, route) -> Histogram
+        self.in_flight = 0
+        self.loop_lag_seconds = 0.0
+        self.loop_lag_max_seconds = 0.0
+        self.db_save_duration = {}  # collection -> Histogram
+        self.db_bytes_written = {}  # collection -> bytes
+        self.db_save_errors = {}  # collection -> count
+        # Extra gauges sampled at scrape time: name -> (help, callable returning {labels: value})
+        self.gauges = {}
+
+    def observe_request(self, method: str, route: str, status_code: int, duration: float):
+        with self._lock:
+            key = (method, route, status_code)
+            self.request_count[key] = self.request_count.get(key, 0) + 1
+            histogram = self.request_latency.get((method, route))
+            if histogram is None:
+                histogram = self.request_latency[(method, route)] = Histogram(LATENCY_BUCKETS)
+            histogram.observe(duration)
+
+    def observe_save(self, collection: str, duration: float, nbytes: int):
+        with self._lock:
+            histogram = self.db_save_duration.get(collection)
+            if histogram is None:
+                histogram = self.db_save_duration[collection] = Histogram(SAVE_DURATION_BUCKETS)
+            histogram.observe(duration)
+            self.db_bytes_written[collection] = self.db_bytes_written.get(collection, 0) + nbytes
+
+    def count_save_error(self, collection: str):
+        with self._lock:
+            self.db_save_errors[collection] = self.db_save_errors.get(collection, 0) + 1
+
+    def observe_loop_lag(self, lag: float):
+        self.loop_lag_seconds = lag
+        if lag > self.loop_lag_max_seconds:
+            self.loop_lag_max_seconds = lag
+
+    def register_gauge(self, name: str, help_text: str, collect):
+        """Register a gauge whose samples are collected when /metrics is scraped"""
+        self.gauges[name] = (help_text, collect)
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            lines.append('# HELP http_requests_total Total HTTP requests by route and status')
+            lines.append('# TYPE http_requests_total counter')
+            for (method, route, code), count in sorted(self.request_count.items()):
+                lines.append(f'http_requests_total{{method="{method}",route="{route}",status="{code}"}} {count}')
+
+            lines.append('# HELP http_request_duration_seconds HTTP request latency by route')
+            lines.append('# TYPE http_request_duration_seconds histogram')
+            for (method, route), histogram in sorted(self.request_latency.items()):
+                lines.extend(histogram.render('http_request_duration_seconds', f'method="{method}",route="{route}"'))
+
+            lines.append('# HELP http_requests_in_flight HTTP requests currently being served')
+            lines.append('# TYPE http_requests_in_flight gauge')
+            lines.append(f'http_requests_in_flight {self.in_flight}')
+
+            lines.append('# HELP event_loop_lag_seconds Last measured event loop scheduling lag')
+            lines.append('# TYPE event_loop_lag_seconds gauge')
+            lines.append(f'event_loop_lag_seconds {self.loop_lag_seconds}')
+            lines.append('# HELP event_loop_lag_max_seconds Worst event loop lag since startup')
+            lines.append('# TYPE event_loop_lag_max_seconds gauge')
+            lines.append(f'event_loop_lag_max_seconds {self.loop_lag_max_seconds}')
+
+            lines.append('# HELP db_save_duration_seconds Time spent writing a collection to disk')
+            lines.append('# TYPE db_save_duration_seconds histogram')
+            for collection, histogram in sorted(self.db_save_duration.items()):
+                lines.extend(histogram.render('db_save_duration_seconds', f'collection="{collection}"'))
+
+            lines.append('# HELP db_bytes_written_total Bytes written to disk per collection')
+            lines.append('# TYPE db_bytes_written_total counter')
+            for collection, nbytes in sorted(self.db_bytes_written.items()):
+                lines.append(f'db_bytes_written_total{{collection="{collection}"}} {nbytes}')
+
+            lines.append('# HELP db_save_errors_total Failed collection saves')
+            lines.append('# TYPE db_save_errors_total counter')
+            for collection, count in sorted(self.db_save_errors.items()):
+                lines.append(f'db_save_errors_total{{collection="{collection}"}} {count}')
+
+        for name, (help_text, collect) in self.gauges.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} gauge')
+            try:
+                samples = collect()
+            except Exception as e:
+                logger.warning(f"Error collecting metric {name}: {e}")
+                continue
+            for labels, value in samples.items():
+                lines.append(f'{name}{{{labels}}} {value}' if labels else f'{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+metrics = MetricsRegistry()
+
+# ==================== Diagnostics ====================
+
+# Opt-in: loop stall detection and request profiling add a watchdog thread and sampling overhead
+DIAGNOSTICS_ENABLED = os.environ.get('DIAGNOSTICS_ENABLED') == '1'
+# Log a stack trace when the event loop has not run for this long (seconds)
+LOOP_BLOCK_THRESHOLD = float(os.environ.get('LOOP_BLOCK_THRESHOLD', 0.25))
+# Sampling interval of the request profiler (seconds)
+PROFILE_SAMPLE_INTERVAL = float(os.environ.get('PROFILE_SAMPLE_INTERVAL', 0.002))
+# The X-Profile request header must carry this value (or come with an admin JWT);
+# when unset, only admins can profile through the header
+DIAGNOSTICS_TOKEN = os.environ.get('DIAGNOSTICS_TOKEN')
+# Number of finished request profiles kept in memory
+PROFILE_HISTORY_SIZE = 50
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({Path(code.co_filename).name}:{frame.f_lineno})"
+
+def collapse_stack(frame) -> str:
+    """Render a frame chain root-first in the folded flamegraph format"""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+class LoopBlockWatchdog:
+    """Background thread that logs what the event loop is doing when it stalls.
+
+    The loop refreshes a heartbeat; when the heartbeat gets older than the threshold
+    the watchdog captures the loop thread's current stack, which points at the
+    synchronous call that is holding it.
+    """
+    def __init__(self, threshold: float):
+        self.threshold = threshold
+        self.heartbeat = time.monotonic()
+        self.loop_thread_id = None
+        self.blocked_count = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    async def beat(self):
+        """Keep the heartbeat fresh from inside the event loop"""
+        self.loop_thread_id = threading.get_ident()
+        while True:
+            self.heartbeat = time.monotonic()
+            await asyncio.sleep(self.threshold / 4)
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _watch(self):
+        reported_heartbeat = None
+        while not self._stop.wait(self.threshold / 2):
+            stalled_for = time.monotonic() - self.heartbeat
+            if stalled_for < self.threshold or self.loop_thread_id is None:
+                continue
+            if reported_heartbeat == self.heartbeat:
+                continue  # Same stall, already reported
+            reported_heartbeat = self.heartbeat
+            frame = sys._current_frames().get(self.loop_thread_id)
+            if frame is None:
+                continue
+            self.blocked_count += 1
+            stack = ''.join(traceback.format_stack(frame))
+            logger.warning(f"Event loop blocked for {stalled_for * 1000:.0f} ms, current stack:\n{stack}")
+
+class SamplingProfiler:
+    """Samples the event loop thread's stack while a request is running.
+
+    Samples are aggregated as folded stacks (``frame;frame;frame count``), which
+    flamegraph.pl and speedscope read directly. Other requests interleaved on the
+    loop during the sampling window show up in the profile as well.
+    """
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self) -> str:
+        self._stop.set()
+        self._thread.join()
+        return self.folded()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = collapse_stack(frame)
+            self.samples[stack] = self.samples.get(stack, 0) + 1
+
+    def folded(self) -> str:
+        return '\n'.join(f"{stack} {count}" for stack, count in sorted(self.samples.items())) + '\n'
+
+class Diagnostics:
+    """State of the opt-in diagnostics mode"""
+    def __init__(self):
+        self.watchdog = LoopBlockWatchdog(LOOP_BLOCK_THRESHOLD)
+        # Admin toggle: profile every request whose path starts with this prefix
+        self.profile_path_prefix = None
+        self.profiles = OrderedDict()  # profile_id -> metadata with folded stacks
+
+    def should_profile(self, path: str, profile_header: Optional[str], authorization: str = '') -> bool:
+        if profile_header is not None:
+            if DIAGNOSTICS_TOKEN and hmac.compare_digest(profile_header.encode(), DIAGNOSTICS_TOKEN.encode()):
+                return True
+            return is_admin_authorization(authorization)
+        return self.profile_path_prefix is not None and path.startswith(self.profile_path_prefix)
+
+    def store_profile(self, method: str, path: str, duration: float, folded: str) -> str:
+        profile_id = str(uuid.uuid4())
+        self.profiles[profile_id] = {
+            "id": profile_id,
+            "method": method,
+            "path": path,
+            "duration_ms": round(duration * 1000, 3),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "folded": folded
+        }
+        while len(self.profiles) > PROFILE_HISTORY_SIZE:
+            self.profiles.popitem(last=False)
+        return profile_id
+
+diagnostics = Diagnostics()
+
+# ==================== Compact Records ====================
+
+_MISSING = object()
+
+class Record:
+    """Slotted record with dict-style access.
+
+    Hot collections (users, orders, cart lines) hold these instead of free-form
+    dicts: no per-instance __dict__, and repeated string values are interned.
+    Unknown keys are kept in a small overflow dict so files round-trip unchanged.
+    Records become plain dicts only when serialized (API responses, JSON files).
+    """
+    __slots__ = ('_extra',)
+    FIELDS = ()
+    # Fields whose string values repeat across records and are interned
+    INTERNED = frozenset()
+    # Fields holding a list of nested records: field -> record class
+    NESTED = {}
 
-# Thread lock for file operations
-file_lock = Lock()
+    @classmethod
+    def from_dict(cls, data: dict):
+        record = cls.__new__(cls)
+        extra = None
+        for key, value in data.items():
+            if key in cls.NESTED and isinstance(value, list):
+                record_cls = cls.NESTED[key]
+                value = [v if isinstance(v, Record) else record_cls.from_dict(v) for v in value]
+            elif key in cls.INTERNED and isinstance(value, str):
+                value = sys.intern(value)
+            if key in cls.FIELDS:
+                setattr(record, key, value)
+            else:
+                if extra is None:
+                    extra = {}
+                extra[key] = value
+        for field in cls.FIELDS:
+            if not hasattr(record, field):
+                setattr(record, field, _MISSING)
+        record._extra = extra
+        return record
+
+    def to_dict(self) -> dict:
+        data = {field: value for field in self.FIELDS if (value := getattr(self, field)) is not _MISSING}
+        for field in self.NESTED:
+            value = data.get(field)
+            if isinstance(value, list):
+                data[field] = [v.to_dict() if isinstance(v, Record) else v for v in value]
+        if self._extra:
+            data.update(self._extra)
+        return data
+
+    def __getitem__(self, key):
+        if key in self.FIELDS:
+            value = getattr(self, key)
+            if value is not _MISSING:
+                return value
+        elif self._extra and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __setitem__(self, key, value):
+        if key in self.INTERNED and isinstance(value, str):
+            value = sys.intern(value)
+        if key in self.FIELDS:
+            setattr(self, key, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __contains__(self, key) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def update(self, values: dict):
+        for key, value in values.items():
+            self[key] = value
+
+    def replace(self, changes: dict):
+        """Shallow copy with some fields changed; the original is left untouched"""
+        record = type(self).__new__(type(self))
+        for cls in type(self).__mro__:
+            for slot in cls.__dict__.get('__slots__', ()):
+                if hasattr(self, slot):
+                    setattr(record, slot, getattr(self, slot))
+        record._extra = dict(self._extra) if self._extra else None
+        record.update(changes)
+        return record
+
+    def keys(self):
+        return self.to_dict().keys()
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+class CartLine(Record):
+    """Cart or order line"""
+    __slots__ = ('product_id', 'quantity', 'price', 'variant_id')
+    FIELDS = __slots__
+    INTERNED = frozenset({'product_id'})
+
+    @property
+    def key(self) -> tuple:
+        variant_id = self.variant_id
+        return (self.product_id, None if variant_id is _MISSING else variant_id)
+
+class CartRecord(Record):
+    """A user's cart.
+
+    Lines live in a dict keyed by (product_id, variant_id), so adding, updating
+    and removing a line is O(1); the list form only exists in the stored JSON
+    and API responses. The total is cached until the cart or the catalog changes.
+    """
+    __slots__ = ('id', 'user_id', 'items', 'updated_at', '_revision', '_total', '_total_key')
+    FIELDS = ('id', 'user_id', 'items', 'updated_at')
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        record = super().from_dict({k: v for k, v in data.items() if k != 'items'})
+        lines = (i if isinstance(i, Record) else CartLine.from_dict(i) for i in data.get('items', []))
+        record.items = {line.key: line for line in lines}
+        record._revision, record._total, record._total_key = 0, 0.0, None
+        return record
+
+    @classmethod
+    def new(cls, user_id: str):
+        return cls.from_dict({'id': str(uuid.uuid4()), 'user_id': user_id, 'items': []})
+
+    def to_dict(self) -> dict:
+        data = super().to_dict()
+        data['items'] = [line.to_dict() for line in self.items.values()]
+        return data
+
+    def touch(self):
+        self._revision += 1
+        self.updated_at = datetime.now(timezone.utc).isoformat()
+
+    def add(self, product_id: str, variant_id: Optional[str], quantity: int, price: float):
+        line = self.items.get((product_id, variant_id))
+        if line is None:
+            data = {'product_id': product_id, 'quantity': quantity, 'price': price}
+            if variant_id is not None:
+                data['variant_id'] = variant_id
+            line = CartLine.from_dict(data)
+            self.items[line.key] = line
+        else:
+            line.quantity += quantity
+            line.price = price
+        self.touch()
+
+    def set_quantity(self, product_id: str, variant_id: Optional[str], quantity: int) -> bool:
+        """Set a line's quantity, removing it at zero; False if the line is not in the cart"""
+        key = (product_id, variant_id)
+        if key not in self.items:
+            return False
+        if quantity <= 0:
+            del self.items[key]
+        else:
+            self.items[key].quantity = quantity
+        self.touch()
+        return True
+
+class UserRecord(Record):
+    __slots__ = ('id', 'email', 'name', 'password_hash', 'is_admin', 'created_at')
+    FIELDS = __slots__
+
+class OrderRecord(Record):
+    __slots__ = (
+        'id', 'user_id', 'items', 'total_amount', 'status', 'payment_id',
+        'shipping_address', 'billing_address', 'buyer_info', 'created_at'
+    )
+    FIELDS = __slots__
+    INTERNED = frozenset({'user_id', 'status'})
+    NESTED = {'items': CartLine}
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        record = super().from_dict(data)
+        # City and country names repeat across every order's addresses
+        for field in ('shipping_address', 'billing_address'):
+            address = getattr(record, field)
+            if isinstance(address, dict):
+                for key in ('city', 'country'):
+                    if isinstance(address.get(key), str):
+                        address[key] = sys.intern(address[key])
+        return record
+
+def json_default(obj):
+    """json.dump fallback: records serialize as dicts, anything else as str"""
+    if isinstance(obj, Record):
+        return obj.to_dict()
+    return str(obj)
+
+def _decode_users(users: dict) -> dict:
+    return {uid: UserRecord.from_dict(u) for uid, u in users.items()}
+
+def _decode_orders(orders: list) -> list:
+    return [OrderRecord.from_dict(o) for o in orders]
+
+def _decode_carts(legacy: dict) -> dict:
+    """Carts from the legacy carts.json, overridden by the per-user cart files"""
+    carts = {uid: CartRecord.from_dict(cart) for uid, cart in legacy.items()}
+    if CARTS_DIR.exists():
+        for path in CARTS_DIR.glob('*.json'):
+            try:
+                carts[path.stem] = CartRecord.from_dict(json.loads(path.read_bytes()))
+            except Exception as e:
+                logger.warning(f"Error loading cart {path.name}: {e}")
+    return carts
+
+# ==================== Change Feed ====================
+
+# standalone: one process does everything; primary: owns writes and publishes the
+# change feed; replica: read-only, follows the primary's feed
+SERVER_ROLE = os.environ.get('SERVER_ROLE', 'standalone')
+IS_PRIMARY = SERVER_ROLE == 'primary'
+IS_REPLICA = SERVER_ROLE == 'replica'
+CHANGE_FEED_FILE = DATA_DIR / 'changes.log'
+CHANGE_FEED_MAX_BYTES = int(os.environ.get('CHANGE_FEED_MAX_BYTES', str(16 * 1024 * 1024)))
+
+def _last_feed_seq(path: Path) -> int:
+    """Sequence number of the last entry in a feed file (0 if there is none)"""
+    try:
+        with open(path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - 4096))
+            lines = f.read().splitlines()
+        return json.loads(lines[-1])['seq'] if lines else 0
+    except (OSError, ValueError, KeyError, IndexError):
+        return 0
+
+class ChangeFeed:
+    """Append-only NDJSON log of saved collections, tailed by replica processes.
+
+    The primary appends {"seq", "collection", "key"} after each JSON file is
+    written; a key names a single record file (a user's cart). When the log
+    outgrows max_bytes it is rotated to changes.log.1 and replicas reload.
+    """
+    def __init__(self, path: Path, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock = Lock()
+        self.seq = _last_feed_seq(path) or _last_feed_seq(path.with_name(path.name + '.1'))
+        self._file = None
+
+    def append(self, collection: str, key: Optional[str] = None) -> int:
+        with self.lock:
+            self.seq += 1
+            entry = {"seq": self.seq, "collection": collection, "ts": time.time()}
+            if key is not None:
+                entry["key"] = key
+            if self._file is None:
+                self._file = open(self.path, 'ab')
+            self._file.write(json.dumps(entry).encode('utf-8') + b'\n')
+            self._file.flush()
+            if self._file.tell() > self.max_bytes:
+                self._file.close()
+                self._file = None
+                self.path.replace(self.path.with_name(self.path.name + '.1'))
+            return self.seq
 
 # ==================== Persistent JSON Database ====================
 
+# A collection's records as of one version; records is a tuple (dict copy for users, carts)
+Snapshot = namedtuple('Snapshot', ['version', 'records'])
+
+class LazyCollection:
+    """Descriptor that loads a collection from its JSON file on first access"""
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, db, owner=None):
+        if db is None:
+            return self
+        try:
+            return db._data[self.name]
+        except KeyError:
+            return db._load_collection(self.name)
+
+    def __set__(self, db, value):
+        db._data[self.name] = value
+        db.mark_changed(self.name)
+
 class PersistentDB:
-    """JSON file-based persistent database"""
+    """JSON file-based persistent database
+
+    Collections are loaded lazily on first access, so a serverless cold start
+    serving the catalog only parses products.json.
+    """
+    # Collection name -> (file, default factory, decoder turning loaded JSON into records)
+    COLLECTIONS = {
+        'users': (USERS_FILE, dict, _decode_users),
+        'products': (PRODUCTS_FILE, list, None),
+        'carts': (CARTS_FILE, dict, _decode_carts),
+        'orders': (ORDERS_FILE, list, _decode_orders),
+        'variants': (VARIANTS_FILE, list, None),
+        'shipping': (SHIPPING_FILE, list, None),
+        'returns': (RETURNS_FILE, list, None),
+        'jobs': (JOBS_FILE, list, None),
+    }
+
+    users = LazyCollection()
+    products = LazyCollection()
+    carts = LazyCollection()
+    orders = LazyCollection()
+    variants = LazyCollection()
+    shipping = LazyCollection()
+    returns = LazyCollection()
+    jobs = LazyCollection()
+
     def __init__(self):
-        self.users = {}
-        self.products = []
-        self.carts = {}
-        self.orders = []
-        self.variants = []
-        self.shipping = []
-        self.returns = []
-        self._load_all()
-        logger.info("Persistent database initialized")
+        self._data = {}
+        self._load_locks = {name: Lock() for name in self.COLLECTIONS}
+        # Bumped on every load, assignment and save; derived indexes rebuild when it moves
+        self.versions = {name: 0 for name in self.COLLECTIONS}
+        self._versions_lock = Lock()  # Saves run in worker threads too
+        self._snapshots = {}
+        # One writer per collection file; different collections save in parallel
+        self._save_locks = {name: Lock() for name in self.COLLECTIONS}
+        self._saved_versions = {}  # file -> version of the snapshot on disk
+        self.snapshot_builds = Counter()
+        self.superseded_saves = Counter()
+        # Replicas never write; the primary announces every save on the change feed
+        self.read_only = IS_REPLICA
+        self.change_feed = ChangeFeed(CHANGE_FEED_FILE, CHANGE_FEED_MAX_BYTES) if IS_PRIMARY else None
+        logger.info("Persistent database initialized (collections load on first access)")
     
     def _load_json(self, filepath: Path, default):
         """Load data from JSON file"""
@@ -105,69 +735,1306 @@ class PersistentDB:
             logger.warning(f"Error loading {filepath.name}: {e}, using in-memory default")
         return default
     
-    def _save_json(self, filepath: Path, data):
-        """Save data to JSON file"""
+    def _load_collection(self, name: str, reload: bool = False):
+        """Load a collection from disk unless another thread already did"""
+        with self._load_locks[name]:
+            if reload or name not in self._data:
+                filepath, default, decode = self.COLLECTIONS[name]
+                data = self._load_json(filepath, default())
+                self._data[name] = decode(data) if decode else data
+                self.mark_changed(name)
+            return self._data[name]
+
+    def mark_changed(self, name: str):
+        """Invalidate indexes derived from a collection"""
+        with self._versions_lock:
+            self.versions[name] += 1
+
+    def is_loaded(self, name: str) -> bool:
+        """Whether a collection is already in memory"""
+        return name in self._data
+
+    def loaded_collections(self) -> List[str]:
+        """Names of collections currently in memory"""
+        return [name for name in self.COLLECTIONS if name in self._data]
+
+    def preload(self, *names: str, reload: bool = False):
+        """Load several collections in parallel threads (all when no names are given)"""
+        names = names or tuple(self.COLLECTIONS)
+        pending = [name for name in names if reload or name not in self._data]
+        if len(pending) == 1:
+            self._load_collection(pending[0], reload)
+        elif pending:
+            # File reads and json's C decoder overlap reasonably well across threads
+            with ThreadPoolExecutor(max_workers=len(pending), thread_name_prefix='db-load') as executor:
+                list(executor.map(lambda name: self._load_collection(name, reload), pending))
+
+    def snapshot(self, name: str) -> Snapshot:
+        """Immutable copy of a collection, shared by all readers until the collection changes.
+
+        Readers off the event loop (threadpool filters, index builds, saves) iterate
+        this instead of the live list, which handlers may change at any time. Stored
+        records are never changed in place (see replace_record), so the records a
+        snapshot holds stay exactly as they were when it was taken.
+        """
+        data = getattr(self, name)  # May load and bump the version
+        # Version before copying: a change racing the copy only makes the copy newer
+        version = self.versions[name]
+        cached = self._snapshots.get(name)
+        if cached is None or cached.version != version:
+            # list/dict copies are single C calls, atomic with respect to other threads
+            records = tuple(data) if isinstance(data, list) else dict(data)
+            cached = self._snapshots[name] = Snapshot(version, records)
+            self.snapshot_builds[name] += 1
+        return cached
+
+    def replace_record(self, name: str, record, changes: dict):
+        """Copy-on-write update: swap a changed copy of record into the collection and return it.
+
+        Snapshots and saves running in other threads keep serializing the old
+        object, so they never see a record half-way through an update.
+        """
+        data = getattr(self, name)
+        if isinstance(data, dict):
+            position = record['id']
+        else:
+            try:
+                position = data.index(record)  # Records compare by identity, dicts by content
+            except ValueError:
+                # Replaced by another update whose save has not refreshed the indexes yet
+                position = next((i for i, r in enumerate(data) if r.get('id') == record['id']), None)
+                if position is None:
+                    raise KeyError(record['id'])
+        current = data[position]  # Build on the latest version, so concurrent updates compose
+        new_record = current.replace(changes) if isinstance(current, Record) else {**current, **changes}
+        data[position] = new_record
+        return new_record
+
+    def _save_collection(self, name: str, filepath: Path):
+        self.mark_changed(name)
+        snapshot = self.snapshot(name)
+        self._save_json(filepath, snapshot.records, version=snapshot.version)
+
+    def persist(self, name: str) -> Awaitable[None]:
+        """Save a collection from a request handler without blocking the event loop.
+
+        The version bump and snapshot happen when this is called; the returned
+        awaitable serializes and writes the file in a worker thread. Handlers apply
+        their incremental index changes (update_analytics etc.) between the two,
+        so no other request can bump the version in the gap:
+
+            saved = database.persist('orders')
+            update_analytics(lambda analytics: analytics.add_order(record))
+            await saved
+        """
+        self.mark_changed(name)
+        snapshot = self.snapshot(name)
+        return run_in_threadpool(self._save_json, self.COLLECTIONS[name][0], snapshot.records, version=snapshot.version)
+
+    def _save_json(self, filepath: Path, data, label: Optional[str] = None, version: Optional[int] = None):
+        """Save data to JSON file (label names the collection in metrics, default the file name)
+
+        The file is replaced atomically. With a version, a save that lost the race
+        to a newer snapshot of the same collection is dropped instead of
+        overwriting it.
+        """
+        if self.read_only:
+            logger.warning(f"Read-only replica, not saving {filepath.name}")
+            return
+        started = time.perf_counter()
+        name = label or filepath.stem
         try:
-            with file_lock:
+            payload = json.dumps(data, indent=2, ensure_ascii=False, default=json_default).encode('utf-8')
+            with self._save_locks.get(name) or self._save_locks.setdefault(name, Lock()):
+                if version is not None and version < self._saved_versions.get(filepath, 0):
+                    self.superseded_saves[name] += 1
+                    return
                 # Ensure directory exists
                 filepath.parent.mkdir(parents=True, exist_ok=True)
-                with open(filepath, 'w', encoding='utf-8') as f:
-                    json.dump(data, f, indent=2, ensure_ascii=False, default=str)
+                tmp = filepath.with_name(f".{filepath.name}.tmp")
+                with open(tmp, 'wb') as f:
+                    f.write(payload)
+                os.replace(tmp, filepath)
+                if version is not None:
+                    self._saved_versions[filepath] = version
+            metrics.observe_save(label or filepath.stem, time.perf_counter() - started, len(payload))
+            if self.change_feed is not None:
+                # Labelled saves write one record's file, named by its key
+                self.change_feed.append(label or filepath.stem, filepath.stem if label else None)
             logger.debug(f"Saved {len(data) if isinstance(data, (list, dict)) else 0} items to {filepath.name}")
         except Exception as e:
+            metrics.count_save_error(label or filepath.stem)
             logger.warning(f"Error saving {filepath.name}: {e}, data will be in-memory only")
             # Vercel'de dosya yazma başarısız olabilir, bu normal
     
     def _load_all(self):
-        """Load all data from JSON files"""
-        self.users = self._load_json(USERS_FILE, {})
-        self.products = self._load_json(PRODUCTS_FILE, [])
-        self.carts = self._load_json(CARTS_FILE, {})
-        self.orders = self._load_json(ORDERS_FILE, [])
-        self.variants = self._load_json(VARIANTS_FILE, [])
-        self.shipping = self._load_json(SHIPPING_FILE, [])
-        self.returns = self._load_json(RETURNS_FILE, [])
+        """Load (or reload) all data from JSON files"""
+        self.preload(reload=True)
     
     def save_users(self):
         """Save users to file"""
-        self._save_json(USERS_FILE, self.users)
+        self._save_collection('users', USERS_FILE)
     
     def save_products(self):
         """Save products to file"""
-        self._save_json(PRODUCTS_FILE, self.products)
+        self._save_collection('products', PRODUCTS_FILE)
     
     def save_carts(self):
-        """Save carts to file"""
-        self._save_json(CARTS_FILE, self.carts)
+        """Save every cart to its own file and retire the legacy carts.json"""
+        if self.read_only:
+            return
+        self.mark_changed('carts')
+        carts = self.carts
+        for user_id, cart in list(carts.items()):
+            self._save_json(CARTS_DIR / f"{user_id}.json", cart, label='carts')
+        try:
+            for path in CARTS_DIR.glob('*.json'):
+                if path.stem not in carts:
+                    path.unlink(missing_ok=True)  # A concurrent save_cart may have removed it
+            if CARTS_FILE.exists():
+                CARTS_FILE.replace(CARTS_FILE.with_name('carts.json.migrated'))
+                logger.info(f"Migrated {len(carts)} carts from carts.json to {CARTS_DIR.name}/")
+        except OSError as e:
+            logger.warning(f"Error cleaning up cart files: {e}")
+        if self.change_feed is not None:
+            self.change_feed.append('carts')  # Files were removed: replicas reload every cart
+
+    def save_cart(self, user_id: str):
+        """Save one user's cart, or remove its file if the cart is gone"""
+        if self.read_only:
+            return
+        if CARTS_FILE.exists():
+            # Carts still live in the legacy file: migrate them all once
+            self.save_carts()
+            return
+        self.mark_changed('carts')
+        cart = self.carts.get(user_id)
+        path = CARTS_DIR / f"{user_id}.json"
+        if cart is not None:
+            self._save_json(path, cart, label='carts')
+        else:
+            try:
+                path.unlink(missing_ok=True)
+            except OSError as e:
+                logger.warning(f"Error removing {path.name}: {e}")
+            if self.change_feed is not None:
+                self.change_feed.append('carts', user_id)
     
     def save_orders(self):
         """Save orders to file"""
-        self._save_json(ORDERS_FILE, self.orders)
+        self._save_collection('orders', ORDERS_FILE)
     
     def save_variants(self):
         """Save variants to file"""
-        self._save_json(VARIANTS_FILE, self.variants)
+        self._save_collection('variants', VARIANTS_FILE)
     
     def save_shipping(self):
         """Save shipping info to file"""
-        self._save_json(SHIPPING_FILE, self.shipping)
+        self._save_collection('shipping', SHIPPING_FILE)
     
     def save_returns(self):
         """Save returns to file"""
-        self._save_json(RETURNS_FILE, self.returns)
+        self._save_collection('returns', RETURNS_FILE)
+
+    def save_jobs(self):
+        """Save pending and dead-lettered jobs to file"""
+        self._save_collection('jobs', JOBS_FILE)
 
     def save_all(self):
-        """Save all data to files"""
-        self.save_users()
-        self.save_products()
-        self.save_carts()
-        self.save_orders()
-        self.save_variants()
-        self.save_shipping()
-        self.save_returns()
+        """Save all loaded collections to files (unloaded ones are unchanged on disk)"""
+        for name in self.loaded_collections():
+            getattr(self, f"save_{name}")()
 
 database = PersistentDB()
 
+# Long-running servers warm every collection after startup; serverless cold starts
+# only load what the first request touches
+PRELOAD_COLLECTIONS = os.environ.get('PRELOAD_COLLECTIONS', '0' if IS_VERCEL else '1') == '1'
+
+# ==================== Product Catalog Index ====================
+
+# Opt-in numpy-backed catalog for large catalogs; the plain list scan is faster below a few thousand products
+COLUMNAR_CATALOG = os.environ.get('COLUMNAR_CATALOG') == '1'
+
+class ColumnarCatalog:
+    """Array-backed filter columns over the product list.
+
+    Price and stock live in numpy arrays, categories as interned codes, and
+    lower-cased names in a fixed-width string array, so get_products filters
+    become vectorized masks. The product dicts stay the source of truth; only
+    the rows that pass the filters are returned.
+    """
+    def __init__(self, products: list, version: int):
+        import numpy as np  # Deferred: numpy is only needed when the columnar catalog is enabled
+
+        self.np = np
+        self.version = version
+        self.rows = products
+        n = len(products)
+        self.id_to_row = {p.get('id'): i for i, p in enumerate(products)}
+
+        prices = [p.get('price') for p in products]
+        self.price_low = np.array([0.0 if v is None else v for v in prices], dtype=np.float64)
+        if any(v is None for v in prices):
+            self.price_high = np.array([np.inf if v is None else v for v in prices], dtype=np.float64)
+        else:
+            self.price_high = self.price_low
+        self.stock = np.fromiter((p.get('stock', 0) or 0 for p in products), dtype=np.int64, count=n)
+
+        self.category_codes_by_name = {}
+        codes_by_name = self.category_codes_by_name
+        self.category_codes = np.fromiter(
+            (codes_by_name.setdefault(sys.intern(p.get('category') or ''), len(codes_by_name)) for p in products),
+            dtype=np.int32, count=n
+        )
+
+        self.names_lower = np.array([p.get('name', '').lower() for p in products], dtype=str)
+
+    def get(self, product_id: str) -> Optional[dict]:
+        row = self.id_to_row.get(product_id)
+        return None if row is None else self.rows[row]
+
+    def filter(self, category=None, search=None, min_price=None, max_price=None) -> list:
+        """Return product dicts matching the get_products filters, in catalog order"""
+        if not (category or search or min_price is not None or max_price is not None):
+            return self.rows
+        np = self.np
+        mask = np.ones(len(self.rows), dtype=bool)
+        if category:
+            code = self.category_codes_by_name.get(category)
+            if code is None:
+                return []
+            mask &= self.category_codes == code
+        if min_price is not None:
+            mask &= self.price_low >= min_price
+        if max_price is not None:
+            mask &= self.price_high <= max_price
+        rows = np.flatnonzero(mask)
+        if search and len(rows):
+            # Substring search only on rows that survived the cheaper numeric filters
+            found = np.char.find(self.names_lower[rows], search.lower()) >= 0
+            rows = rows[found]
+        return [self.rows[i] for i in rows.tolist()]
+
+_catalog = None
+_product_index = None
+
+def get_catalog() -> ColumnarCatalog:
+    """Get the columnar catalog, rebuilding it when products changed"""
+    global _catalog
+    version, products = database.snapshot('products')
+    if _catalog is None or _catalog.version != version:
+        _catalog = ColumnarCatalog(products, version)
+    return _catalog
+
+def find_product(product_id: str) -> Optional[dict]:
+    """Find a product by id through an index rebuilt only when products change"""
+    if COLUMNAR_CATALOG:
+        return get_catalog().get(product_id)
+    global _product_index
+    version, products = database.snapshot('products')
+    if _product_index is None or _product_index[0] != version:
+        _product_index = (version, {p.get('id'): p for p in products})
+    return _product_index[1].get(product_id)
+
+_variant_index = None
+
+def find_variant(variant_id: str) -> Optional[dict]:
+    """Find a variant by id through an index rebuilt only when variants change"""
+    global _variant_index
+    version, variants = database.snapshot('variants')
+    if _variant_index is None or _variant_index[0] != version:
+        _variant_index = (version, {v.get('id'): v for v in variants})
+    return _variant_index[1].get(variant_id)
+
+_field_indexes = {}
+
+def get_field_index(collection: str, field: str, many: bool = False) -> dict:
+    """Map a field value to its record (first match) or, with many, to all its records.
+
+    Rebuilt only when the collection changes.
+    """
+    version, records = database.snapshot(collection)
+    cached = _field_indexes.get((collection, field, many))
+    if cached is None or cached[0] != version:
+        index = {}
+        if many:
+            for record in records:
+                index.setdefault(record.get(field), []).append(record)
+        else:
+            for record in records:
+                index.setdefault(record.get(field), record)
+        cached = _field_indexes[(collection, field, many)] = (version, index)
+    return cached[1]
+
+def find_order(order_id: str, user_id: Optional[str] = None):
+    """Find an order by id, optionally only if it belongs to the given user"""
+    order = get_field_index('orders', 'id').get(order_id)
+    if order is not None and user_id is not None and order.get('user_id') != user_id:
+        return None
+    return order
+
+def _plain(value):
+    """Records inside a projected value become dicts"""
+    if isinstance(value, Record):
+        return value.to_dict()
+    if isinstance(value, list) and value and isinstance(value[0], Record):
+        return [v.to_dict() for v in value]
+    return value
+
+@lru_cache(maxsize=256)
+def compile_projection(fields: tuple):
+    """Build a function picking only the given fields from a record.
+
+    Fields are top-level names or parent.child paths into nested dicts. Cached per
+    field set, so a request only parses its fields= string.
+    """
+    top = tuple(f for f in fields if '.' not in f)
+    nested = {}
+    for path in fields:
+        if '.' in path:
+            parent, child = path.split('.', 1)
+            if parent not in top:
+                nested.setdefault(parent, []).append(child)
+    nested = tuple((parent, tuple(children)) for parent, children in nested.items())
+
+    def project(record) -> dict:
+        doc = {}
+        for name in top:
+            value = record.get(name, _MISSING)
+            if value is not _MISSING:
+                doc[name] = _plain(value)
+        for parent, children in nested:
+            value = record.get(parent)
+            if isinstance(value, dict):
+                doc[parent] = {child: value[child] for child in children if child in value}
+        return doc
+    return project
+
+def parse_fields(fields: Optional[str]):
+    """Projection for a fields=a,b,c.d query parameter (id is always kept); None for full records"""
+    if not fields:
+        return None
+    names = {name.strip() for name in fields.split(',') if name.strip()}
+    if not names:
+        return None
+    names.add('id')
+    return compile_projection(tuple(sorted(names)))
+
+ORDER_INCLUDES = {'shipping', 'returns'}
+
+def parse_includes(include: Optional[str]) -> set:
+    """Validate an include=shipping,returns query parameter"""
+    includes = {part.strip() for part in include.split(',') if part.strip()} if include else set()
+    unknown = includes - ORDER_INCLUDES
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown include: {', '.join(sorted(unknown))}"
+        )
+    return includes
+
+def orders_with_includes(orders, includes: set, project=None) -> List[dict]:
+    """Serialize (or project) orders, joining shipping and returns through order_id indexes"""
+    shipping = get_field_index('shipping', 'order_id') if 'shipping' in includes else None
+    returns = get_field_index('returns', 'order_id', many=True) if 'returns' in includes else None
+    result = []
+    for order in orders:
+        doc = project(order) if project else order.to_dict()
+        if shipping is not None:
+            doc['shipping'] = shipping.get(order.get('id'))
+        if returns is not None:
+            doc['returns'] = returns.get(order.get('id'), [])
+        result.append(doc)
+    return result
+
+# ==================== Request Coalescing ====================
+
+SINGLE_FLIGHT = os.environ.get('SINGLE_FLIGHT', '1') == '1'
+
+class SingleFlight:
+    """Coalesce concurrent identical computations.
+
+    The first caller for a key starts the computation as its own task; callers
+    arriving while it runs await that task instead of repeating the work. The key
+    must include whatever versions the result depends on, so a request that
+    arrives after a write never shares a result computed before it.
+    """
+    def __init__(self):
+        self._inflight = {}
+        self.stats = {}  # name -> {"leaders": n, "coalesced": n}
+
+    async def do(self, name: str, key: tuple, compute):
+        stats = self.stats.get(name)
+        if stats is None:
+            stats = self.stats[name] = {"leaders": 0, "coalesced": 0}
+        task = self._inflight.get((name, key))
+        if task is None:
+            stats["leaders"] += 1
+            # A task of its own: a disconnecting first caller must not cancel everyone's result
+            task = asyncio.ensure_future(compute())
+            self._inflight[(name, key)] = task
+            task.add_done_callback(lambda _: self._inflight.pop((name, key), None))
+        else:
+            stats["coalesced"] += 1
+        return await asyncio.shield(task)
+
+single_flight = SingleFlight()
+
+def json_body(data) -> bytes:
+    """Serialize a response body the way JSONResponse does"""
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'), default=json_default).encode('utf-8')
+
+# ==================== Category Facets ====================
+
+class CategoryFacet:
+    """Counts and sorted prices of one category"""
+    __slots__ = ('prices', 'in_stock')
+
+    def __init__(self):
+        self.prices = []  # Sorted, so min/max are the ends and removals are bisects
+        self.in_stock = 0
+
+class FacetIndex:
+    """Per-category product counts, price ranges and in-stock counts.
+
+    Built once from products and variants, then kept current by the product and
+    variant handlers through update_facets(). A product counts as in stock when it
+    or any of its variants has stock.
+    """
+    def __init__(self, products: list, variants: list, versions: tuple):
+        self.versions = versions
+        self.categories = {}
+        self._products = {}  # product id -> (category, price, own stock)
+        self._variants = {}  # variant id -> (product id, stock)
+        self._variant_stock = {}  # product id -> total variant stock
+        for variant in variants:
+            self._add_variant(variant)
+        for product in products:
+            self._add_product(product)
+
+    def _in_stock(self, product_id: str, own_stock) -> bool:
+        return (own_stock or 0) > 0 or self._variant_stock.get(product_id, 0) > 0
+
+    def _add_product(self, product: dict):
+        product_id = product.get('id')
+        category = product.get('category')
+        if not category:
+            return
+        price = product.get('price') or 0.0
+        stock = product.get('stock', 0)
+        self._products[product_id] = (category, price, stock)
+        facet = self.categories.get(category)
+        if facet is None:
+            facet = self.categories[category] = CategoryFacet()
+        bisect.insort(facet.prices, price)
+        if self._in_stock(product_id, stock):
+            facet.in_stock += 1
+
+    def _remove_product(self, product_id: str):
+        entry = self._products.pop(product_id, None)
+        if entry is None:
+            return
+        category, price, stock = entry
+        facet = self.categories[category]
+        del facet.prices[bisect.bisect_left(facet.prices, price)]
+        if self._in_stock(product_id, stock):
+            facet.in_stock -= 1
+        if not facet.prices:
+            del self.categories[category]
+
+    def _add_variant(self, variant: dict):
+        product_id = variant.get('product_id')
+        stock = variant.get('stock', 0) or 0
+        self._variants[variant.get('id')] = (product_id, stock)
+        self._variant_stock[product_id] = self._variant_stock.get(product_id, 0) + stock
+
+    def _remove_variant(self, variant_id: str) -> Optional[str]:
+        entry = self._variants.pop(variant_id, None)
+        if entry is None:
+            return None
+        product_id, stock = entry
+        remaining = self._variant_stock.get(product_id, 0) - stock
+        if remaining:
+            self._variant_stock[product_id] = remaining
+        else:
+            self._variant_stock.pop(product_id, None)
+        return product_id
+
+    def _with_product_refreshed(self, product_id: str, change):
+        """Apply a variant change, re-evaluating the owning product's stock state"""
+        entry = self._products.get(product_id)
+        if entry is not None:
+            self._remove_product(product_id)
+        change()
+        if entry is not None:
+            category, price, stock = entry
+            self._add_product({'id': product_id, 'category': category, 'price': price, 'stock': stock})
+
+    def upsert_product(self, product: dict):
+        self._remove_product(product.get('id'))
+        self._add_product(product)
+
+    def remove_product(self, product_id: str):
+        self._remove_product(product_id)
+
+    def upsert_variant(self, variant: dict):
+        old_product_id = self._variants.get(variant.get('id'), (None, 0))[0]
+        if old_product_id is not None and old_product_id != variant.get('product_id'):
+            self._with_product_refreshed(old_product_id, lambda: self._remove_variant(variant.get('id')))
+        self._with_product_refreshed(
+            variant.get('product_id'),
+            lambda: (self._remove_variant(variant.get('id')), self._add_variant(variant))
+        )
+
+    def remove_variant(self, variant_id: str):
+        product_id = self._variants.get(variant_id, (None, 0))[0]
+        if product_id is not None:
+            self._with_product_refreshed(product_id, lambda: self._remove_variant(variant_id))
+
+    def category_names(self) -> List[str]:
+        return sorted(self.categories)
+
+    def to_dict(self) -> dict:
+        categories = []
+        all_min, all_max, total, in_stock = None, None, 0, 0
+        for name in sorted(self.categories):
+            facet = self.categories[name]
+            low, high = facet.prices[0], facet.prices[-1]
+            categories.append({
+                "name": name,
+                "product_count": len(facet.prices),
+                "in_stock_count": facet.in_stock,
+                "min_price": low,
+                "max_price": high
+            })
+            total += len(facet.prices)
+            in_stock += facet.in_stock
+            all_min = low if all_min is None else min(all_min, low)
+            all_max = high if all_max is None else max(all_max, high)
+        return {
+            "categories": categories,
+            "total_products": total,
+            "in_stock_count": in_stock,
+            "price_range": {"min": all_min, "max": all_max}
+        }
+
+_facet_index = None
+
+def _facet_versions() -> tuple:
+    return (database.versions['products'], database.versions['variants'])
+
+def get_facet_index() -> FacetIndex:
+    """Get the facet index, rebuilding it if it missed a change"""
+    global _facet_index
+    products, variants = database.products, database.variants  # May load and bump versions
+    if _facet_index is None or _facet_index.versions != _facet_versions():
+        _facet_index = FacetIndex(products, variants, _facet_versions())
+    return _facet_index
+
+def update_facets(change):
+    """Apply an incremental facet change right after the save that persisted it.
+
+    The index must have been current before that single save; otherwise it missed
+    a change and is dropped to be rebuilt on the next read.
+    """
+    global _facet_index
+    index = _facet_index
+    if index is None:
+        return
+    current = _facet_versions()
+    if sum(c - e for c, e in zip(current, index.versions)) != 1:
+        _facet_index = None
+        return
+    change(index)
+    index.versions = current
+
+# ==================== Admin Analytics ====================
+
+# Order statuses whose amounts count as revenue
+REVENUE_STATUSES = {"paid", "processing", "shipped", "delivered"}
+
+class AnalyticsIndex:
+    """Incrementally maintained order and return aggregates for the admin dashboard.
+
+    Built once from orders and returns, then kept current by the order, payment
+    and return handlers through update_analytics(), so reads never scan orders.
+    """
+    COUNTERS = ('order_status', 'revenue_by_day', 'units_sold', 'product_revenue', 'return_status', 'returned_orders')
+
+    def __init__(self, orders: list, returns: list, versions: tuple, archived: Optional[dict] = None,
+                 archived_ids: Optional[dict] = None):
+        self.versions = versions
+        self.order_status = Counter()
+        self.revenue_by_day = Counter()
+        self.units_sold = Counter()
+        self.product_revenue = Counter()
+        self.revenue = 0.0
+        self.return_status = Counter()
+        self.returned_orders = Counter()  # order id -> return requests
+        if archived:
+            # Aggregates of archived orders and returns, which are no longer in memory
+            for name in self.COUNTERS:
+                getattr(self, name).update(archived.get(name, {}))
+            self.revenue = archived.get('revenue', 0.0)
+        # Records still hot after an interrupted archive run are already in the archived stats
+        skip_orders, skip_returns = (archived_ids or {}).get('orders', ()), (archived_ids or {}).get('returns', ())
+        for order in orders:
+            if order.get('id') not in skip_orders:
+                self.add_order(order)
+        for return_req in returns:
+            if return_req.get('id') not in skip_returns:
+                self.add_return(return_req)
+
+    def _apply_revenue(self, order, sign: int):
+        amount = order.get('total_amount', 0) or 0
+        self.revenue += sign * amount
+        self.revenue_by_day[(order.get('created_at') or '')[:10]] += sign * amount
+        for item in order.get('items', []):
+            quantity = item['quantity']
+            self.units_sold[item['product_id']] += sign * quantity
+            self.product_revenue[item['product_id']] += sign * item['price'] * quantity
+
+    def add_order(self, order):
+        self.order_status[order.get('status')] += 1
+        if order.get('status') in REVENUE_STATUSES:
+            self._apply_revenue(order, 1)
+
+    def order_status_changed(self, order, old_status: str):
+        new_status = order.get('status')
+        self.order_status[old_status] -= 1
+        self.order_status[new_status] += 1
+        was_revenue, is_revenue = old_status in REVENUE_STATUSES, new_status in REVENUE_STATUSES
+        if was_revenue != is_revenue:
+            self._apply_revenue(order, 1 if is_revenue else -1)
+
+    def add_return(self, return_req: dict):
+        self.return_status[return_req.get('status')] += 1
+        self.returned_orders[return_req.get('order_id')] += 1
+
+    def return_status_changed(self, return_req: dict, old_status: str):
+        self.return_status[old_status] -= 1
+        self.return_status[return_req.get('status')] += 1
+
+    def state(self) -> dict:
+        """Raw aggregates, as persisted for archived records"""
+        state = {name: dict(getattr(self, name)) for name in self.COUNTERS}
+        state['revenue'] = self.revenue
+        return state
+
+    def to_dict(self, days: int = 30, top: int = 10) -> dict:
+        delivered = self.order_status.get('delivered', 0)
+        recent_days = heapq.nlargest(days, (d for d, v in self.revenue_by_day.items() if d and v))
+        top_products = heapq.nlargest(top, ((u, p) for p, u in self.units_sold.items() if u > 0))
+        return {
+            "revenue": round(self.revenue, 2),
+            "orders_by_status": {k: v for k, v in self.order_status.items() if v},
+            "revenue_by_day": [
+                {"date": day, "revenue": round(self.revenue_by_day[day], 2)} for day in sorted(recent_days)
+            ],
+            "top_products": [
+                {"product_id": product_id, "units_sold": units,
+                 "revenue": round(self.product_revenue[product_id], 2)}
+                for units, product_id in top_products
+            ],
+            "returns_by_status": {k: v for k, v in self.return_status.items() if v},
+            "return_rate": round(len(self.returned_orders) / delivered, 4) if delivered else 0.0
+        }
+
+_analytics_index = None
+
+def _analytics_versions() -> tuple:
+    return (database.versions['orders'], database.versions['returns'])
+
+def get_analytics_index() -> AnalyticsIndex:
+    """Get the analytics aggregates, rebuilding them if they missed a change"""
+    global _analytics_index
+    orders, returns = database.orders, database.returns  # May load and bump versions
+    if _analytics_index is None or _analytics_index.versions != _analytics_versions():
+        _analytics_index = AnalyticsIndex(
+            orders, returns, _analytics_versions(), order_archive.stats, order_archive.ids()
+        )
+    return _analytics_index
+
+def update_analytics(change):
+    """Apply an incremental analytics change right after the save that persisted it"""
+    global _analytics_index
+    index = _analytics_index
+    if index is None:
+        return
+    current = _analytics_versions()
+    if sum(c - e for c, e in zip(current, index.versions)) != 1:
+        _analytics_index = None  # Missed a change, rebuilt on next read
+        return
+    change(index)
+    index.versions = current
+
+# ==================== Search Suggestions ====================
+
+SUGGEST_TOP_K = int(os.environ.get('SUGGEST_TOP_K', '10'))  # Suggestions kept per prefix
+SUGGEST_MAX_PREFIX = int(os.environ.get('SUGGEST_MAX_PREFIX', '20'))  # Longer queries match on this many chars
+# Popularity comes from order history; the trie is rebuilt in the background this often
+SUGGEST_POPULARITY_TTL = float(os.environ.get('SUGGEST_POPULARITY_TTL', '300'))
+
+# Türkçe: I/İ both fold to i, and ç ğ ı ö ş ü to their ASCII letters, so "ayakkabi",
+# "AYAKKABI" and "Ayakkabı" all match
+_TURKISH_FOLD = str.maketrans({'I': 'i', 'İ': 'i', 'ı': 'i', 'ç': 'c', 'ğ': 'g', 'ö': 'o', 'ş': 's', 'ü': 'u'})
+
+def fold_text(text: str) -> str:
+    """Turkish-aware case and accent folding for suggestion matching"""
+    return ' '.join(text.translate(_TURKISH_FOLD).lower().translate(_TURKISH_FOLD).split())
+
+class SuggestNode:
+    __slots__ = ('children', 'terminal', 'top')
+
+    def __init__(self):
+        self.children = {}
+        self.terminal = set()  # Entries whose key ends (or is cut off) here
+        self.top = []  # Best SUGGEST_TOP_K entries in this subtree, best first
+
+class SuggestIndex:
+    """Prefix trie over product names and categories, ranked by units sold.
+
+    Every word start of a name is a key ("Siyah Deri Bot" is found by "deri b"),
+    and every node caches the best entries of its subtree, so a lookup walks
+    the query's characters and returns that node's list. Product edits update
+    only the paths of that product's keys.
+    """
+    def __init__(self, products, units_sold: Counter, versions: tuple):
+        self.versions = versions
+        self.units_sold = units_sold
+        self.root = SuggestNode()
+        self.entries = {}  # entry id -> (text, kind, product_id)
+        self.scores = {}  # entry id -> popularity
+        self.products = {}  # product id -> (name, category)
+        self.categories = Counter()  # category -> product count
+        self.category_units = Counter()  # category -> units sold across its products
+        for product in products:
+            self._add_product(product)
+        for category in self.categories:
+            self._refresh_category(category)
+
+    @staticmethod
+    def _keys(text: str) -> set:
+        words = fold_text(text).split(' ')
+        return {' '.join(words[i:])[:SUGGEST_MAX_PREFIX] for i in range(len(words)) if words[i]}
+
+    def _rank(self, entry_id: str) -> tuple:
+        # Entry id breaks ties, so equal names rank the same however the trie was built
+        return (-self.scores[entry_id], self.entries[entry_id][0], entry_id)
+
+    def _insert(self, entry_id: str, text: str, kind: str, product_id: Optional[str], score: float):
+        self.entries[entry_id] = (text, kind, product_id)
+        self.scores[entry_id] = score
+        rank = self._rank(entry_id)
+        for key in self._keys(text):
+            node = self.root
+            for char in key:
+                node = node.children.setdefault(char, SuggestNode())
+                top = node.top
+                if entry_id not in top and (len(top) < SUGGEST_TOP_K or rank < self._rank(top[-1])):
+                    bisect.insort(top, entry_id, key=self._rank)
+                    del top[SUGGEST_TOP_K:]
+            node.terminal.add(entry_id)
+
+    def _delete(self, entry_id: str):
+        paths = []
+        for key in self._keys(self.entries[entry_id][0]):
+            path = [self.root]
+            for char in key:
+                path.append(path[-1].children[char])
+            path[-1].terminal.discard(entry_id)
+            paths.append((key, path))
+        # Refill the cached lists bottom-up from children, pruning emptied nodes
+        for key, path in paths:
+            for depth in range(len(path) - 1, 0, -1):
+                node = path[depth]
+                if entry_id not in node.top and node.children:
+                    continue
+                candidates = set(node.terminal)
+                for child in node.children.values():
+                    candidates.update(child.top)
+                candidates.discard(entry_id)
+                node.top = sorted(candidates, key=self._rank)[:SUGGEST_TOP_K]
+                if not node.top and not node.children:
+                    path[depth - 1].children.pop(key[depth - 1], None)
+        del self.entries[entry_id]
+        del self.scores[entry_id]
+
+    def _refresh_category(self, category: Optional[str]):
+        if not category:
+            return
+        entry_id = f"c:{category}"
+        if entry_id in self.entries:
+            self._delete(entry_id)
+        if self.categories[category] > 0:
+            self._insert(entry_id, category, 'category', None, self.category_units[category])
+
+    def _add_product(self, product: dict):
+        product_id, name, category = product.get('id'), product.get('name') or '', product.get('category')
+        self.products[product_id] = (name, category)
+        if name:
+            self._insert(f"p:{product_id}", name, 'product', product_id, self.units_sold.get(product_id, 0))
+        if category:
+            self.categories[category] += 1
+            self.category_units[category] += self.units_sold.get(product_id, 0)
+
+    def _remove_product(self, product_id: str) -> Optional[str]:
+        old = self.products.pop(product_id, None)
+        if old is None:
+            return None
+        if f"p:{product_id}" in self.entries:
+            self._delete(f"p:{product_id}")
+        category = old[1]
+        if category:
+            self.categories[category] -= 1
+            self.category_units[category] -= self.units_sold.get(product_id, 0)
+        return category
+
+    def upsert_product(self, product: dict):
+        old_category = self._remove_product(product.get('id'))
+        self._add_product(product)
+        for category in {old_category, product.get('category')}:
+            self._refresh_category(category)
+
+    def remove_product(self, product_id: str):
+        self._refresh_category(self._remove_product(product_id))
+
+    def suggest(self, query: str, limit: int) -> list:
+        node = self.root
+        for char in fold_text(query)[:SUGGEST_MAX_PREFIX]:
+            node = node.children.get(char)
+            if node is None:
+                return []
+        suggestions = []
+        for entry_id in node.top[:limit]:
+            text, kind, product_id = self.entries[entry_id]
+            suggestion = {"text": text, "type": kind}
+            if product_id is not None:
+                suggestion["product_id"] = product_id
+            suggestions.append(suggestion)
+        return suggestions
+
+_suggest_index = None
+_suggest_stale = None  # asyncio.Event set when the served trie missed a catalog change
+
+def _suggest_versions() -> tuple:
+    return (database.versions['products'],)
+
+def get_suggest_index() -> Optional[SuggestIndex]:
+    """Get the suggestion trie built by suggest_refresher; None until the first build.
+
+    Never builds on the request path: a trie that missed a catalog change keeps
+    serving until the background rebuild swaps in its replacement.
+    """
+    index = _suggest_index
+    if (index is None or index.versions != _suggest_versions()) and _suggest_stale is not None:
+        _suggest_stale.set()
+    return index
+
+def update_suggestions(change):
+    """Apply an incremental catalog change right after the products save"""
+    index = _suggest_index
+    if index is None:
+        return
+    current = _suggest_versions()
+    if sum(c - e for c, e in zip(current, index.versions)) != 1:
+        if _suggest_stale is not None:
+            _suggest_stale.set()  # Missed a change, keep serving until the rebuild swaps
+        return
+    change(index)
+    index.versions = current
+
+async def units_sold_snapshot() -> Counter:
+    """Units sold per product, without scanning orders on the event loop"""
+    global _analytics_index
+    await run_in_threadpool(database.preload, 'orders', 'returns')
+    index = _analytics_index
+    if index is None or index.versions != _analytics_versions():
+        orders, returns = database.snapshot('orders'), database.snapshot('returns')
+        index = await run_in_threadpool(
+            AnalyticsIndex, orders.records, returns.records, (orders.version, returns.version),
+            dict(order_archive.stats), order_archive.ids()
+        )
+        if index.versions == _analytics_versions():
+            _analytics_index = index  # Still current, so the dashboard can use it too
+    return Counter(index.units_sold)
+
+async def rebuild_suggestions() -> bool:
+    """Build a fresh suggestion trie off the event loop and swap it in; False if the catalog moved meanwhile"""
+    global _suggest_index
+    units_sold = await units_sold_snapshot()
+    await run_in_threadpool(database.preload, 'products')
+    products = database.snapshot('products')
+    index = await run_in_threadpool(SuggestIndex, products.records, units_sold, (products.version,))
+    if index.versions != _suggest_versions():
+        return False  # Built from an old catalog; try again
+    _suggest_index = index
+    return True
+
+async def suggest_refresher():
+    """Keep the suggestion trie built, rebuilding when it goes stale and refreshing popularity"""
+    global _suggest_stale
+    _suggest_stale = asyncio.Event()
+    while True:
+        _suggest_stale.clear()
+        try:
+            rebuilt = await rebuild_suggestions()
+        except Exception as e:
+            logger.error(f"Suggestion index rebuild failed: {e}")
+            rebuilt = False
+        if not rebuilt:
+            await asyncio.sleep(1)
+            continue
+        try:
+            await asyncio.wait_for(_suggest_stale.wait(), SUGGEST_POPULARITY_TTL)
+        except asyncio.TimeoutError:
+            pass
+
+# ==================== Order Archive ====================
+
+# Delivered/cancelled orders and closed returns older than this move to the archive (0 disables)
+ARCHIVE_AFTER_DAYS = float(os.environ.get('ARCHIVE_AFTER_DAYS', '180'))
+ARCHIVE_INTERVAL = float(os.environ.get('ARCHIVE_INTERVAL', '86400'))
+ARCHIVE_BLOCK_ROWS = int(os.environ.get('ARCHIVE_BLOCK_ROWS', '256'))
+ARCHIVE_DIR = DATA_DIR / 'archive'
+
+# collection -> statuses that never change again
+ARCHIVE_STATUSES = {
+    'orders': {'delivered', 'cancelled'},
+    'returns': {'processed', 'rejected'},
+}
+
+@lru_cache(maxsize=64)
+def _read_archive_block(path: str, offset: int, length: int) -> tuple:
+    """Decompress one gzip member of a segment file into its records"""
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        data = gzip.decompress(f.read(length))
+    return tuple(json.loads(line) for line in data.splitlines() if line)
+
+class OrderArchive:
+    """Cold tier for old orders and returns.
+
+    Records are appended to month-partitioned segment files
+    (orders-2025-01.ndjson.gz) in gzip members of up to ARCHIVE_BLOCK_ROWS
+    records. index.json maps each record id to its block and created_at, so a
+    lookup decompresses one block and date-range exports read only the blocks
+    they need. The index also keeps the analytics aggregates of everything
+    archived, so admin stats still cover it.
+    """
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self.index_path = directory / 'index.json'
+        self._index = None
+        self._lock = Lock()
+
+    @property
+    def index(self) -> dict:
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    index = {'orders': {}, 'returns': {}, 'stats': {}}
+                    if self.index_path.exists():
+                        try:
+                            index.update(json.loads(self.index_path.read_bytes()))
+                        except Exception as e:
+                            logger.warning(f"Error loading archive index: {e}")
+                    self._index = index
+        return self._index
+
+    @property
+    def stats(self) -> dict:
+        # Skip the index file entirely until something has been archived
+        return self.index['stats'] if self._index is not None or self.index_path.exists() else {}
+
+    def count(self, collection: str) -> int:
+        return len(self.index[collection])
+
+    def append(self, collection: str, records: list) -> int:
+        """Write records to their month segments and index them; returns bytes written.
+
+        Ids already in the index are skipped, so re-archiving records left in the
+        hot tier by an interrupted run neither duplicates them nor their stats.
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        index = self.index  # Loads under the lock itself
+        with self._lock:
+            entries = index[collection]
+            by_month, new = {}, {}
+            for record in records:
+                if record['id'] in entries or record['id'] in new:
+                    continue
+                new[record['id']] = record
+                by_month.setdefault((record.get('created_at') or '')[:7] or 'undated', []).append(record)
+            written = 0
+            for month, month_records in sorted(by_month.items()):
+                segment = f"{collection}-{month}.ndjson.gz"
+                with open(self.directory / segment, 'ab') as f:
+                    for start in range(0, len(month_records), ARCHIVE_BLOCK_ROWS):
+                        block = month_records[start:start + ARCHIVE_BLOCK_ROWS]
+                        payload = gzip.compress(''.join(
+                            json.dumps(r, ensure_ascii=False, default=json_default) + '\n' for r in block
+                        ).encode('utf-8'))
+                        offset = f.tell()
+                        f.write(payload)
+                        for r in block:
+                            entries[r['id']] = [segment, offset, len(payload), r.get('created_at') or '']
+                        written += len(payload)
+            if new:
+                self._apply_stats(collection, list(new.values()), 1)
+                self._save_index()
+            return written
+
+    def discard(self, collection: str, records: list):
+        """Unindex archived records that went back to the hot tier, and take them out of the stats"""
+        index = self.index
+        with self._lock:
+            entries = index[collection]
+            records = [r for r in records if entries.pop(r['id'], None) is not None]
+            if records:
+                self._apply_stats(collection, records, -1)
+                self._save_index()
+
+    def ids(self) -> dict:
+        """collection -> ids of its archived records"""
+        if self._index is None and not self.index_path.exists():
+            return {}
+        index = self.index
+        with self._lock:
+            return {collection: set(index[collection]) for collection in ARCHIVE_STATUSES}
+
+    def _apply_stats(self, collection: str, records: list, sign: int):
+        delta = AnalyticsIndex(
+            records if collection == 'orders' else [], records if collection == 'returns' else [], ()
+        ).state()
+        stats = self.index['stats']
+        for name in AnalyticsIndex.COUNTERS:
+            counter = Counter(stats.get(name, {}))
+            for key, value in delta[name].items():
+                counter[key] += sign * value
+            stats[name] = dict(counter)
+        stats['revenue'] = stats.get('revenue', 0.0) + sign * delta['revenue']
+
+    def _save_index(self):
+        # Write then rename, so a crash never leaves a truncated index
+        tmp = self.index_path.with_suffix('.tmp')
+        tmp.write_bytes(json.dumps(self.index, separators=(',', ':')).encode('utf-8'))
+        tmp.replace(self.index_path)
+        if database.change_feed is not None:
+            database.change_feed.append('archive')
+
+    def get(self, collection: str, record_id: str) -> Optional[dict]:
+        entry = self.index[collection].get(record_id)
+        if entry is None:
+            return None
+        segment, offset, length, _ = entry
+        block = _read_archive_block(str(self.directory / segment), offset, length)
+        return next((dict(r) for r in block if r.get('id') == record_id), None)
+
+    def blocks(self, collection: str, start: Optional[str] = None, end: Optional[str] = None) -> tuple:
+        """Blocks holding records created within [start, end], and how many such records"""
+        blocks, total = {}, 0
+        end = end + '\uffff' if end else None  # A date-only end covers that whole day
+        index = self.index
+        with self._lock:  # append() may be indexing in another thread
+            for segment, offset, length, created_at in index[collection].values():
+                if (start and created_at < start) or (end and created_at > end):
+                    continue
+                blocks[(segment, offset, length)] = None
+                total += 1
+        return sorted(blocks), total
+
+    def read_block(self, block: tuple) -> tuple:
+        segment, offset, length = block
+        return _read_archive_block(str(self.directory / segment), offset, length)
+
+order_archive = OrderArchive(ARCHIVE_DIR)
+archive_stats = {"runs": 0, "orders": 0, "returns": 0, "bytes": 0, "last_duration": 0.0}
+
+async def archive_old_records(now: Optional[datetime] = None) -> dict:
+    """Move closed orders and returns older than ARCHIVE_AFTER_DAYS to the archive"""
+    global _analytics_index
+    if ARCHIVE_AFTER_DAYS <= 0:
+        return {}
+    started = time.perf_counter()
+    now = now or datetime.now(timezone.utc)
+    cutoff = (now - timedelta(days=ARCHIVE_AFTER_DAYS)).isoformat()
+    await run_in_threadpool(database.preload, 'orders', 'returns')
+    moved = {}
+    for collection, statuses in ARCHIVE_STATUSES.items():
+        records = getattr(database, collection)
+        old = [r for r in records if r.get('status') in statuses and (r.get('created_at') or '') < cutoff]
+        moved[collection] = len(old)
+        if not old:
+            continue
+        payloads = {r['id']: r.to_dict() if isinstance(r, Record) else r for r in old}
+        archive_stats["bytes"] += await run_in_threadpool(order_archive.append, collection, list(payloads.values()))
+        # Only drop the exact objects archived: a record replaced during the write
+        # (see replace_record) stays hot, and its stale archived copy is unindexed
+        archived = {r['id']: r for r in old}
+        kept = [r for r in records if archived.get(r.get('id')) is not r]
+        removed = {r['id'] for r in records if archived.get(r.get('id')) is r}
+        changed = [payloads[record_id] for record_id in archived if record_id not in removed]
+        # In place, so handlers holding the list keep seeing the hot tier
+        records[:] = kept
+        if changed:
+            await run_in_threadpool(order_archive.discard, collection, changed)
+        await database.persist(collection)
+        moved[collection] = len(removed)
+        archive_stats[collection] += len(removed)
+    if any(moved.values()):
+        _analytics_index = None  # Archived aggregates moved; rebuild on next read
+        logger.info(f"Archived {moved['orders']} orders and {moved['returns']} returns older than {cutoff[:10]}")
+    archive_stats["runs"] += 1
+    archive_stats["last_duration"] = time.perf_counter() - started
+    return moved
+
+async def order_archiver():
+    """Periodically archive old orders and returns"""
+    while True:
+        await asyncio.sleep(ARCHIVE_INTERVAL)
+        try:
+            await archive_old_records()
+        except Exception as e:
+            logger.error(f"Order archiving failed: {e}")
+
+# ==================== Cart Engine ====================
+
+# One lock per user with an active cart request; dropped once no request holds it
+_cart_locks = weakref.WeakValueDictionary()
+
+def cart_lock(user_id: str) -> asyncio.Lock:
+    """Serialize cart changes of one user (double clicks, several tabs)"""
+    lock = _cart_locks.get(user_id)
+    if lock is None:
+        lock = _cart_locks[user_id] = asyncio.Lock()
+    return lock
+
+def unit_price(product_id: str, variant_id: Optional[str] = None) -> Optional[float]:
+    """Current catalog price of a product or variant; None if it does not exist"""
+    product = find_product(product_id)
+    if product is None:
+        return None
+    price = product.get('price', 0.0)
+    if variant_id is not None:
+        variant = find_variant(variant_id)
+        if variant is None or variant.get('product_id') != product_id:
+            return None
+        price += variant.get('price_adjustment', 0.0) or 0.0
+    return price
+
+def price_cart(cart: CartRecord) -> float:
+    """Refresh line prices from the catalog and return the total.
+
+    Cached until the cart, products or variants change. Lines whose product is
+    gone keep their last known price.
+    """
+    key = (database.versions['products'], database.versions['variants'], cart._revision)
+    if cart._total_key != key:
+        total = 0.0
+        for line in cart.items.values():
+            price = unit_price(line.product_id, line.key[1])
+            if price is not None:
+                line.price = price
+            total += line.price * line.quantity
+        cart._total = round(total, 2)
+        # Versions read after the lookups, which may have loaded products or variants
+        cart._total_key = (database.versions['products'], database.versions['variants'], cart._revision)
+    return cart._total
+
+def cart_response(cart: CartRecord) -> dict:
+    total = price_cart(cart)
+    return {**cart.to_dict(), 'total': total}
+
+# ==================== Cart Expiration ====================
+
+# Carts idle for longer than this are archived and evicted (0 disables expiry)
+CART_TTL = float(os.environ.get('CART_TTL_SECONDS', str(30 * 86400)))
+CART_SWEEP_INTERVAL = float(os.environ.get('CART_SWEEP_INTERVAL', '3600'))
+CART_SWEEP_BATCH = int(os.environ.get('CART_SWEEP_BATCH', '500'))
+CART_ARCHIVE_DIR = DATA_DIR / 'cart_archive'
+
+cart_sweep_stats = {"runs": 0, "evicted": 0, "archived_bytes": 0, "last_duration": 0.0}
+
+def _cart_updated_at(cart: CartRecord) -> Optional[datetime]:
+    try:
+        updated_at = datetime.fromisoformat(cart.get('updated_at'))
+    except (TypeError, ValueError):
+        return None
+    return updated_at if updated_at.tzinfo else updated_at.replace(tzinfo=timezone.utc)
+
+def _is_stale(cart: CartRecord, cutoff: datetime) -> bool:
+    updated_at = _cart_updated_at(cart)
+    return updated_at is None or updated_at < cutoff  # Unparseable timestamps count as stale
+
+def archive_carts(carts: List[CartRecord], now: datetime) -> int:
+    """Append carts to this month's gzip NDJSON archive; returns bytes written"""
+    CART_ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
+    archived_at = now.isoformat()
+    payload = ''.join(
+        json.dumps({**cart.to_dict(), 'archived_at': archived_at}, ensure_ascii=False, default=json_default) + '\n'
+        for cart in carts
+    ).encode('utf-8')
+    compressed = gzip.compress(payload)
+    # Appended gzip members form one valid gzip stream
+    with open(CART_ARCHIVE_DIR / f"carts-{now:%Y-%m}.ndjson.gz", 'ab') as f:
+        f.write(compressed)
+    return len(compressed)
+
+async def sweep_carts(now: Optional[datetime] = None) -> int:
+    """Archive and evict carts idle for longer than CART_TTL, in batches; returns how many"""
+    if CART_TTL <= 0 or database.read_only:
+        return 0
+    started = time.perf_counter()
+    now = now or datetime.now(timezone.utc)
+    cutoff = now - timedelta(seconds=CART_TTL)
+    await run_in_threadpool(database.preload, 'carts')
+    if CARTS_FILE.exists():
+        await run_in_threadpool(database.save_carts)  # Per-user files first, so eviction can delete them
+    stale = [user_id for user_id, cart in database.carts.items() if _is_stale(cart, cutoff)]
+    evicted = 0
+    for offset in range(0, len(stale), CART_SWEEP_BATCH):
+        batch = []
+        for user_id in stale[offset:offset + CART_SWEEP_BATCH]:
+            lock = _cart_locks.get(user_id)
+            cart = database.carts.get(user_id)
+            # Skip carts being changed right now or touched since the scan
+            if (lock is not None and lock.locked()) or cart is None or not _is_stale(cart, cutoff):
+                continue
+            batch.append(database.carts.pop(user_id))
+        if not batch:
+            continue
+        try:
+            cart_sweep_stats["archived_bytes"] += await run_in_threadpool(archive_carts, batch, now)
+        except OSError as e:
+            logger.warning(f"Error archiving carts: {e}, evicting without archive")
+        for cart in batch:
+            # A cart recreated during the archive write owns the file now
+            if cart.user_id not in database.carts:
+                (CARTS_DIR / f"{cart.user_id}.json").unlink(missing_ok=True)
+                # Replicas drop the cart from memory like any other cart removal
+                if database.change_feed is not None:
+                    database.change_feed.append('carts', cart.user_id)
+        database.mark_changed('carts')
+        evicted += len(batch)
+        await asyncio.sleep(0)  # Let requests run between batches
+    cart_sweep_stats["runs"] += 1
+    cart_sweep_stats["evicted"] += evicted
+    cart_sweep_stats["last_duration"] = time.perf_counter() - started
+    if evicted:
+        logger.info(f"Cart sweep evicted {evicted} carts idle for more than {CART_TTL:.0f}s")
+    return evicted
+
+async def cart_sweeper():
+    """Periodically evict abandoned carts"""
+    while True:
+        await asyncio.sleep(CART_SWEEP_INTERVAL)
+        try:
+            await sweep_carts()
+        except Exception as e:
+            logger.error(f"Cart sweep failed: {e}")
+
 async def connect_to_mongo():
     """Initialize persistent database"""
     logger.info("Using persistent JSON database")
@@ -176,15 +2043,15 @@ async def connect_to_mongo():
     admin_exists = any(u.get('email') == 'admin@chenki.com' for u in database.users.values())
     if not admin_exists:
         admin_id = str(uuid.uuid4())
-        database.users[admin_id] = {
+        database.users[admin_id] = UserRecord.from_dict({
             "id": admin_id,
             "email": "admin@chenki.com",
             "name": "Admin",
-            "password_hash": get_password_hash("admin123"),
+            "password_hash": await get_password_hash_async("admin123"),
             "is_admin": True,
             "created_at": datetime.now(timezone.utc).isoformat()
-        }
-        database.save_users()
+        })
+        await database.persist('users')
         logger.info("Default admin user created: admin@chenki.com / admin123")
     else:
         logger.info("Admin user already exists")
@@ -214,7 +2081,7 @@ async def connect_to_mongo():
             }
         ]
         database.products = sample_products
-        database.save_products()
+        await database.persist('products')
         logger.info(f"Added {len(sample_products)} sample products")
     else:
         logger.info(f"Loaded {len(database.products)} existing products")
@@ -272,9 +2139,16 @@ class ProductCreate(BaseModel):
 
 class CartItem(BaseModel):
     product_id: str
+    variant_id: Optional[str] = None
     quantity: int
     price: float
 
+class CartItemCreate(BaseModel):
+    """Line added to a cart; the price always comes from the catalog"""
+    product_id: str
+    variant_id: Optional[str] = None
+    quantity: int
+
 class Cart(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -370,11 +2244,44 @@ class ReturnCreate(BaseModel):
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash"""
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_pwd_context().verify(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
     """Hash a password"""
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
+
+# bcrypt is CPU-bound and deliberately slow, so it runs in a small dedicated pool
+# instead of blocking the event loop
+BCRYPT_WORKERS = int(os.environ.get('BCRYPT_WORKERS', 2))
+bcrypt_executor = ThreadPoolExecutor(max_workers=BCRYPT_WORKERS, thread_name_prefix='bcrypt')
+bcrypt_pool_stats = {"queued": 0, "running": 0}
+bcrypt_stats_lock = Lock()
+
+def _update_bcrypt_stats(queued: int, running: int):
+    with bcrypt_stats_lock:
+        bcrypt_pool_stats["queued"] += queued
+        bcrypt_pool_stats["running"] += running
+
+async def _run_in_bcrypt_pool(func, *args):
+    """Run a bcrypt operation in the dedicated pool, tracking queue depth"""
+    _update_bcrypt_stats(1, 0)
+
+    def task():
+        _update_bcrypt_stats(-1, 1)
+        try:
+            return func(*args)
+        finally:
+            _update_bcrypt_stats(0, -1)
+
+    return await asyncio.get_running_loop().run_in_executor(bcrypt_executor, task)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Verify a password without blocking the event loop"""
+    return await _run_in_bcrypt_pool(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    """Hash a password without blocking the event loop"""
+    return await _run_in_bcrypt_pool(get_password_hash, password)
 
 def create_access_token(data: dict) -> str:
     """Create JWT access token"""
@@ -387,8 +2294,20 @@ async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security)
 ) -> dict:
     """Get current authenticated user"""
+    return user_from_token(credentials.credentials)
+
+def is_admin_authorization(authorization: str) -> bool:
+    """Whether an Authorization header carries a valid admin JWT"""
+    if not authorization.lower().startswith('bearer '):
+        return False
+    try:
+        return bool(user_from_token(authorization[7:]).get('is_admin'))
+    except HTTPException:
+        return False
+
+def user_from_token(token: str) -> dict:
+    """Resolve a JWT to its user record, or fail with 401"""
     try:
-        token = credentials.credentials
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id: str = payload.get("sub")
         if user_id is None:
@@ -402,12 +2321,8 @@ async def get_current_user(
             detail="Invalid authentication credentials"
         )
     
-    # Find user in in-memory database
-    user = None
-    for uid, u in database.users.items():
-        if u["id"] == user_id:
-            user = u.copy()
-            break
+    # Users are keyed by id; handlers only read the record, so no copy is needed
+    user = database.users.get(user_id)
     
     if user is None:
         raise HTTPException(
@@ -427,12 +2342,486 @@ async def get_admin_user(
         )
     return current_user
 
+# ==================== Rate Limiting ====================
+
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', '1') == '1'
+RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND', 'memory')  # memory, sqlite
+RATE_LIMIT_SQLITE_PATH = os.environ.get('RATE_LIMIT_SQLITE_PATH', str(DATA_DIR / 'ratelimit.sqlite3'))
+RATE_LIMIT_MAX_KEYS = int(os.environ.get('RATE_LIMIT_MAX_KEYS', '100000'))
+# Behind Vercel's proxy the client address is the first X-Forwarded-For hop
+TRUST_FORWARDED_FOR = os.environ.get('TRUST_FORWARDED_FOR', '1' if IS_VERCEL else '0') == '1'
+
+def _parse_budget(name: str, default: str) -> tuple:
+    """RATE_LIMIT_<NAME>=requests/seconds, e.g. 10/60; returns (capacity, refill per second)"""
+    count, seconds = os.environ.get(f'RATE_LIMIT_{name.upper()}', default).split('/')
+    return int(count), int(count) / float(seconds)
+
+# Budget name -> (bucket capacity, tokens refilled per second)
+RATE_LIMITS = {
+    'login': _parse_budget('login', '10/60'),  # Per IP; every attempt costs a bcrypt verify
+    'register': _parse_budget('register', '5/600'),  # Per IP; bcrypt hash plus a new user
+    'tracking': _parse_budget('tracking', '60/60'),  # Per IP; public endpoint
+    'writes': _parse_budget('writes', '120/60'),  # Per user; cart, order, payment and return writes
+}
+
+class MemoryBucketStore:
+    """Token buckets in an LRU-ordered dict, bounded to max_keys.
+
+    Evicting the least recently used bucket is safe: an idle bucket has refilled
+    and a new one starts full. The limiter dependencies run in the threadpool,
+    so every take holds the lock: the LRU order and the bucket update change together.
+    """
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self.buckets = OrderedDict()  # key -> [tokens, updated]
+        self._lock = Lock()
+
+    def take(self, key: str, capacity: int, rate: float, cost: float = 1.0) -> tuple:
+        """Take cost tokens; returns (allowed, tokens left, seconds until allowed)"""
+        with self._lock:
+            now = time.monotonic()
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = self.buckets[key] = [float(capacity), now]
+                if len(self.buckets) > self.max_keys:
+                    self.buckets.popitem(last=False)
+            else:
+                self.buckets.move_to_end(key)
+                bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * rate)
+                bucket[1] = now
+            if bucket[0] >= cost:
+                bucket[0] -= cost
+                return True, bucket[0], 0.0
+            return False, bucket[0], (cost - bucket[0]) / rate
+
+    def __len__(self):
+        return len(self.buckets)
+
+class SQLiteBucketStore:
+    """Token buckets in a SQLite file shared by every worker on the host"""
+    def __init__(self, path: str, max_keys: int):
+        self.path = path
+        self.max_keys = max_keys
+        self._local = threading.local()
+        self._writes = 0
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL, updated REAL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS buckets_updated ON buckets (updated)')
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def take(self, key: str, capacity: int, rate: float, cost: float = 1.0) -> tuple:
+        now = time.time()  # Wall clock: shared between processes
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT tokens, updated FROM buckets WHERE key = ?', (key,)).fetchone()
+            tokens = float(capacity) if row is None else min(capacity, row[0] + (now - row[1]) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            conn.execute('INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)', (key, tokens, now))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        self._writes += 1
+        if self._writes % 1000 == 0:
+            self.prune()
+        return allowed, tokens, 0.0 if allowed else (cost - tokens) / rate
+
+    def prune(self):
+        """Drop the least recently used buckets beyond max_keys"""
+        conn = self._connect()
+        conn.execute(
+            'DELETE FROM buckets WHERE key IN (SELECT key FROM buckets ORDER BY updated DESC LIMIT -1 OFFSET ?)',
+            (self.max_keys,)
+        )
+
+    def __len__(self):
+        return self._connect().execute('SELECT COUNT(*) FROM buckets').fetchone()[0]
+
+def create_bucket_store():
+    if RATE_LIMIT_BACKEND == 'sqlite':
+        return SQLiteBucketStore(RATE_LIMIT_SQLITE_PATH, RATE_LIMIT_MAX_KEYS)
+    return MemoryBucketStore(RATE_LIMIT_MAX_KEYS)
+
+bucket_store = create_bucket_store()
+rate_limited_counts = {}  # budget -> requests rejected
+
+def client_ip(request: Request) -> str:
+    if TRUST_FORWARDED_FOR:
+        forwarded = request.headers.get('x-forwarded-for')
+        if forwarded:
+            return forwarded.split(',')[0].strip()
+    return request.client.host if request.client else 'unknown'
+
+def check_rate_limit(budget: str, identity: str, response: Response):
+    """Take a token from the budget's bucket for identity, or fail with 429"""
+    if not RATE_LIMIT_ENABLED:
+        return
+    capacity, rate = RATE_LIMITS[budget]
+    allowed, remaining, retry_after = bucket_store.take(f"{budget}:{identity}", capacity, rate)
+    if not allowed:
+        rate_limited_counts[budget] = rate_limited_counts.get(budget, 0) + 1
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many requests, please try again later",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after))), "X-RateLimit-Limit": str(capacity)}
+        )
+    response.headers["X-RateLimit-Limit"] = str(capacity)
+    response.headers["X-RateLimit-Remaining"] = str(int(remaining))
+
+def rate_limit_ip(budget: str):
+    """Dependency limiting a route per client IP"""
+    def dependency(request: Request, response: Response):
+        check_rate_limit(budget, client_ip(request), response)
+    return dependency
+
+def rate_limit_user(budget: str):
+    """Dependency limiting a route per authenticated user"""
+    def dependency(response: Response, current_user: dict = Depends(get_current_user)):
+        check_rate_limit(budget, current_user['id'], response)
+    return dependency
+
+# ==================== Live Events ====================
+
+# Recent events kept for replay to clients reconnecting with Last-Event-ID
+EVENT_BUFFER_SIZE = int(os.environ.get('EVENT_BUFFER_SIZE', '1000'))
+# Undelivered events per connection; a client that falls further behind is disconnected
+EVENT_QUEUE_SIZE = int(os.environ.get('EVENT_QUEUE_SIZE', '100'))
+EVENT_KEEPALIVE_SECONDS = float(os.environ.get('EVENT_KEEPALIVE_SECONDS', '15'))
+# Lifetime of a stream ticket; EventSource cannot send headers, so it opens the stream with one
+EVENT_TICKET_TTL = int(os.environ.get('EVENT_TICKET_TTL', '30'))
+
+class EventSubscriber:
+    __slots__ = ('user_id', 'is_admin', 'queue', 'overflowed')
+
+    def __init__(self, user: dict):
+        self.user_id = user['id']
+        self.is_admin = bool(user.get('is_admin'))
+        self.queue = asyncio.Queue(maxsize=EVENT_QUEUE_SIZE)
+        self.overflowed = False
+
+    def wants(self, user_id: Optional[str]) -> bool:
+        return self.is_admin or user_id == self.user_id
+
+class EventBroker:
+    """In-process fan-out of order, payment, shipping and return status changes.
+
+    Each event is serialized once into an SSE frame shared by every subscriber.
+    Publishing never blocks: a subscriber whose queue is full is dropped and
+    catches up from the replay buffer when its EventSource reconnects.
+    """
+    def __init__(self, buffer_size: int):
+        # Ids continue from the boot time in ms, so they keep increasing across restarts
+        self._ids = itertools.count(int(time.time() * 1000))
+        self.buffer = deque(maxlen=buffer_size)  # (id, user_id, frame)
+        self.subscribers = set()
+        self.published = 0
+        self.dropped = 0
+
+    def publish(self, event: str, user_id: Optional[str], data: dict):
+        event_id = next(self._ids)
+        payload = json.dumps(data, ensure_ascii=False, default=json_default)
+        frame = f"id: {event_id}\nevent: {event}\ndata: {payload}\n\n".encode('utf-8')
+        self.buffer.append((event_id, user_id, frame))
+        self.published += 1
+        for subscriber in list(self.subscribers):
+            if not subscriber.wants(user_id):
+                continue
+            try:
+                subscriber.queue.put_nowait(frame)
+            except asyncio.QueueFull:
+                subscriber.overflowed = True
+                self.subscribers.discard(subscriber)
+                self.dropped += 1
+
+    def subscribe(self, user: dict, last_event_id: Optional[int]) -> tuple:
+        """Register a subscriber; returns it with the frames to replay (None: replay gap)"""
+        subscriber = EventSubscriber(user)
+        replay = []
+        if last_event_id is not None:
+            # An empty buffer means a restart (or another process): what was missed is unknown
+            first_id, last_id = (self.buffer[0][0], self.buffer[-1][0]) if self.buffer else (None, None)
+            if first_id is None or last_event_id < first_id - 1 or last_event_id > last_id:
+                replay = None  # Missed events are gone (or from another process)
+            else:
+                replay = [
+                    frame for event_id, user_id, frame in itertools.islice(
+                        self.buffer, last_event_id - first_id + 1, None
+                    ) if subscriber.wants(user_id)
+                ]
+        self.subscribers.add(subscriber)
+        return subscriber, replay
+
+    def unsubscribe(self, subscriber: EventSubscriber):
+        self.subscribers.discard(subscriber)
+
+event_broker = EventBroker(EVENT_BUFFER_SIZE)
+
+_redeemed_tickets = {}  # ticket id -> expiry (unix time), until it could no longer be used anyway
+
+def issue_stream_ticket(user: dict) -> str:
+    """Short-lived single-use ticket for opening the event stream.
+
+    It has no "sub" claim, so it is not accepted as a bearer token, and a leaked
+    URL (access logs, proxies) is useless after one connection or EVENT_TICKET_TTL.
+    """
+    expire = datetime.now(timezone.utc) + timedelta(seconds=EVENT_TICKET_TTL)
+    claims = {"stream_user": user['id'], "jti": uuid.uuid4().hex, "exp": expire}
+    return jwt.encode(claims, SECRET_KEY, algorithm=ALGORITHM)
+
+def redeem_stream_ticket(ticket: str) -> dict:
+    """Resolve a stream ticket to its user, or fail with 401 if it is invalid, expired or used"""
+    now = time.time()
+    for ticket_id in [t for t, expiry in _redeemed_tickets.items() if expiry < now]:
+        del _redeemed_tickets[ticket_id]
+    try:
+        claims = jwt.decode(ticket, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        claims = {}
+    ticket_id, user_id = claims.get("jti"), claims.get("stream_user")
+    user = database.users.get(user_id) if user_id else None
+    if not ticket_id or ticket_id in _redeemed_tickets or user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or expired stream ticket"
+        )
+    _redeemed_tickets[ticket_id] = claims["exp"]
+    return user
+
+def publish_order_status(order, old_status: str):
+    event_broker.publish('order.status', order.get('user_id'), {
+        'order_id': order['id'], 'status': order['status'], 'old_status': old_status
+    })
+
+async def stream_events(request: Request, subscriber: EventSubscriber, replay):
+    """SSE frames for one connection: replay, then live events with keepalive comments"""
+    try:
+        yield b"retry: 3000\n\n"
+        if replay is None:
+            # Tell the client to refetch its lists instead of trusting the gap
+            yield b"event: resync\ndata: {}\n\n"
+        else:
+            for frame in replay:
+                yield frame
+        while True:
+            try:
+                frame = await asyncio.wait_for(subscriber.queue.get(), EVENT_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                if subscriber.overflowed or await request.is_disconnected():
+                    return
+                yield b": keepalive\n\n"
+                continue
+            yield frame
+            if subscriber.overflowed and subscriber.queue.empty():
+                return  # Dropped for falling behind; the client resumes from Last-Event-ID
+    finally:
+        event_broker.unsubscribe(subscriber)
+
+# ==================== Background Jobs ====================
+
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', '4'))
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', '5'))
+JOB_BACKOFF_SECONDS = float(os.environ.get('JOB_BACKOFF_SECONDS', '2'))  # Doubles per failed attempt
+JOB_BACKOFF_MAX_SECONDS = float(os.environ.get('JOB_BACKOFF_MAX_SECONDS', '300'))
+JOB_TIMEOUT_SECONDS = float(os.environ.get('JOB_TIMEOUT_SECONDS', '60'))
+
+class JobQueue:
+    """Persistent asyncio job queue for side effects that should not hold up a request.
+
+    Jobs live in database.jobs (jobs.json) until they succeed, so a restart
+    resumes them. Failed attempts are retried with exponential backoff; after
+    JOB_MAX_ATTEMPTS the job stays in the file as 'dead' until an admin retries
+    it. Handlers may run more than once and must be idempotent.
+
+    Without a running worker pool (serverless, no lifespan) enqueue runs the job
+    inline once. Nothing would retry a failure there, so it goes straight to
+    'dead' (listed in /admin/jobs, where an admin can retry it).
+    """
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.handlers = {}
+        self.completed = 0
+        self.failed_attempts = 0
+        self._ready = None
+        self._delayed = []  # Heap of (run_at, seq, job_id)
+        self._seq = itertools.count()
+        self._wake = None
+        self._tasks = []
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def handler(self, name: str):
+        """Register the coroutine function running jobs of this name"""
+        def register(func):
+            self.handlers[name] = func
+            return func
+        return register
+
+    def _find(self, job_id: str) -> Optional[dict]:
+        return next((job for job in database.jobs if job['id'] == job_id), None)
+
+    async def enqueue(self, name: str, payload: dict) -> dict:
+        job = {
+            "id": str(uuid.uuid4()),
+            "name": name,
+            "payload": payload,
+            "status": "pending",
+            "attempts": 0,
+            "run_at": time.time(),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "last_error": None,
+        }
+        database.jobs.append(job)
+        await database.persist('jobs')
+        if self.running:
+            self._schedule(job)
+        else:
+            await self._run(job)
+        return job
+
+    def _schedule(self, job: dict):
+        heapq.heappush(self._delayed, (job['run_at'], next(self._seq), job['id']))
+        self._wake.set()
+
+    async def _run(self, job: dict):
+        func = self.handlers.get(job['name'])
+        job = database.replace_record('jobs', job, {'status': 'running', 'attempts': job['attempts'] + 1})
+        try:
+            if func is None:
+                raise LookupError(f"No handler for job {job['name']}")
+            await asyncio.wait_for(func(job['payload']), JOB_TIMEOUT_SECONDS)
+        except Exception as e:
+            self.failed_attempts += 1
+            last_error = f"{type(e).__name__}: {e}"
+            if job['attempts'] >= JOB_MAX_ATTEMPTS or not self.running:
+                job = database.replace_record('jobs', job, {
+                    'status': 'dead', 'last_error': last_error, 'dead_at': datetime.now(timezone.utc).isoformat()
+                })
+                if self.running:
+                    logger.error(f"Job {job['name']} {job['id']} dead after {job['attempts']} attempts: {job['last_error']}")
+                else:
+                    logger.error(f"Job {job['name']} {job['id']} failed with no workers to retry it, marked dead: {job['last_error']}")
+            else:
+                delay = min(JOB_BACKOFF_MAX_SECONDS, JOB_BACKOFF_SECONDS * 2 ** (job['attempts'] - 1))
+                job = database.replace_record('jobs', job, {
+                    'status': 'pending', 'last_error': last_error,
+                    'run_at': time.time() + delay * random.uniform(0.5, 1.0)  # Jitter spreads retries out
+                })
+                logger.warning(f"Job {job['name']} {job['id']} failed (attempt {job['attempts']}), retrying: {job['last_error']}")
+                if self.running:
+                    self._schedule(job)
+        else:
+            self.completed += 1
+            database.jobs[:] = [j for j in database.jobs if j['id'] != job['id']]
+        await database.persist('jobs')
+
+    async def _scheduler(self):
+        """Move jobs whose run_at has passed to the ready queue"""
+        while True:
+            now = time.time()
+            while self._delayed and self._delayed[0][0] <= now:
+                job = self._find(heapq.heappop(self._delayed)[2])
+                if job is not None and job['status'] == 'pending':
+                    self._ready.put_nowait(job)
+            timeout = self._delayed[0][0] - now if self._delayed else None
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _worker(self):
+        while True:
+            job = await self._ready.get()
+            try:
+                await self._run(job)
+            except Exception as e:
+                logger.error(f"Job worker error: {e}")
+
+    def start(self):
+        """Start the workers and resume jobs left over by a previous process"""
+        self._ready = asyncio.Queue()
+        self._wake = asyncio.Event()
+        self._delayed = []
+        for job in list(database.jobs):
+            if job['status'] == 'running':
+                job = database.replace_record('jobs', job, {'status': 'pending'})  # Interrupted mid-run
+            if job['status'] == 'pending':
+                heapq.heappush(self._delayed, (job['run_at'], next(self._seq), job['id']))
+        self._tasks = [asyncio.create_task(self._scheduler())]
+        self._tasks += [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        if self._delayed:
+            logger.info(f"Resuming {len(self._delayed)} background jobs")
+
+    def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    async def retry(self, job_id: str) -> Optional[dict]:
+        """Give a dead job a fresh set of attempts"""
+        job = self._find(job_id)
+        if job is None or job['status'] != 'dead':
+            return None
+        job = database.replace_record(
+            'jobs', job, {'status': 'pending', 'attempts': 0, 'run_at': time.time(), 'dead_at': None}
+        )
+        await database.persist('jobs')
+        if self.running:
+            self._schedule(job)
+        else:
+            await self._run(job)
+        return job
+
+    def counts(self) -> Counter:
+        return Counter(job['status'] for job in database.jobs)
+
+job_queue = JobQueue(JOB_WORKERS)
+
+@job_queue.handler('order.paid')
+async def clear_paid_cart(payload: dict):
+    """Empty the buyer's cart once their order is paid"""
+    user_id = payload['user_id']
+    async with cart_lock(user_id):
+        if database.carts.pop(user_id, None) is not None:
+            await run_in_threadpool(database.save_cart, user_id)
+
+async def mark_order_shipped(order):
+    """Move the order to shipped when its shipment is created (no-op if already there)"""
+    if order['status'] in ('shipped', 'delivered'):
+        return
+    old_status = order['status']
+    order = database.replace_record('orders', order, {'status': "shipped"})
+    saved = database.persist('orders')
+    update_analytics(lambda analytics: analytics.order_status_changed(order, old_status))
+    await saved
+    publish_order_status(order, old_status)
+
+@job_queue.handler('shipping.created')
+async def finish_shipping_created(payload: dict):
+    """Drain shipping jobs queued before the status change moved into the shipping route"""
+    order = find_order(payload['order_id'])
+    if order is not None:
+        await mark_order_shipped(order)
+
 # ==================== API Routes ====================
 
 api_router = APIRouter(prefix="/api")
 
 # Auth Routes
-@api_router.post("/auth/register", response_model=dict)
+@api_router.post("/auth/register", response_model=dict, dependencies=[Depends(rate_limit_ip('register'))])
 async def register(user_data: UserRegister):
     """Register a new user"""
     # Check if email already exists
@@ -446,13 +2835,13 @@ async def register(user_data: UserRegister):
     user_obj = User(
         email=user_data.email,
         name=user_data.name,
-        password_hash=get_password_hash(user_data.password)
+        password_hash=await get_password_hash_async(user_data.password)
     )
     
     doc = user_obj.model_dump()
     doc['created_at'] = doc['created_at'].isoformat()
-    database.users[user_obj.id] = doc
-    database.save_users()  # Save to file
+    database.users[user_obj.id] = UserRecord.from_dict(doc)
+    await database.persist('users')  # Save to file
     
     token = create_access_token(data={"sub": user_obj.id})
     return {
@@ -465,17 +2854,17 @@ async def register(user_data: UserRegister):
         }
     }
 
-@api_router.post("/auth/login", response_model=dict)
+@api_router.post("/auth/login", response_model=dict, dependencies=[Depends(rate_limit_ip('login'))])
 async def login(user_data: UserLogin):
     """Login user"""
     # Find user by email
     user = None
     for u in database.users.values():
         if u["email"] == user_data.email:
-            user = u.copy()
+            user = u
             break
     
-    if not user or not verify_password(user_data.password, user['password_hash']):
+    if not user or not await verify_password_async(user_data.password, user['password_hash']):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid email or password"
@@ -508,10 +2897,34 @@ async def get_products(
     category: Optional[str] = None,
     search: Optional[str] = None,
     min_price: Optional[float] = None,
-    max_price: Optional[float] = None
+    max_price: Optional[float] = None,
+    fields: Optional[str] = None
 ):
-    """Get products with optional filters"""
-    products = database.products.copy()
+    """Get products with optional filters and fields= projection"""
+    if not SINGLE_FLIGHT:
+        return filter_products(category, search, min_price, max_price, fields)
+    # Identical concurrent listings (campaign traffic) share one filter and serialization
+    key = (category, search, min_price, max_price, fields, database.versions['products'])
+    body = await single_flight.do('products', key, lambda: run_in_threadpool(
+        lambda: json_body(filter_products(category, search, min_price, max_price, fields))
+    ))
+    return Response(content=body, media_type="application/json")
+
+def filter_products(
+    category: Optional[str],
+    search: Optional[str],
+    min_price: Optional[float],
+    max_price: Optional[float],
+    fields: Optional[str]
+) -> list:
+    """Filter and project the catalog for get_products"""
+    project = parse_fields(fields)
+    if COLUMNAR_CATALOG:
+        products = get_catalog().filter(category, search, min_price, max_price)
+        return [project(p) for p in products] if project else products
+    
+    # Runs in a worker thread: filter the shared snapshot, never the live list
+    products = database.snapshot('products').records
     
     # Apply filters
     if category:
@@ -524,12 +2937,31 @@ async def get_products(
     if max_price is not None:
         products = [p for p in products if p.get('price', float('inf')) <= max_price]
     
-    return products
+    return [project(p) for p in products] if project else products
+
+@api_router.get("/products/suggest", response_model=List[dict])
+async def suggest_products(q: str = "", limit: int = 8):
+    """Search-as-you-type suggestions from product names and categories, most sold first"""
+    if not q.strip():
+        return []
+    index = get_suggest_index()
+    if index is None:
+        return []  # First build still running
+    return index.suggest(q, max(1, min(limit, SUGGEST_TOP_K)))
 
 @api_router.get("/products/{product_id}", response_model=dict)
 async def get_product(product_id: str):
     """Get a single product by ID"""
-    product = next((p for p in database.products if p.get('id') == product_id), None)
+    if not SINGLE_FLIGHT:
+        return get_product_or_404(product_id)
+    key = (product_id, database.versions['products'])
+    body = await single_flight.do('product', key, lambda: run_in_threadpool(
+        lambda: json_body(get_product_or_404(product_id))
+    ))
+    return Response(content=body, media_type="application/json")
+
+def get_product_or_404(product_id: str) -> dict:
+    product = find_product(product_id)
     if not product:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -547,7 +2979,10 @@ async def create_product(
     doc = product_obj.model_dump()
     doc['created_at'] = doc['created_at'].isoformat()
     database.products.append(doc)
-    database.save_products()  # Save to file
+    saved = database.persist('products')  # Save to file
+    update_facets(lambda facets: facets.upsert_product(doc))
+    update_suggestions(lambda suggestions: suggestions.upsert_product(doc))
+    await saved
     return product_obj
 
 @api_router.put("/products/{product_id}", response_model=dict)
@@ -557,14 +2992,17 @@ async def update_product(
     current_user: dict = Depends(get_admin_user)
 ):
     """Update a product (Admin only)"""
-    product = next((p for p in database.products if p.get('id') == product_id), None)
+    product = find_product(product_id)
     if not product:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Product not found"
         )
-    product.update(product_data.model_dump())
-    database.save_products()  # Save to file
+    product = database.replace_record('products', product, product_data.model_dump())
+    saved = database.persist('products')  # Save to file
+    update_facets(lambda facets: facets.upsert_product(product))
+    update_suggestions(lambda suggestions: suggestions.upsert_product(product))
+    await saved
     return {"message": "Product updated successfully"}
 
 @api_router.delete("/products/{product_id}", response_model=dict)
@@ -574,13 +3012,17 @@ async def delete_product(
 ):
     """Delete a product (Admin only)"""
     initial_len = len(database.products)
-    database.products = [p for p in database.products if p.get('id') != product_id]
+    # In place, so the only version bump is the save below
+    database.products[:] = [p for p in database.products if p.get('id') != product_id]
     if len(database.products) == initial_len:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Product not found"
         )
-    database.save_products()  # Save to file
+    saved = database.persist('products')  # Save to file
+    update_facets(lambda facets: facets.remove_product(product_id))
+    update_suggestions(lambda suggestions: suggestions.remove_product(product_id))
+    await saved
     return {"message": "Product deleted successfully"}
 
 @api_router.post("/upload", response_model=dict)
@@ -602,91 +3044,84 @@ async def upload_image(
 @api_router.get("/categories", response_model=List[str])
 async def get_categories():
     """Get all product categories"""
-    categories = list(set(p.get('category', '') for p in database.products if p.get('category')))
-    return categories
+    return get_facet_index().category_names()
+
+@api_router.get("/facets", response_model=dict)
+async def get_facets():
+    """Get category facets: product counts, in-stock counts and price ranges"""
+    return get_facet_index().to_dict()
 
 # Cart Routes
 @api_router.get("/cart", response_model=dict)
 async def get_cart(current_user: dict = Depends(get_current_user)):
-    """Get user's cart"""
+    """Get user's cart with current prices and total"""
     cart = database.carts.get(current_user['id'])
     if not cart:
-        return {"items": []}
-    return cart
+        return {"items": [], "total": 0.0}
+    return cart_response(cart)
 
-@api_router.post("/cart", response_model=dict)
+@api_router.post("/cart", response_model=dict, dependencies=[Depends(rate_limit_user('writes'))])
 async def add_to_cart(
-    item: CartItem,
+    item: CartItemCreate,
     current_user: dict = Depends(get_current_user)
 ):
-    """Add item to cart"""
-    cart = database.carts.get(current_user['id'])
-    
-    if not cart:
-        cart_obj = Cart(user_id=current_user['id'], items=[item])
-        doc = cart_obj.model_dump()
-        doc['updated_at'] = doc['updated_at'].isoformat()
-        database.carts[current_user['id']] = doc
-    else:
-        items = cart.get('items', [])
-        existing_item = next(
-            (i for i in items if i['product_id'] == item.product_id),
-            None
-        )
-        if existing_item:
-            existing_item['quantity'] += item.quantity
-        else:
-            items.append(item.model_dump())
-        
-        cart['items'] = items
-        cart['updated_at'] = datetime.now(timezone.utc).isoformat()
-    
-    database.save_carts()  # Save to file
+    """Add item to cart (priced from the catalog, not the client)"""
+    user_id = current_user['id']
+    async with cart_lock(user_id):
+        price = unit_price(item.product_id, item.variant_id)
+        if price is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Product not found"
+            )
+        cart = database.carts.get(user_id)
+        if cart is None:
+            cart = database.carts[user_id] = CartRecord.new(user_id)
+        cart.add(item.product_id, item.variant_id, item.quantity, price)
+        await run_in_threadpool(database.save_cart, user_id)  # Only this user's cart file
     return {"message": "Item added to cart"}
 
-@api_router.put("/cart/{product_id}", response_model=dict)
+@api_router.put("/cart/{product_id}", response_model=dict, dependencies=[Depends(rate_limit_user('writes'))])
 async def update_cart_item(
-    product_id: str,
-    quantity: int,
-    current_user: dict = Depends(get_current_user)
-):
-    """Update cart item quantity"""
-    cart = database.carts.get(current_user['id'])
-    if not cart:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Cart not found"
-        )
-    
-    items = cart.get('items', [])
-    item = next((i for i in items if i['product_id'] == product_id), None)
-    if not item:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Item not found in cart"
-        )
-    
-    if quantity <= 0:
-        items = [i for i in items if i['product_id'] != product_id]
-    else:
-        item['quantity'] = quantity
-    
-    cart['items'] = items
-    cart['updated_at'] = datetime.now(timezone.utc).isoformat()
-    database.save_carts()  # Save to file
-    
+    product_id: str,
+    quantity: int,
+    variant_id: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    """Update cart item quantity (0 removes the line)"""
+    user_id = current_user['id']
+    async with cart_lock(user_id):
+        cart = database.carts.get(user_id)
+        if not cart:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Cart not found"
+            )
+        if not cart.set_quantity(product_id, variant_id, quantity):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Item not found in cart"
+            )
+        await run_in_threadpool(database.save_cart, user_id)
     return {"message": "Cart updated"}
 
 @api_router.delete("/cart", response_model=dict)
 async def clear_cart(current_user: dict = Depends(get_current_user)):
     """Clear user's cart"""
-    if current_user['id'] in database.carts:
-        del database.carts[current_user['id']]
-        database.save_carts()  # Save to file
+    user_id = current_user['id']
+    async with cart_lock(user_id):
+        if database.carts.pop(user_id, None) is not None:
+            await run_in_threadpool(database.save_cart, user_id)
     return {"message": "Cart cleared"}
 
+@api_router.post("/admin/carts/sweep", response_model=dict)
+async def sweep_abandoned_carts(current_user: dict = Depends(get_admin_user)):
+    """Archive and evict abandoned carts now (Admin only)"""
+    evicted = await sweep_carts()
+    return {"evicted": evicted, "remaining": len(database.carts), "ttl_seconds": CART_TTL}
+
 # Order Routes
-@api_router.post("/orders", response_model=Order)
+@api_router.post("/orders", response_model=Order, dependencies=[Depends(rate_limit_user('writes'))])
 async def create_order(
     order_data: OrderCreate,
     current_user: dict = Depends(get_current_user)
@@ -706,17 +3141,25 @@ async def create_order(
     
     doc = order_obj.model_dump()
     doc['created_at'] = doc['created_at'].isoformat()
-    database.orders.append(doc)
-    database.save_orders()  # Save to file
+    record = OrderRecord.from_dict(doc)
+    database.orders.append(record)
+    saved = database.persist('orders')  # Save to file
+    update_analytics(lambda analytics: analytics.add_order(record))
+    await saved
     
     return order_obj
 
 @api_router.get("/orders", response_model=List[dict])
-async def get_orders(current_user: dict = Depends(get_current_user)):
-    """Get user's orders"""
-    orders = [o for o in database.orders if o.get('user_id') == current_user['id']]
-    orders.sort(key=lambda x: x.get('created_at', ''), reverse=True)
-    return orders[:100]
+async def get_orders(
+    include: Optional[str] = None,
+    fields: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    """Get user's orders, optionally with include=shipping,returns and fields= projection"""
+    includes = parse_includes(include)
+    orders = get_field_index('orders', 'user_id', many=True).get(current_user['id'], [])
+    latest = heapq.nlargest(100, orders, key=lambda x: x.get('created_at', ''))
+    return orders_with_includes(latest, includes, parse_fields(fields))
 
 @api_router.get("/orders/{order_id}", response_model=dict)
 async def get_order(
@@ -724,21 +3167,30 @@ async def get_order(
     current_user: dict = Depends(get_current_user)
 ):
     """Get a single order by ID"""
-    order = next((o for o in database.orders if o.get('id') == order_id and o.get('user_id') == current_user['id']), None)
-    if not order:
+    order = find_order(order_id, current_user['id'])
+    if order:
+        return order.to_dict()
+    # Old orders live in the archive
+    archived = await run_in_threadpool(order_archive.get, 'orders', order_id)
+    if not archived or archived.get('user_id') != current_user['id']:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Order not found"
         )
-    return order
+    return archived
 
 # Admin Routes
 @api_router.get("/admin/orders", response_model=List[dict])
-async def get_all_orders(current_user: dict = Depends(get_admin_user)):
-    """Get all orders (Admin only)"""
-    orders = database.orders.copy()
-    orders.sort(key=lambda x: x.get('created_at', ''), reverse=True)
-    return orders[:1000]
+async def get_all_orders(
+    include: Optional[str] = None,
+    fields: Optional[str] = None,
+    current_user: dict = Depends(get_admin_user)
+):
+    """Get all orders, optionally with include=shipping,returns and fields= projection (Admin only)"""
+    includes = parse_includes(include)
+    # Top-N selection instead of copying and sorting the whole collection
+    latest = heapq.nlargest(1000, database.orders, key=lambda x: x.get('created_at', ''))
+    return orders_with_includes(latest, includes, parse_fields(fields))
 
 @api_router.put("/admin/orders/{order_id}", response_model=dict)
 async def update_order_status(
@@ -747,18 +3199,22 @@ async def update_order_status(
     current_user: dict = Depends(get_admin_user)
 ):
     """Update order status (Admin only)"""
-    order = next((o for o in database.orders if o.get('id') == order_id), None)
+    order = find_order(order_id)
     if not order:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Order not found"
         )
-    order['status'] = status
-    database.save_orders()  # Save to file
+    old_status = order['status']
+    order = database.replace_record('orders', order, {'status': status})
+    saved = database.persist('orders')  # Save to file
+    update_analytics(lambda analytics: analytics.order_status_changed(order, old_status))
+    await saved
+    publish_order_status(order, old_status)
     return {"message": "Order status updated"}
 
 # Payment Routes
-@api_router.post("/payment/process", response_model=dict)
+@api_router.post("/payment/process", response_model=dict, dependencies=[Depends(rate_limit_user('writes'))])
 async def process_payment(
     payment_req: PaymentRequest,
     request: Request,
@@ -767,7 +3223,7 @@ async def process_payment(
     """Process payment via iyzico"""
     try:
         # Get order
-        order = next((o for o in database.orders if o.get('id') == payment_req.order_id and o.get('user_id') == current_user['id']), None)
+        order = find_order(payment_req.order_id, current_user['id'])
         if not order:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -842,15 +3298,21 @@ async def process_payment(
         }
         
         # Process payment
-        payment = iyzipay.Payment().create(payment_request, options)
+        payment = get_iyzipay().Payment().create(payment_request, options)
         
         if payment.get('status') == 'success':
-            order['status'] = "paid"
-            order['payment_id'] = payment.get('paymentId')
-            database.save_orders()  # Save to file
-            if current_user['id'] in database.carts:
-                del database.carts[current_user['id']]
-                database.save_carts()  # Save to file
+            old_status = order['status']
+            order = database.replace_record(
+                'orders', order, {'status': "paid", 'payment_id': payment.get('paymentId')}
+            )
+            saved = database.persist('orders')  # Save to file
+            update_analytics(lambda analytics: analytics.order_status_changed(order, old_status))
+            await saved
+            publish_order_status(order, old_status)
+            event_broker.publish('payment.succeeded', order['user_id'], {
+                'order_id': order['id'], 'payment_id': order['payment_id']
+            })
+            await job_queue.enqueue('order.paid', {'order_id': order['id'], 'user_id': current_user['id']})
             
             return {
                 "success": True,
@@ -889,17 +3351,19 @@ async def create_product_variant(
 ):
     """Create a product variant (Admin only)"""
     # Verify product exists
-    product = next((p for p in database.products if p.get('id') == product_id), None)
+    product = find_product(product_id)
     if not product:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Product not found"
         )
     
-    variant_obj = ProductVariant(**variant_data.model_dump(), product_id=product_id)
+    variant_obj = ProductVariant(**{**variant_data.model_dump(), 'product_id': product_id})
     doc = variant_obj.model_dump()
     database.variants.append(doc)
-    database.save_variants()
+    saved = database.persist('variants')
+    update_facets(lambda facets: facets.upsert_variant(doc))
+    await saved
     return doc
 
 @api_router.put("/variants/{variant_id}", response_model=dict)
@@ -915,8 +3379,10 @@ async def update_product_variant(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Variant not found"
         )
-    variant.update(variant_data.model_dump())
-    database.save_variants()
+    variant = database.replace_record('variants', variant, variant_data.model_dump())
+    saved = database.persist('variants')
+    update_facets(lambda facets: facets.upsert_variant(variant))
+    await saved
     return variant
 
 @api_router.delete("/variants/{variant_id}", response_model=dict)
@@ -926,13 +3392,16 @@ async def delete_product_variant(
 ):
     """Delete a product variant (Admin only)"""
     initial_len = len(database.variants)
-    database.variants = [v for v in database.variants if v.get('id') != variant_id]
+    # In place, so the only version bump is the save below
+    database.variants[:] = [v for v in database.variants if v.get('id') != variant_id]
     if len(database.variants) == initial_len:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Variant not found"
         )
-    database.save_variants()
+    saved = database.persist('variants')
+    update_facets(lambda facets: facets.remove_variant(variant_id))
+    await saved
     return {"message": "Variant deleted successfully"}
 
 # ==================== Shipping & Tracking Routes ====================
@@ -944,7 +3413,7 @@ async def create_shipping(
 ):
     """Create shipping info (Admin only)"""
     # Verify order exists
-    order = next((o for o in database.orders if o.get('id') == shipping_data.order_id), None)
+    order = find_order(shipping_data.order_id)
     if not order:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -963,12 +3432,13 @@ async def create_shipping(
     doc['estimated_delivery'] = doc['estimated_delivery'].isoformat() if doc['estimated_delivery'] else None
     doc['delivered_at'] = doc['delivered_at'].isoformat() if doc['delivered_at'] else None
     database.shipping.append(doc)
-    database.save_shipping()
-    
-    # Update order status
-    order['status'] = "shipped"
-    database.save_orders()
+    await database.persist('shipping')
+    await mark_order_shipped(order)
     
+    event_broker.publish('shipping.created', order.get('user_id'), {
+        'order_id': order['id'], 'carrier': doc['carrier'],
+        'tracking_number': doc['tracking_number'], 'status': doc['status']
+    })
     return doc
 
 @api_router.get("/shipping/{order_id}", response_model=dict)
@@ -978,7 +3448,7 @@ async def get_shipping_info(
 ):
     """Get shipping info for an order"""
     # Verify order belongs to user or user is admin
-    order = next((o for o in database.orders if o.get('id') == order_id), None)
+    order = find_order(order_id)
     if not order:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -991,7 +3461,7 @@ async def get_shipping_info(
             detail="Access denied"
         )
     
-    shipping = next((s for s in database.shipping if s.get('order_id') == order_id), None)
+    shipping = get_field_index('shipping', 'order_id').get(order_id)
     if not shipping:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -999,10 +3469,10 @@ async def get_shipping_info(
         )
     return shipping
 
-@api_router.get("/tracking/{tracking_number}", response_model=dict)
+@api_router.get("/tracking/{tracking_number}", response_model=dict, dependencies=[Depends(rate_limit_ip('tracking'))])
 async def track_shipment(tracking_number: str):
     """Track shipment by tracking number (public endpoint)"""
-    shipping = next((s for s in database.shipping if s.get('tracking_number') == tracking_number), None)
+    shipping = get_field_index('shipping', 'tracking_number').get(tracking_number)
     if not shipping:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -1011,14 +3481,14 @@ async def track_shipment(tracking_number: str):
     
     # Simulate tracking status updates
     carrier = shipping.get('carrier', '').lower()
-    status = shipping.get('status', 'pending')
+    shipment_status = shipping.get('status', 'pending')
     
     # Mock tracking data based on carrier
     tracking_data = {
         "tracking_number": tracking_number,
         "carrier": shipping.get('carrier'),
-        "status": status,
-        "current_location": "Distribution Center" if status == "in_transit" else "Origin",
+        "status": shipment_status,
+        "current_location": "Distribution Center" if shipment_status == "in_transit" else "Origin",
         "events": [
             {
                 "date": shipping.get('shipped_at', datetime.now(timezone.utc).isoformat()),
@@ -1028,7 +3498,7 @@ async def track_shipment(tracking_number: str):
         ]
     }
     
-    if status == "delivered":
+    if shipment_status == "delivered":
         tracking_data["events"].append({
             "date": shipping.get('delivered_at', datetime.now(timezone.utc).isoformat()),
             "status": "Delivered",
@@ -1044,35 +3514,46 @@ async def update_shipping_status(
     current_user: dict = Depends(get_admin_user)
 ):
     """Update shipping status (Admin only)"""
-    shipping = next((s for s in database.shipping if s.get('order_id') == order_id), None)
+    shipping = get_field_index('shipping', 'order_id').get(order_id)
     if not shipping:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Shipping info not found"
         )
     
-    shipping['status'] = status
+    changes = {'status': status}
+    if status == "delivered":
+        changes['delivered_at'] = datetime.now(timezone.utc).isoformat()
+    shipping = database.replace_record('shipping', shipping, changes)
+    order = find_order(order_id)
     if status == "delivered":
-        shipping['delivered_at'] = datetime.now(timezone.utc).isoformat()
         # Update order status
-        order = next((o for o in database.orders if o.get('id') == order_id), None)
         if order:
-            order['status'] = "delivered"
-            database.save_orders()
+            old_status = order['status']
+            order = database.replace_record('orders', order, {'status': "delivered"})
+            saved = database.persist('orders')
+            update_analytics(lambda analytics: analytics.order_status_changed(order, old_status))
+            await saved
     
-    database.save_shipping()
+    await database.persist('shipping')
+    user_id = order.get('user_id') if order else None
+    event_broker.publish('shipping.status', user_id, {
+        'order_id': order_id, 'status': status, 'delivered_at': shipping.get('delivered_at')
+    })
+    if order and status == "delivered":
+        publish_order_status(order, old_status)
     return shipping
 
 # ==================== Returns & Refunds Routes ====================
 
-@api_router.post("/returns", response_model=dict)
+@api_router.post("/returns", response_model=dict, dependencies=[Depends(rate_limit_user('writes'))])
 async def create_return_request(
     return_data: ReturnCreate,
     current_user: dict = Depends(get_current_user)
 ):
     """Create a return/refund request"""
     # Verify order exists and belongs to user
-    order = next((o for o in database.orders if o.get('id') == return_data.order_id and o.get('user_id') == current_user['id']), None)
+    order = find_order(return_data.order_id, current_user['id'])
     if not order:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -1096,7 +3577,12 @@ async def create_return_request(
     doc['created_at'] = doc['created_at'].isoformat()
     doc['processed_at'] = doc['processed_at'].isoformat() if doc['processed_at'] else None
     database.returns.append(doc)
-    database.save_returns()
+    saved = database.persist('returns')
+    update_analytics(lambda analytics: analytics.add_return(doc))
+    await saved
+    event_broker.publish('return.created', doc['user_id'], {
+        'return_id': doc['id'], 'order_id': doc['order_id'], 'status': doc['status']
+    })
     return doc
 
 @api_router.get("/returns", response_model=List[dict])
@@ -1107,11 +3593,14 @@ async def get_return_requests(current_user: dict = Depends(get_current_user)):
     return returns
 
 @api_router.get("/admin/returns", response_model=List[dict])
-async def get_all_returns(current_user: dict = Depends(get_admin_user)):
-    """Get all return requests (Admin only)"""
-    returns = database.returns.copy()
-    returns.sort(key=lambda x: x.get('created_at', ''), reverse=True)
-    return returns
+async def get_all_returns(
+    fields: Optional[str] = None,
+    current_user: dict = Depends(get_admin_user)
+):
+    """Get all return requests, optionally with fields= projection (Admin only)"""
+    returns = sorted(database.returns, key=lambda x: x.get('created_at', ''), reverse=True)
+    project = parse_fields(fields)
+    return [project(r) for r in returns] if project else returns
 
 @api_router.put("/admin/returns/{return_id}", response_model=dict)
 async def update_return_status(
@@ -1127,33 +3616,699 @@ async def update_return_status(
             detail="Return request not found"
         )
     
-    return_req['status'] = status
+    old_status = return_req['status']
+    changes = {'status': status}
     if status == "processed":
-        return_req['processed_at'] = datetime.now(timezone.utc).isoformat()
+        changes['processed_at'] = datetime.now(timezone.utc).isoformat()
+    return_req = database.replace_record('returns', return_req, changes)
     
-    database.save_returns()
+    saved = database.persist('returns')
+    update_analytics(lambda analytics: analytics.return_status_changed(return_req, old_status))
+    await saved
+    event_broker.publish('return.status', return_req.get('user_id'), {
+        'return_id': return_id, 'order_id': return_req.get('order_id'),
+        'status': status, 'old_status': old_status
+    })
     return return_req
 
+@api_router.get("/admin/stats", response_model=dict)
+async def get_admin_stats(
+    days: int = 30,
+    top: int = 10,
+    current_user: dict = Depends(get_admin_user)
+):
+    """Get revenue, order status, top product and return aggregates (Admin only)"""
+    return get_analytics_index().to_dict(days=max(1, min(days, 366)), top=max(1, min(top, 100)))
+
+# ==================== Order Archive Routes ====================
+
+@api_router.post("/admin/archive", response_model=dict)
+async def run_archive(current_user: dict = Depends(get_admin_user)):
+    """Archive closed orders and returns older than ARCHIVE_AFTER_DAYS now (Admin only)"""
+    moved = await archive_old_records()
+    return {
+        "archived": moved,
+        "archive_size": {name: order_archive.count(name) for name in ARCHIVE_STATUSES},
+    }
+
+# ==================== Background Jobs Routes ====================
+
+@api_router.get("/admin/jobs", response_model=dict)
+async def get_jobs(current_user: dict = Depends(get_admin_user)):
+    """Pending job counts and the dead-letter list (Admin only)"""
+    return {
+        "counts": dict(job_queue.counts()),
+        "completed": job_queue.completed,
+        "dead": [job for job in database.jobs if job['status'] == 'dead'],
+    }
+
+@api_router.post("/admin/jobs/{job_id}/retry", response_model=dict)
+async def retry_job(job_id: str, current_user: dict = Depends(get_admin_user)):
+    """Re-run a dead-lettered job (Admin only)"""
+    job = await job_queue.retry(job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Dead job not found"
+        )
+    return job
+
+# ==================== Live Events Routes ====================
+
+@api_router.post("/events/ticket", response_model=dict)
+async def create_events_ticket(current_user: dict = Depends(get_current_user)):
+    """Issue a single-use ticket for opening /api/events"""
+    return {"ticket": issue_stream_ticket(current_user), "expires_in": EVENT_TICKET_TTL}
+
+@api_router.get("/events")
+async def get_events(
+    request: Request,
+    ticket: Optional[str] = None,
+    last_event_id: Optional[int] = None
+):
+    """Server-Sent Events feed of order, payment, shipping and return status changes.
+
+    Customers receive events for their own orders, admins receive all. EventSource
+    cannot send headers, so it authenticates with ?ticket= from POST /events/ticket;
+    the JWT itself is only accepted in the Authorization header.
+    """
+    authorization = request.headers.get('authorization', '')
+    if authorization.lower().startswith('bearer '):
+        user = user_from_token(authorization[7:])
+    elif ticket:
+        user = redeem_stream_ticket(ticket)
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated"
+        )
+    header_id = request.headers.get('last-event-id')
+    if header_id and header_id.isdigit():
+        last_event_id = int(header_id)  # Sent by EventSource itself on reconnect
+    subscriber, replay = event_broker.subscribe(user, last_event_id)
+    return StreamingResponse(
+        stream_events(request, subscriber, replay),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# ==================== Catalog Bulk Routes ====================
+
+BULK_MAX_ROWS = int(os.environ.get('BULK_MAX_ROWS', '50000'))
+BULK_STAGE_ATTEMPTS = 3  # Validation reruns when the catalog changes while a batch is validated
+
+class BulkOperation(BaseModel):
+    """One row of a bulk catalog request"""
+    op: str  # upsert, delete
+    type: str  # product, variant
+    id: Optional[str] = None
+    data: dict = Field(default_factory=dict)
+
+class BulkRequest(BaseModel):
+    operations: List[BulkOperation]
+
+def _validation_message(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(p) for p in e['loc'])}: {e['msg']}" for e in error.errors())
+
+class CatalogBatch:
+    """Validates bulk operations against a working view of products and variants.
+
+    Built from snapshots so validation can run in a worker thread. Nothing
+    touches the database until apply(), on the event loop, which rewrites each
+    changed collection once, so indexes and caches are invalidated once per batch.
+    """
+    def __init__(self, products: Snapshot, variants: Snapshot):
+        self.versions = (products.version, variants.version)
+        self.products = {p.get('id'): p for p in products.records}
+        self.variants = {v.get('id'): v for v in variants.records}
+        self.changed = {'product': {}, 'variant': {}}  # id -> new doc, or None when deleted
+        self.results = []
+
+    @classmethod
+    def stage(cls, operations: list, products: Snapshot, variants: Snapshot) -> 'CatalogBatch':
+        """Validate every operation (runs in a worker thread)"""
+        batch = cls(products, variants)
+        for line, raw in enumerate(operations, start=1):
+            if isinstance(raw, dict) and '_invalid' in raw:
+                batch.results.append({"line": line, "status": "error", "error": raw['_invalid']})
+                continue
+            batch.add(line, raw.model_dump() if isinstance(raw, BaseModel) else raw)
+        return batch
+
+    @property
+    def stale(self) -> bool:
+        """Whether the catalog changed since the snapshots were taken"""
+        return self.versions != (database.versions['products'], database.versions['variants'])
+
+    def _current(self, kind: str, record_id: Optional[str]):
+        changed = self.changed[kind]
+        if record_id in changed:
+            return changed[record_id]
+        return (self.products if kind == 'product' else self.variants).get(record_id)
+
+    def _upsert_product(self, record_id: Optional[str], data: dict, current) -> dict:
+        if current is None:
+            doc = Product(**{**data, **({'id': record_id} if record_id else {})}).model_dump()
+            doc['created_at'] = doc['created_at'].isoformat()
+            return doc
+        validated = ProductCreate(**{**current, **data}).model_dump()
+        return {**current, **validated}
+
+    def _upsert_variant(self, record_id: Optional[str], data: dict, current) -> dict:
+        if current is None:
+            doc = ProductVariant(**{**data, **({'id': record_id} if record_id else {})}).model_dump()
+        else:
+            doc = {**current, **ProductVariantCreate(**{**current, **data}).model_dump()}
+        if self._current('product', doc['product_id']) is None:
+            raise ValueError(f"Product {doc['product_id']} not found")
+        return doc
+
+    def add(self, line: int, raw) -> bool:
+        """Validate one operation and stage it; returns False if it was rejected"""
+        result = {"line": line}
+        self.results.append(result)
+        try:
+            operation = BulkOperation.model_validate(raw)
+            result.update(op=operation.op, type=operation.type, id=operation.id)
+            if operation.type not in self.changed:
+                raise ValueError("type must be product or variant")
+            current = self._current(operation.type, operation.id)
+            if operation.op == 'delete':
+                if current is None:
+                    raise ValueError(f"{operation.type.capitalize()} not found")
+                self.changed[operation.type][operation.id] = None
+                result['status'] = 'deleted'
+            elif operation.op == 'upsert':
+                upsert = self._upsert_product if operation.type == 'product' else self._upsert_variant
+                doc = upsert(operation.id, operation.data, current)
+                self.changed[operation.type][doc['id']] = doc
+                result.update(id=doc['id'], status='updated' if current is not None else 'created')
+            else:
+                raise ValueError("op must be upsert or delete")
+            return True
+        except ValidationError as e:
+            result.update(status='error', error=_validation_message(e))
+        except ValueError as e:
+            result.update(status='error', error=str(e))
+        return False
+
+    @staticmethod
+    def _merge(records: list, changed: dict) -> list:
+        merged = []
+        for record in records:
+            record_id = record.get('id')
+            if record_id in changed:
+                if changed[record_id] is not None:
+                    merged.append(changed.pop(record_id))
+                else:
+                    del changed[record_id]
+            else:
+                merged.append(record)
+        merged.extend(doc for doc in changed.values() if doc is not None)
+        return merged
+
+    async def apply(self):
+        """Write every staged change with one save per touched collection (call only if not stale)"""
+        saves = []
+        if self.changed['product']:
+            database.products[:] = self._merge(database.products, self.changed['product'])
+            saves.append(database.persist('products'))
+        if self.changed['variant']:
+            database.variants[:] = self._merge(database.variants, self.changed['variant'])
+            saves.append(database.persist('variants'))
+        for saved in saves:
+            await saved
+
+def _parse_bulk_lines(lines: list) -> list:
+    parsed = []
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            parsed.append(json.loads(line))
+        except json.JSONDecodeError as e:
+            parsed.append({'_invalid': f"Invalid JSON: {e.msg}"})
+    return parsed
+
+async def _read_bulk_operations(request: Request) -> list:
+    """Parse a JSON {"operations": [...]} body or NDJSON streamed line by line (in a worker thread)"""
+    if 'ndjson' not in request.headers.get('content-type', ''):
+        body = await request.body()
+        try:
+            return await run_in_threadpool(lambda: BulkRequest.model_validate_json(body).operations)
+        except ValidationError as e:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=_validation_message(e)
+            )
+    operations, pending = [], b''
+    async for chunk in request.stream():
+        pending += chunk
+        *lines, pending = pending.split(b'\n')
+        operations.extend(lines)
+        if len(operations) > BULK_MAX_ROWS:
+            break
+    operations.append(pending)
+    return await run_in_threadpool(_parse_bulk_lines, operations)
+
+@api_router.post("/admin/catalog/bulk", response_model=dict)
+async def bulk_catalog(
+    request: Request,
+    dry_run: bool = False,
+    atomic: bool = True,
+    current_user: dict = Depends(get_admin_user)
+):
+    """Upsert or delete products and variants in one batch (Admin only)
+
+    Accepts {"operations": [...]} as JSON or one operation per line as
+    application/x-ndjson. With atomic (the default) nothing is written if any
+    row is rejected.
+    """
+    operations = await _read_bulk_operations(request)
+    if len(operations) > BULK_MAX_ROWS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {BULK_MAX_ROWS} operations per request"
+        )
+    await run_in_threadpool(database.preload, 'products', 'variants')
+    for _ in range(BULK_STAGE_ATTEMPTS):
+        # Pydantic validation of up to BULK_MAX_ROWS rows runs off the event loop
+        batch = await run_in_threadpool(
+            CatalogBatch.stage, operations, database.snapshot('products'), database.snapshot('variants')
+        )
+        if dry_run or not batch.stale:
+            break
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Catalog kept changing during validation, try again"
+        )
+    errors = sum(1 for r in batch.results if r['status'] == 'error')
+    applied = not dry_run and not (atomic and errors)
+    if applied:
+        await batch.apply()
+        logger.info(f"Bulk catalog: {len(batch.results) - errors} rows applied, {errors} rejected")
+    return {
+        "applied": applied,
+        "total": len(batch.results),
+        "errors": errors,
+        "results": batch.results
+    }
+
+# ==================== Admin Export Routes ====================
+
+EXPORT_CHUNK_ROWS = int(os.environ.get('EXPORT_CHUNK_ROWS', '500'))
+
+# collection -> (date field used for ranges, CSV columns)
+EXPORTS = {
+    'orders': ('created_at', [
+        'id', 'user_id', 'status', 'total_amount', 'item_count', 'payment_id',
+        'shipping_city', 'shipping_country', 'created_at'
+    ]),
+    'returns': ('created_at', [
+        'id', 'order_id', 'user_id', 'status', 'reason', 'item_count', 'created_at', 'processed_at'
+    ]),
+    'shipping': ('shipped_at', [
+        'order_id', 'carrier', 'tracking_number', 'status', 'shipped_at', 'estimated_delivery', 'delivered_at'
+    ]),
+}
+
+class DateIndex:
+    """Records of one collection sorted by a date field, for range scans"""
+    def __init__(self, records: list, field: str, version: int):
+        self.version = version
+        ordered = sorted(records, key=lambda r: r.get(field) or '')
+        self.keys = [r.get(field) or '' for r in ordered]
+        self.records = ordered
+
+    def range(self, start: Optional[str] = None, end: Optional[str] = None) -> range:
+        """Positions with start <= date and date <= end; a date-only end covers that whole day"""
+        lo = bisect.bisect_left(self.keys, start) if start else 0
+        hi = bisect.bisect_right(self.keys, end + '\uffff') if end else len(self.keys)
+        return range(lo, max(lo, hi))
+
+_date_indexes = {}
+
+def get_date_index(collection: str) -> DateIndex:
+    """Get the date index of a collection, rebuilt when the collection changes"""
+    records = getattr(database, collection)  # May load and bump the version
+    version = database.versions[collection]
+    index = _date_indexes.get(collection)
+    if index is None or index.version != version:
+        index = _date_indexes[collection] = DateIndex(records, EXPORTS[collection][0], version)
+    return index
+
+def export_row(collection: str, record) -> dict:
+    """Flatten a record into its CSV columns"""
+    if collection == 'orders':
+        address = record.get('shipping_address') or {}
+        return {
+            'id': record.get('id'), 'user_id': record.get('user_id'), 'status': record.get('status'),
+            'total_amount': record.get('total_amount'), 'item_count': len(record.get('items') or []),
+            'payment_id': record.get('payment_id'), 'shipping_city': address.get('city'),
+            'shipping_country': address.get('country'), 'created_at': record.get('created_at')
+        }
+    row = {column: record.get(column) for column in EXPORTS[collection][1]}
+    if 'item_count' in row:
+        row['item_count'] = len(record.get('items') or [])
+    return row
+
+async def stream_export(collection: str, index: DateIndex, positions: range, fmt: str,
+                        archived_blocks: tuple = (), start: Optional[str] = None, end: Optional[str] = None):
+    """Yield the selected records in chunks, so memory stays flat whatever the range.
+
+    Archived records come first, one block at a time, then the in-memory ones.
+    """
+    records = index.records
+    columns = EXPORTS[collection][1]
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction='ignore')
+    if fmt == 'csv':
+        writer.writeheader()
+
+    def write(record):
+        if fmt == 'csv':
+            writer.writerow(export_row(collection, record))
+        else:
+            buffer.write(json.dumps(record, ensure_ascii=False, default=json_default))
+            buffer.write('\n')
+
+    if archived_blocks:
+        date_field = EXPORTS[collection][0]
+        hot_ids = get_field_index(collection, 'id')
+        end_key = end + '\uffff' if end else None
+        for block in archived_blocks:
+            for record in await run_in_threadpool(order_archive.read_block, block):
+                created_at = record.get(date_field) or ''
+                # Skip records outside the range, and copies left by an interrupted archive run
+                if (start and created_at < start) or (end_key and created_at > end_key) or record['id'] in hot_ids:
+                    continue
+                write(record)
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    for chunk_start in range(positions.start, positions.stop, EXPORT_CHUNK_ROWS):
+        for position in range(chunk_start, min(chunk_start + EXPORT_CHUNK_ROWS, positions.stop)):
+            write(records[position])
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+        await asyncio.sleep(0)  # Let other requests run between chunks
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+@api_router.get("/admin/export/{collection}")
+async def export_collection(
+    collection: str,
+    format: str = "ndjson",
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    archived: bool = True,
+    current_user: dict = Depends(get_admin_user)
+):
+    """Stream orders, returns or shipping as NDJSON or CSV, optionally by date range (Admin only)
+
+    Orders and returns include archived records unless archived=false.
+    """
+    if collection not in EXPORTS:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Unknown export collection"
+        )
+    if format not in ("ndjson", "csv"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Format must be ndjson or csv"
+        )
+    index = get_date_index(collection)
+    positions = index.range(start, end)
+    blocks, archived_count = (), 0
+    if archived and collection in ARCHIVE_STATUSES:
+        blocks, archived_count = await run_in_threadpool(order_archive.blocks, collection, start, end)
+    media_type = "text/csv; charset=utf-8" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        stream_export(collection, index, positions, format, blocks, start, end),
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f'attachment; filename="{collection}.{format}"',
+            "X-Total-Count": str(len(positions) + archived_count)
+        }
+    )
+
+# ==================== Diagnostics Routes ====================
+
+class DiagnosticsSettings(BaseModel):
+    profile_path_prefix: Optional[str] = None
+
+def _require_diagnostics():
+    if not DIAGNOSTICS_ENABLED:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Diagnostics mode is disabled"
+        )
+
+@api_router.get("/admin/diagnostics", response_model=dict)
+async def get_diagnostics(current_user: dict = Depends(get_admin_user)):
+    """Get diagnostics state and recorded profiles (Admin only)"""
+    _require_diagnostics()
+    return {
+        "loop_block_threshold": LOOP_BLOCK_THRESHOLD,
+        "loop_blocked_events": diagnostics.watchdog.blocked_count,
+        "profile_path_prefix": diagnostics.profile_path_prefix,
+        "profiles": [
+            {k: v for k, v in p.items() if k != 'folded'}
+            for p in reversed(diagnostics.profiles.values())
+        ]
+    }
+
+@api_router.put("/admin/diagnostics", response_model=dict)
+async def update_diagnostics(
+    settings: DiagnosticsSettings,
+    current_user: dict = Depends(get_admin_user)
+):
+    """Toggle profiling of all requests under a path prefix (Admin only)"""
+    _require_diagnostics()
+    diagnostics.profile_path_prefix = settings.profile_path_prefix or None
+    return {"profile_path_prefix": diagnostics.profile_path_prefix}
+
+@api_router.get("/admin/diagnostics/profiles/{profile_id}")
+async def get_profile(
+    profile_id: str,
+    current_user: dict = Depends(get_admin_user)
+):
+    """Download a request profile in folded stack format (Admin only)"""
+    _require_diagnostics()
+    profile = diagnostics.profiles.get(profile_id)
+    if not profile:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Profile not found"
+        )
+    return PlainTextResponse(profile['folded'])
+
+# ==================== Read Replicas ====================
+
+REPLICA_POLL_INTERVAL = float(os.environ.get('REPLICA_POLL_INTERVAL', '0.05'))
+# A replica that has not caught up with the feed for this long stops serving reads
+REPLICA_MAX_STALENESS = float(os.environ.get('REPLICA_MAX_STALENESS', '2'))
+# How long a read waits for the replica to reach the client's X-Min-Version
+REPLICA_WAIT_SECONDS = float(os.environ.get('REPLICA_WAIT_SECONDS', '0.5'))
+# Writes, and reads a replica cannot serve, are redirected here (503 when unset)
+REPLICA_PRIMARY_URL = os.environ.get('REPLICA_PRIMARY_URL', '').rstrip('/')
+# Served by the primary only: live events are published in its process
+PRIMARY_ONLY_PATHS = ('/api/events', '/api/admin/')
+
+class ReplicaFollower:
+    """Tails the primary's change feed and reloads what changed.
+
+    Feed entries are read and the files they name parsed in a worker thread
+    (read), but the results are swapped into the database on the event loop
+    (apply), so handlers and gauges iterating a collection never see it change
+    under them. Collections that are not loaded yet are skipped, since a lazy
+    load reads the current file anyway. A file caught mid-write fails to parse;
+    the entry is retried on the next poll instead of replacing good data.
+    """
+    def __init__(self, path: Path):
+        self.path = path
+        self.offset = 0
+        self.inode = None
+        self.applied_seq = 0
+        self.last_synced = time.monotonic()
+        self.applied = 0
+        self.reloads = 0
+
+    @staticmethod
+    def _load(collection: str, key: Optional[str]) -> Optional[tuple]:
+        """Parse what one feed entry changed (worker thread); None if nothing to reload"""
+        if collection == 'archive':
+            return ('archive', None, None)
+        if collection not in PersistentDB.COLLECTIONS or not database.is_loaded(collection):
+            return None
+        filepath, default, decode = PersistentDB.COLLECTIONS[collection]
+        if collection == 'carts' and key is not None:
+            path = CARTS_DIR / f"{key}.json"
+            cart = CartRecord.from_dict(json.loads(path.read_bytes())) if path.exists() else None
+            return ('carts', key, cart)
+        data = json.loads(filepath.read_bytes()) if filepath.exists() else default()
+        return (collection, None, decode(data) if decode else data)
+
+    def _apply(self, collection: str, key: Optional[str], value):
+        if collection == 'archive':
+            order_archive._index = None
+            _read_archive_block.cache_clear()
+        elif collection == 'carts' and key is not None:
+            if value is not None:
+                database.carts[key] = value
+            else:
+                database.carts.pop(key, None)
+            database.mark_changed('carts')
+        else:
+            setattr(database, collection, value)
+            self.reloads += 1
+
+    def read(self) -> tuple:
+        """Read new feed entries and parse their files; runs in a worker thread.
+
+        Returns (changes, position) for apply(), where position is (inode, offset,
+        applied seq, entries read, caught up); the follower itself is not changed.
+        """
+        try:
+            stat = self.path.stat()
+        except FileNotFoundError:
+            return [], None  # No writes yet
+        if self.inode is None:
+            # Start at the end: collections loaded from now on are already current
+            return [], (stat.st_ino, stat.st_size, _last_feed_seq(self.path), 0, True)
+        inode, offset, seq, applied = self.inode, self.offset, self.applied_seq, 0
+        changes = []
+        if stat.st_ino != inode or stat.st_size < offset:
+            # Rotated: entries may have been missed in between, so reload everything
+            changes = [self._load(name, None) for name in database.loaded_collections()]
+            changes.append(self._load('archive', None))
+            inode, offset = stat.st_ino, 0
+        if stat.st_size > offset:
+            with open(self.path, 'rb') as f:
+                f.seek(offset)
+                data = f.read(stat.st_size - offset)
+            for line in data.splitlines(keepends=True):
+                if not line.endswith(b'\n'):
+                    break  # Partially written entry, read again next time
+                entry = json.loads(line)
+                try:
+                    changes.append(self._load(entry['collection'], entry.get('key')))
+                except (OSError, ValueError) as e:
+                    logger.debug(f"Replica reload of {entry['collection']} deferred: {e}")
+                    return changes, (inode, offset, seq, applied, False)  # Still behind
+                offset += len(line)
+                seq = entry['seq']
+                applied += 1
+        return changes, (inode, offset, seq, applied, True)
+
+    def apply(self, changes: list, position: Optional[tuple]):
+        """Swap parsed changes into the database; runs on the event loop"""
+        for change in changes:
+            if change is not None:
+                self._apply(*change)
+        synced = True
+        if position is not None:
+            self.inode, self.offset, self.applied_seq, applied, synced = position
+            self.applied += applied
+        if synced:
+            self.last_synced = time.monotonic()
+
+    async def poll(self):
+        self.apply(*await run_in_threadpool(self.read))
+
+    def staleness(self) -> float:
+        return time.monotonic() - self.last_synced
+
+    async def wait_for(self, seq: int, timeout: float) -> bool:
+        """Wait until entry seq has been applied; False if it takes longer than timeout"""
+        deadline = time.monotonic() + timeout
+        while self.applied_seq < seq:
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(REPLICA_POLL_INTERVAL / 2)
+        return True
+
+    async def run(self):
+        while True:
+            try:
+                await self.poll()
+            except Exception as e:
+                logger.error(f"Replica feed error: {e}")
+            await asyncio.sleep(REPLICA_POLL_INTERVAL)
+
+replica_follower = ReplicaFollower(CHANGE_FEED_FILE) if IS_REPLICA else None
+
 # ==================== Application Setup ====================
 
+# Event loop lag sampling interval in seconds
+LOOP_LAG_INTERVAL = float(os.environ.get('LOOP_LAG_INTERVAL', 0.5))
+
+async def monitor_loop_lag():
+    """Measure how late the event loop wakes up from a fixed sleep"""
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + LOOP_LAG_INTERVAL
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        metrics.observe_loop_lag(max(0.0, loop.time() - expected))
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Application lifespan events"""
     # Startup
-    try:
-        await connect_to_mongo()
-        logger.info("Database initialized")
-    except Exception as e:
-        logger.error(f"Startup error: {e}")
-        # Vercel'de dosya sistemi sorunları olabilir, devam et
+    if IS_REPLICA:
+        await replica_follower.poll()  # Position at the end of the feed
+        logger.info(f"Read replica following {CHANGE_FEED_FILE.name}")
+    else:
+        try:
+            await connect_to_mongo()
+            logger.info("Database initialized")
+        except Exception as e:
+            logger.error(f"Startup error: {e}")
+            # Vercel'de dosya sistemi sorunları olabilir, devam et
+    
+    if PRELOAD_COLLECTIONS:
+        # Warm the remaining collections off the event loop; requests that need one
+        # earlier simply load it on demand
+        asyncio.get_running_loop().run_in_executor(None, database.preload)
+    
+    loop_lag_task = asyncio.create_task(monitor_loop_lag())
+    suggest_task = asyncio.create_task(suggest_refresher())
+    # Background writers run only where writes happen
+    writer = not IS_REPLICA
+    cart_sweeper_task = asyncio.create_task(cart_sweeper()) if writer and CART_TTL > 0 else None
+    if writer:
+        job_queue.start()
+    archiver_task = asyncio.create_task(order_archiver()) if writer and ARCHIVE_AFTER_DAYS > 0 else None
+    follower_task = asyncio.create_task(replica_follower.run()) if IS_REPLICA else None
+    heartbeat_task = None
+    if DIAGNOSTICS_ENABLED:
+        heartbeat_task = asyncio.create_task(diagnostics.watchdog.beat())
+        diagnostics.watchdog.start()
+        logger.info(f"Diagnostics enabled (loop block threshold {LOOP_BLOCK_THRESHOLD}s)")
     
     yield
     
     # Shutdown
-    try:
-        await close_mongo_connection()
-    except Exception as e:
-        logger.error(f"Shutdown error: {e}")
+    loop_lag_task.cancel()
+    suggest_task.cancel()
+    if cart_sweeper_task is not None:
+        cart_sweeper_task.cancel()
+    job_queue.stop()
+    if archiver_task is not None:
+        archiver_task.cancel()
+    if follower_task is not None:
+        follower_task.cancel()
+    if heartbeat_task is not None:
+        heartbeat_task.cancel()
+        diagnostics.watchdog.stop()
+    if writer:
+        try:
+            await close_mongo_connection()
+        except Exception as e:
+            logger.error(f"Shutdown error: {e}")
 
 # Create FastAPI app
 app = FastAPI(
@@ -1185,6 +4340,402 @@ class SecurityHeadersMiddleware(BaseHTTPMiddleware):
 # Add security headers middleware (before CORS)
 app.add_middleware(SecurityHeadersMiddleware)
 
+# ==================== Response Compression ====================
+
+try:
+    import brotli  # Optional - gzip is always available
+except ImportError:
+    brotli = None
+
+# Responses smaller than this are sent as-is (headers would eat the savings)
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', 1024))
+# Bodies larger than this are compressed in a worker thread to keep the event loop free
+COMPRESSION_THREAD_THRESHOLD = 256 * 1024
+# Memory budget for re-usable compressed bodies
+COMPRESSION_CACHE_BYTES = int(os.environ.get('COMPRESSION_CACHE_BYTES', 8 * 1024 * 1024))
+
+# Compression levels per content type (prefix match). JSON catalogs are highly
+# repetitive, so they get the strongest levels that are still cheap enough per request.
+COMPRESSION_LEVELS = {
+    'application/json': {'br': 5, 'gzip': 6},
+    'application/x-ndjson': {'br': 4, 'gzip': 5},
+    'application/javascript': {'br': 5, 'gzip': 6},
+    'text/csv': {'br': 4, 'gzip': 5},
+    'text/html': {'br': 5, 'gzip': 6},
+    'text/plain': {'br': 4, 'gzip': 6},
+    'text/css': {'br': 5, 'gzip': 6},
+    'image/svg+xml': {'br': 5, 'gzip': 6},
+}
+
+def get_compression_levels(content_type: str) -> Optional[dict]:
+    """Get compression levels for a content type, None if it should not be compressed"""
+    media_type = content_type.split(';', 1)[0].strip().lower()
+    for prefix, levels in COMPRESSION_LEVELS.items():
+        if media_type.startswith(prefix):
+            return levels
+    return None
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """Pick the best supported encoding from an Accept-Encoding header"""
+    qualities = {}
+    for part in accept_encoding.lower().split(','):
+        token, _, params = part.strip().partition(';')
+        if not token:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        qualities[token.strip()] = q
+
+    supported = ['br', 'gzip'] if brotli is not None else ['gzip']
+    wildcard = qualities.get('*')
+    best, best_q = None, 0.0
+    for encoding in supported:
+        q = qualities.get(encoding, wildcard if wildcard is not None else 0.0)
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+def compress_body(body: bytes, encoding: str, level: int) -> bytes:
+    """Compress a response body with the given encoding"""
+    if encoding == 'br':
+        return brotli.compress(body, quality=level)
+    # mtime=0 keeps the output deterministic for identical bodies
+    return gzip.compress(body, compresslevel=level, mtime=0)
+
+class CompressedBodyCache:
+    """LRU cache of compressed bodies keyed by the digest of the raw body.
+
+    Catalog and order listings are served with identical bodies many times in a row,
+    so the compressed bytes are reused instead of being recompressed per request.
+    """
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key) -> Optional[bytes]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value: bytes):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = value
+            self.current_bytes += len(value)
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= len(evicted)
+
+compressed_body_cache = CompressedBodyCache(COMPRESSION_CACHE_BYTES)
+
+async def get_compressed_body(body: bytes, encoding: str, level: int) -> bytes:
+    """Compress a body, reusing a cached result for identical bodies"""
+    key = (hashlib.blake2b(body, digest_size=16).digest(), encoding, level)
+    cached = compressed_body_cache.get(key)
+    if cached is not None:
+        return cached
+    if len(body) >= COMPRESSION_THREAD_THRESHOLD:
+        compressed = await run_in_threadpool(compress_body, body, encoding, level)
+    else:
+        compressed = compress_body(body, encoding, level)
+    compressed_body_cache.put(key, compressed)
+    return compressed
+
+async def compress_stream(chunks, encoding: str, level: int):
+    """Compress a streamed body incrementally, one compressor for the whole stream"""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=level)
+        compress, finish = compressor.process, compressor.finish
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # gzip framing
+        compress, finish = compressor.compress, compressor.flush
+    async for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        output = compress(chunk)
+        if output:
+            yield output
+    yield finish()
+
+class CompressionMiddleware(BaseHTTPMiddleware):
+    """Negotiated gzip/brotli compression.
+
+    Buffered responses are compressed whole (and cached); streaming responses
+    such as CSV/NDJSON exports (no Content-Length) are compressed chunk by chunk.
+    """
+    async def dispatch(self, request: StarletteRequest, call_next):
+        response = await call_next(request)
+
+        levels = get_compression_levels(response.headers.get('content-type', ''))
+        if levels is None or 'content-encoding' in response.headers:
+            return response
+        response.headers.append('Vary', 'Accept-Encoding')
+
+        content_length = response.headers.get('content-length')
+        if content_length is not None and int(content_length) < COMPRESSION_MIN_SIZE:
+            return response
+        encoding = negotiate_encoding(request.headers.get('accept-encoding', ''))
+        if encoding is None:
+            return response
+
+        if content_length is None:
+            streamed = StreamingResponse(
+                compress_stream(response.body_iterator, encoding, levels[encoding]),
+                status_code=response.status_code,
+                background=response.background
+            )
+            streamed.raw_headers = list(response.raw_headers)
+            streamed.headers['Content-Encoding'] = encoding
+            return streamed
+
+        body = b''.join([chunk async for chunk in response.body_iterator])
+        compressed = await get_compressed_body(body, encoding, levels[encoding])
+        if len(compressed) >= len(body):
+            compressed, encoding = body, None
+
+        new_response = Response(
+            content=compressed,
+            status_code=response.status_code,
+            background=response.background
+        )
+        new_response.raw_headers = [
+            (key, value) for key, value in response.raw_headers if key != b'content-length'
+        ]
+        new_response.headers['Content-Length'] = str(len(compressed))
+        if encoding is not None:
+            new_response.headers['Content-Encoding'] = encoding
+        return new_response
+
+app.add_middleware(CompressionMiddleware)
+
+# ==================== Request Metrics ====================
+
+class MetricsMiddleware(BaseHTTPMiddleware):
+    """Record per-route request counts, latency and in-flight requests"""
+    async def dispatch(self, request: StarletteRequest, call_next):
+        metrics.in_flight += 1
+        started = time.perf_counter()
+        status_code = 500
+        try:
+            response = await call_next(request)
+            status_code = response.status_code
+            return response
+        finally:
+            metrics.in_flight -= 1
+            # Use the route template, not the raw path, to keep label cardinality bounded
+            route = request.scope.get('route')
+            route_path = getattr(route, 'path', None) or 'unmatched'
+            metrics.observe_request(request.method, route_path, status_code, time.perf_counter() - started)
+
+app.add_middleware(MetricsMiddleware)
+
+class ReplicationMiddleware(BaseHTTPMiddleware):
+    """Data versions for read-your-writes, and read-only routing on replicas.
+
+    Responses carry X-Data-Version, the last change feed entry they reflect. A
+    client sending it back as X-Min-Version is only served by a replica that
+    has applied that entry; anything a replica cannot serve goes to the primary.
+    """
+    async def dispatch(self, request: StarletteRequest, call_next):
+        if IS_PRIMARY:
+            response = await call_next(request)
+            response.headers['X-Data-Version'] = str(database.change_feed.seq)
+            return response
+
+        path = request.url.path
+        if not path.startswith('/api/'):
+            return await call_next(request)  # Health checks and metrics describe this process
+        if request.method not in ('GET', 'HEAD') or path.startswith(PRIMARY_ONLY_PATHS):
+            return self.to_primary(request)
+        min_version = request.headers.get('x-min-version', '')
+        if min_version.isdigit() and not await replica_follower.wait_for(int(min_version), REPLICA_WAIT_SECONDS):
+            return self.to_primary(request)
+        if replica_follower.staleness() > REPLICA_MAX_STALENESS:
+            return self.to_primary(request)
+        response = await call_next(request)
+        response.headers['X-Data-Version'] = str(replica_follower.applied_seq)
+        return response
+
+    @staticmethod
+    def to_primary(request: StarletteRequest) -> Response:
+        if REPLICA_PRIMARY_URL:
+            url = REPLICA_PRIMARY_URL + request.url.path + (f"?{request.url.query}" if request.url.query else '')
+            return Response(status_code=307, headers={'Location': url})
+        return PlainTextResponse(
+            'Read-only replica', status_code=503, headers={'Retry-After': '1'}
+        )
+
+if IS_PRIMARY or IS_REPLICA:
+    app.add_middleware(ReplicationMiddleware)
+
+class ProfilingMiddleware(BaseHTTPMiddleware):
+    """Sample-profile requests flagged by the X-Profile header or the admin toggle"""
+    async def dispatch(self, request: StarletteRequest, call_next):
+        if not diagnostics.should_profile(
+            request.url.path, request.headers.get('x-profile'), request.headers.get('authorization', '')
+        ):
+            return await call_next(request)
+
+        profiler = SamplingProfiler(threading.get_ident(), PROFILE_SAMPLE_INTERVAL)
+        started = time.perf_counter()
+        profiler.start()
+        try:
+            response = await call_next(request)
+        finally:
+            folded = profiler.stop()
+        profile_id = diagnostics.store_profile(
+            request.method, request.url.path, time.perf_counter() - started, folded
+        )
+        response.headers['X-Profile-Id'] = profile_id
+        return response
+
+if DIAGNOSTICS_ENABLED:
+    app.add_middleware(ProfilingMiddleware)
+
+def _collection_sizes() -> dict:
+    # Only loaded collections: scraping must not force cold collections into memory
+    return {
+        f'collection="{name}"': len(getattr(database, name))
+        for name in database.loaded_collections()
+    }
+
+metrics.register_gauge('db_collection_size', 'Number of records per collection', _collection_sizes)
+metrics.register_gauge(
+    'bcrypt_pool_queue_depth', 'bcrypt operations waiting for a worker',
+    lambda: {'': bcrypt_pool_stats["queued"]}
+)
+metrics.register_gauge(
+    'bcrypt_pool_running', 'bcrypt operations currently running',
+    lambda: {'': bcrypt_pool_stats["running"]}
+)
+metrics.register_gauge(
+    'compression_cache_bytes', 'Bytes held by the compressed body cache',
+    lambda: {'': compressed_body_cache.current_bytes}
+)
+
+metrics.register_gauge(
+    'carts_in_memory', 'Carts held in memory',
+    lambda: {'': len(database.carts)} if database.is_loaded('carts') else {}
+)
+metrics.register_gauge(
+    'cart_lines_in_memory', 'Cart lines held in memory',
+    lambda: {'': sum(len(c.items) for c in database.carts.values())} if database.is_loaded('carts') else {}
+)
+metrics.register_gauge(
+    'cart_evictions_total', 'Abandoned carts archived and evicted since startup',
+    lambda: {'': cart_sweep_stats["evicted"]}
+)
+metrics.register_gauge(
+    'cart_archive_bytes_total', 'Compressed bytes appended to the cart archive since startup',
+    lambda: {'': cart_sweep_stats["archived_bytes"]}
+)
+metrics.register_gauge(
+    'cart_sweep_duration_seconds', 'Duration of the last cart sweep',
+    lambda: {'': cart_sweep_stats["last_duration"]}
+)
+
+metrics.register_gauge(
+    'singleflight_leader_requests_total', 'Requests that computed a coalescable response',
+    lambda: {f'route="{name}"': s["leaders"] for name, s in single_flight.stats.items()}
+)
+metrics.register_gauge(
+    'singleflight_coalesced_requests_total', 'Requests served by an identical in-flight computation',
+    lambda: {f'route="{name}"': s["coalesced"] for name, s in single_flight.stats.items()}
+)
+
+metrics.register_gauge(
+    'rate_limited_requests_total', 'Requests rejected by a rate limit budget',
+    lambda: {f'budget="{name}"': count for name, count in rate_limited_counts.items()}
+)
+metrics.register_gauge(
+    'rate_limit_buckets', 'Token buckets currently stored',
+    lambda: {'': len(bucket_store)} if isinstance(bucket_store, MemoryBucketStore) else {}
+)
+
+metrics.register_gauge(
+    'collection_snapshot_builds_total', 'Collection snapshots copied for readers',
+    lambda: {f'collection="{name}"': count for name, count in database.snapshot_builds.items()}
+)
+metrics.register_gauge(
+    'collection_saves_superseded_total', 'Saves dropped because a newer snapshot was already written',
+    lambda: {f'collection="{name}"': count for name, count in database.superseded_saves.items()}
+)
+metrics.register_gauge(
+    'change_feed_seq', 'Last change feed entry written (primary) or applied (replica)',
+    lambda: {'': database.change_feed.seq} if IS_PRIMARY
+    else {'': replica_follower.applied_seq} if IS_REPLICA else {}
+)
+metrics.register_gauge(
+    'replica_staleness_seconds', 'Time since the replica last caught up with the change feed',
+    lambda: {'': replica_follower.staleness()} if IS_REPLICA else {}
+)
+metrics.register_gauge(
+    'replica_reloads_total', 'Collections reloaded from the change feed',
+    lambda: {'': replica_follower.reloads} if IS_REPLICA else {}
+)
+metrics.register_gauge(
+    'archived_records_total', 'Orders and returns moved to the archive by this process',
+    lambda: {f'collection="{name}"': archive_stats[name] for name in ARCHIVE_STATUSES}
+)
+metrics.register_gauge(
+    'archive_bytes_written_total', 'Compressed bytes appended to archive segments',
+    lambda: {'': archive_stats["bytes"]}
+)
+metrics.register_gauge(
+    'archive_run_duration_seconds', 'Duration of the last archive run',
+    lambda: {'': archive_stats["last_duration"]}
+)
+metrics.register_gauge(
+    'jobs', 'Background jobs by status',
+    lambda: {f'status="{name}"': count for name, count in job_queue.counts().items()}
+    if database.is_loaded('jobs') else {}
+)
+metrics.register_gauge(
+    'jobs_completed_total', 'Background jobs that succeeded',
+    lambda: {'': job_queue.completed}
+)
+metrics.register_gauge(
+    'job_attempts_failed_total', 'Background job attempts that raised',
+    lambda: {'': job_queue.failed_attempts}
+)
+metrics.register_gauge(
+    'event_subscribers', 'Connected /api/events streams',
+    lambda: {'': len(event_broker.subscribers)}
+)
+metrics.register_gauge(
+    'events_published_total', 'Status change events published',
+    lambda: {'': event_broker.published}
+)
+metrics.register_gauge(
+    'event_subscribers_dropped_total', 'Event streams closed for falling behind',
+    lambda: {'': event_broker.dropped}
+)
+
+metrics.register_gauge(
+    'event_loop_blocked_events', 'Event loop stalls caught by the diagnostics watchdog',
+    lambda: {'': diagnostics.watchdog.blocked_count}
+)
+
+# Optional bearer token protecting /metrics (leave unset for an internal scraper)
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
 # CORS Configuration - Optimized for https://chenki-hrra.vercel.app/ and all devices
 def get_cors_origins():
     """Get CORS origins from environment or use defaults"""
@@ -1246,9 +4797,24 @@ async def health_check():
         "status": "healthy",
         "timestamp": datetime.now(timezone.utc).isoformat(),
         "frontend_url": "https://chenki-hrra.vercel.app/",
-        "api_version": "1.0.0"
+        "api_version": "1.0.0",
+        "role": SERVER_ROLE,
+        **({"replica": {
+            "applied_seq": replica_follower.applied_seq,
+            "staleness_seconds": round(replica_follower.staleness(), 3)
+        }} if IS_REPLICA else {})
     }
 
+@app.get("/metrics")
+async def get_metrics(request: Request):
+    """Prometheus metrics endpoint"""
+    if METRICS_TOKEN and request.headers.get('authorization') != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid metrics token"
+        )
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     import uvicorn
     # Run on all interfaces (0.0.0.0) to allow access from all devices
@@ -0,0 +1,72 @@
+import { useEffect, useRef } from 'react';
+import axios from 'axios';
+
+const BACKEND_URL = process.env.REACT_APP_BACKEND_URL || "http://127.0.0.1:8000";
+const API = `${BACKEND_URL}/api`;
+const RECONNECT_DELAY = 3000;
+
+const EVENT_TYPES = [
+  'order.status',
+  'payment.succeeded',
+  'shipping.created',
+  'shipping.status',
+  'return.created',
+  'return.status',
+  'resync'
+];
+
+// Subscribe to /api/events. The stream is opened with a single-use ticket (never the JWT in
+// the URL), so reconnects are done here: fetch a new ticket and resume from the last event id.
+export function useOrderEvents(onEvent) {
+  const handler = useRef(onEvent);
+  handler.current = onEvent;
+
+  useEffect(() => {
+    const token = localStorage.getItem('token');
+    if (!token || typeof EventSource === 'undefined') return undefined;
+
+    let source = null;
+    let retryTimer = null;
+    let lastEventId = null;
+    let closed = false;
+
+    const scheduleReconnect = () => {
+      if (!closed) retryTimer = setTimeout(connect, RECONNECT_DELAY);
+    };
+
+    const connect = async () => {
+      let ticket;
+      try {
+        const response = await axios.post(`${API}/events/ticket`, null, {
+          headers: { Authorization: `Bearer ${token}` }
+        });
+        ticket = response.data.ticket;
+      } catch (error) {
+        scheduleReconnect();
+        return;
+      }
+      if (closed) return;
+
+      const params = new URLSearchParams({ ticket });
+      if (lastEventId) params.append('last_event_id', lastEventId);
+      source = new EventSource(`${API}/events?${params.toString()}`);
+      const listener = (event) => {
+        if (event.lastEventId) lastEventId = event.lastEventId;
+        handler.current(event.type, JSON.parse(event.data || '{}'));
+      };
+      EVENT_TYPES.forEach(type => source.addEventListener(type, listener));
+      source.onerror = () => {
+        // The ticket is spent, so EventSource's own retry would be rejected
+        source.close();
+        scheduleReconnect();
+      };
+    };
+
+    connect();
+    return () => {
+      closed = true;
+      clearTimeout(retryTimer);
+      if (source) source.close();
+    };
+  }, []);
+}
@@ -0,0 +1,27 @@
+import axios from "axios";
+
+/**
+ * Read-your-writes across read replicas: every write response carries the
+ * X-Data-Version it produced, and later reads send it back as X-Min-Version so
+ * a replica that has not caught up yet hands the request to the primary.
+ */
+const STORAGE_KEY = "minDataVersion";
+
+let minVersion = Number(sessionStorage.getItem(STORAGE_KEY)) || 0;
+
+axios.interceptors.request.use((config) => {
+  if (minVersion && (config.method || "get").toLowerCase() === "get") {
+    config.headers["X-Min-Version"] = String(minVersion);
+  }
+  return config;
+});
+
+axios.interceptors.response.use((response) => {
+  const version = Number(response.headers["x-data-version"]);
+  const method = (response.config.method || "get").toLowerCase();
+  if (method !== "get" && version > minVersion) {
+    minVersion = version;
+    sessionStorage.setItem(STORAGE_KEY, String(version));
+  }
+  return response;
+});
@@ -10,6 +10,7 @@ import { Textarea } from '@/components/ui/textarea';
 import { Dialog, DialogContent, DialogHeader, DialogTitle, DialogTrigger } from '@/components/ui/dialog';
 import { Tabs, TabsContent, TabsList, TabsTrigger } from '@/components/ui/tabs';
 import GlassButton from '@/components/GlassButton';
+import { useOrderEvents } from '@/hooks/use-order-events';
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
@@ -35,6 +36,14 @@ const AdminDashboard = ({ user }) => {
     fetchOrders();
   }, []);
 
+  useOrderEvents((type, data) => {
+    if (type === 'resync') {
+      fetchOrders();
+    } else if (type === 'order.status') {
+      setOrders(prev => prev.map(order => order.id === data.order_id ? { ...order, status: data.status } : order));
+    }
+  });
+
   const fetchProducts = async () => {
     try {
       const response = await axios.get(`${API}/products`);
@@ -146,7 +155,7 @@ const AdminDashboard = ({ user }) => {
         headers: { Authorization: `Bearer ${token}` }
       });
       toast.success('Order status updated');
-      fetchOrders();
+      setOrders(prev => prev.map(order => order.id === orderId ? { ...order, status } : order));
     } catch (error) {
       console.error('Error updating order:', error);
       toast.error('Failed to update order');
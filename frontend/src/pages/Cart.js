@@ -61,7 +61,7 @@ const Cart = ({ user }) => {
     }
   };
 
-  const updateQuantity = async (productId, newQuantity) => {
+  const updateQuantity = async (productId, newQuantity, variantId) => {
     try {
       const token = localStorage.getItem('token');
       if (!token) {
@@ -70,7 +70,7 @@ const Cart = ({ user }) => {
       }
       
       await axios.put(
-        `${API}/cart/${productId}?quantity=${newQuantity}`,
+        `${API}/cart/${productId}?quantity=${newQuantity}${variantId ? `&variant_id=${variantId}` : ''}`,
         {},
         { 
           headers: { 
@@ -93,11 +93,13 @@ const Cart = ({ user }) => {
     }
   };
 
-  const removeItem = async (productId) => {
-    await updateQuantity(productId, 0);
+  const removeItem = async (productId, variantId) => {
+    await updateQuantity(productId, 0, variantId);
   };
 
   const calculateTotal = () => {
+    // The server prices the cart from the catalog
+    if (cart.total !== undefined) return cart.total;
     return cart.items?.reduce((total, item) => total + (item.price * item.quantity), 0) || 0;
   };
 
@@ -153,7 +155,7 @@ const Cart = ({ user }) => {
                 if (!product) return null;
 
                 return (
-                  <div key={item.product_id} className="luxury-card rounded-lg p-6" data-testid={`cart-item-${item.product_id}`}>
+                  <div key={`${item.product_id}:${item.variant_id || ''}`} className="luxury-card rounded-lg p-6" data-testid={`cart-item-${item.product_id}`}>
                     <div className="flex items-center space-x-6">
                       <img
                         src={getImageUrl(product.image_url)}
@@ -172,7 +174,7 @@ const Cart = ({ user }) => {
                       <div className="flex items-center space-x-3">
                         <Button
                           data-testid={`decrease-${item.product_id}`}
-                          onClick={() => updateQuantity(item.product_id, item.quantity - 1)}
+                          onClick={() => updateQuantity(item.product_id, item.quantity - 1, item.variant_id)}
                           variant="outline"
                           size="icon"
                           className="border-[#8b4513] text-[#8b4513]"
@@ -182,7 +184,7 @@ const Cart = ({ user }) => {
                         <span data-testid={`quantity-${item.product_id}`} className="text-lg font-semibold w-8 text-center">{item.quantity}</span>
                         <Button
                           data-testid={`increase-${item.product_id}`}
-                          onClick={() => updateQuantity(item.product_id, item.quantity + 1)}
+                          onClick={() => updateQuantity(item.product_id, item.quantity + 1, item.variant_id)}
                           variant="outline"
                           size="icon"
                           className="border-[#8b4513] text-[#8b4513]"
@@ -192,7 +194,7 @@ const Cart = ({ user }) => {
                       </div>
                       <Button
                         data-testid={`remove-${item.product_id}`}
-                        onClick={() => removeItem(item.product_id)}
+                        onClick={() => removeItem(item.product_id, item.variant_id)}
                         variant="ghost"
                         size="icon"
                         className="text-red-500 hover:text-red-700"
@@ -17,8 +17,10 @@ const Home = ({ user }) => {
   const navigate = useNavigate();
   const [products, setProducts] = useState([]);
   const [categories, setCategories] = useState([]);
+  const [priceBounds, setPriceBounds] = useState({ min: null, max: null });
   const [selectedCategory, setSelectedCategory] = useState('');
   const [searchQuery, setSearchQuery] = useState('');
+  const [suggestions, setSuggestions] = useState([]);
   const [priceRange, setPriceRange] = useState({ min: '', max: '' });
   const [loading, setLoading] = useState(true);
 
@@ -27,6 +29,39 @@ const Home = ({ user }) => {
     fetchCategories();
   }, []);
 
+  // Search-as-you-type: debounced, and stale answers are dropped when the query moves on
+  useEffect(() => {
+    const query = searchQuery.trim();
+    if (!query) {
+      setSuggestions([]);
+      return undefined;
+    }
+    let cancelled = false;
+    const timer = setTimeout(async () => {
+      try {
+        const response = await axios.get(`${API}/products/suggest`, { params: { q: query, limit: 8 } });
+        if (!cancelled) setSuggestions(response.data);
+      } catch (error) {
+        if (!cancelled) setSuggestions([]);
+      }
+    }, 120);
+    return () => {
+      cancelled = true;
+      clearTimeout(timer);
+    };
+  }, [searchQuery]);
+
+  const selectSuggestion = (suggestion) => {
+    setSuggestions([]);
+    if (suggestion.type === 'product') {
+      navigate(`/product/${suggestion.product_id}`);
+      return;
+    }
+    setSearchQuery('');
+    setSelectedCategory(suggestion.text);
+    fetchProducts({ category: suggestion.text, min_price: priceRange.min, max_price: priceRange.max });
+  };
+
   const fetchProducts = async (filters = {}) => {
     try {
       const params = new URLSearchParams();
@@ -47,8 +82,10 @@ const Home = ({ user }) => {
 
   const fetchCategories = async () => {
     try {
-      const response = await axios.get(`${API}/categories`);
-      setCategories(response.data);
+      // One request gives names, counts and price ranges for the filters
+      const response = await axios.get(`${API}/facets`);
+      setCategories(response.data.categories);
+      setPriceBounds(response.data.price_range);
     } catch (error) {
       console.error('Error fetching categories:', error);
     }
@@ -88,8 +125,7 @@ const Home = ({ user }) => {
         `${API}/cart`,
         {
           product_id: product.id,
-          quantity: 1,
-          price: product.price
+          quantity: 1
         },
         {
           headers: { 
@@ -221,8 +257,32 @@ const Home = ({ user }) => {
                 value={searchQuery}
                 onChange={(e) => setSearchQuery(e.target.value)}
                 className="pl-10 luxury-input"
-                onKeyPress={(e) => e.key === 'Enter' && handleFilter()}
+                onKeyPress={(e) => {
+                  if (e.key === 'Enter') {
+                    setSuggestions([]);
+                    handleFilter();
+                  }
+                }}
+                onBlur={() => setTimeout(() => setSuggestions([]), 150)}
+                autoComplete="off"
               />
+              {suggestions.length > 0 && (
+                <ul
+                  data-testid="search-suggestions"
+                  className="absolute left-0 right-0 top-full mt-1 z-20 bg-white rounded-md shadow-lg border border-[#8b4513]/10 overflow-hidden"
+                >
+                  {suggestions.map(suggestion => (
+                    <li
+                      key={`${suggestion.type}:${suggestion.product_id || suggestion.text}`}
+                      className="px-4 py-2 text-sm cursor-pointer hover:bg-[#8b4513]/5 flex justify-between"
+                      onMouseDown={() => selectSuggestion(suggestion)}
+                    >
+                      <span>{suggestion.text}</span>
+                      {suggestion.type === 'category' && <span className="text-gray-400">Category</span>}
+                    </li>
+                  ))}
+                </ul>
+              )}
             </div>
             
             <Select value={selectedCategory} onValueChange={setSelectedCategory}>
@@ -232,14 +292,16 @@ const Home = ({ user }) => {
               <SelectContent>
                 <SelectItem value="all">All Categories</SelectItem>
                 {categories.map(cat => (
-                  <SelectItem key={cat} value={cat}>{cat}</SelectItem>
+                  <SelectItem key={cat.name} value={cat.name}>
+                    {cat.name} ({cat.product_count})
+                  </SelectItem>
                 ))}
               </SelectContent>
             </Select>
             
             <Input
               data-testid="min-price-input"
-              placeholder="Min Price"
+              placeholder={priceBounds.min != null ? `Min Price (${priceBounds.min})` : 'Min Price'}
               type="number"
               value={priceRange.min}
               onChange={(e) => setPriceRange({ ...priceRange, min: e.target.value })}
@@ -248,7 +310,7 @@ const Home = ({ user }) => {
             
             <Input
               data-testid="max-price-input"
-              placeholder="Max Price"
+              placeholder={priceBounds.max != null ? `Max Price (${priceBounds.max})` : 'Max Price'}
               type="number"
               value={priceRange.max}
               onChange={(e) => setPriceRange({ ...priceRange, max: e.target.value })}
@@ -5,6 +5,7 @@ import { ArrowLeft, Package, Truck, RefreshCw } from 'lucide-react';
 import { toast } from 'sonner';
 import { Badge } from '@/components/ui/badge';
 import { Button } from '@/components/ui/button';
+import { useOrderEvents } from '@/hooks/use-order-events';
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL || "http://127.0.0.1:8000";
 const API = `${BACKEND_URL}/api`;
@@ -19,24 +20,30 @@ const Orders = ({ user }) => {
     fetchOrders();
   }, []);
 
-  useEffect(() => {
-    // Fetch shipping info for all orders
-    if (orders.length > 0) {
-      orders.forEach(order => {
-        if (order.status === 'shipped' || order.status === 'delivered') {
-          fetchShippingInfo(order.id);
-        }
-      });
+  // Status changes arrive live instead of refetching the whole list
+  useOrderEvents((type, data) => {
+    if (type === 'resync') {
+      fetchOrders();
+    } else if (type === 'order.status') {
+      setOrders(prev => prev.map(order => order.id === data.order_id ? { ...order, status: data.status } : order));
+    } else if (type === 'shipping.created' || type === 'shipping.status') {
+      setShippingInfo(prev => ({ ...prev, [data.order_id]: { ...prev[data.order_id], ...data } }));
     }
-  }, [orders]);
+  });
 
   const fetchOrders = async () => {
     try {
       const token = localStorage.getItem('token');
-      const response = await axios.get(`${API}/orders`, {
+      // Shipping info comes embedded, instead of one request per order
+      const response = await axios.get(`${API}/orders?include=shipping`, {
         headers: { Authorization: `Bearer ${token}` }
       });
       setOrders(response.data);
+      const shipping = {};
+      response.data.forEach(order => {
+        if (order.shipping) shipping[order.id] = order.shipping;
+      });
+      setShippingInfo(shipping);
       setLoading(false);
     } catch (error) {
       console.error('Error fetching orders:', error);
@@ -45,19 +52,6 @@ const Orders = ({ user }) => {
     }
   };
 
-  const fetchShippingInfo = async (orderId) => {
-    try {
-      const token = localStorage.getItem('token');
-      const response = await axios.get(`${API}/shipping/${orderId}`, {
-        headers: { Authorization: `Bearer ${token}` }
-      });
-      setShippingInfo(prev => ({ ...prev, [orderId]: response.data }));
-    } catch (error) {
-      // Shipping info might not exist yet
-      console.log('Shipping info not found for order:', orderId);
-    }
-  };
-
   const handleTrackOrder = (orderId) => {
     const shipping = shippingInfo[orderId];
     if (shipping && shipping.tracking_number) {
@@ -51,8 +51,7 @@ const ProductDetail = ({ user }) => {
         `${API}/cart`,
         {
           product_id: product.id,
-          quantity: quantity,
-          price: product.price
+          quantity: quantity
         },
         {
           headers: { 
@@ -0,0 +1,31 @@
+"""
+Shared fixtures: server.py is imported once against a throwaway DATA_DIR,
+with rate limits off so tests are not throttled by each other.
+"""
+
+from pathlib import Path
+import os
+import sys
+import tempfile
+
+import pytest
+
+BACKEND_DIR = Path(__file__).parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="chenki-tests-"))
+os.environ.setdefault("RATE_LIMIT_ENABLED", "0")
+
+import server  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+@pytest.fixture(scope="session")
+def client():
+    # Entering the client runs the lifespan: admin user and sample products are seeded
+    with TestClient(server.app) as c:
+        yield c
+
+@pytest.fixture(scope="session")
+def admin_headers(client):
+    response = client.post("/api/auth/login", json={"email": "admin@chenki.com", "password": "admin123"})
+    return {"Authorization": f"Bearer {response.json()['token']}"}
@@ -0,0 +1,64 @@
+import uuid
+
+from anyio import from_thread
+
+import server
+
+def _old_order(status="delivered", amount=10.0):
+    order = server.OrderRecord.from_dict({
+        "id": str(uuid.uuid4()), "user_id": "u-archive", "status": status, "total_amount": amount,
+        "items": [{"product_id": "p-archive", "quantity": 1, "price": amount}],
+        "created_at": "2000-01-15T00:00:00+00:00"
+    })
+    server.database.orders.append(order)
+    server.database.mark_changed("orders")
+    return order
+
+def _delivered_archived():
+    return server.order_archive.stats.get("order_status", {}).get("delivered", 0)
+
+def test_record_changed_during_archive_write_stays_hot(client, monkeypatch):
+    changed, untouched = _old_order(), _old_order()
+    append = server.order_archive.append
+
+    def append_while_admin_edits(collection, records):
+        written = append(collection, records)
+        if collection == "orders":
+            # Lands on the event loop while the archive write is in flight
+            from_thread.run_sync(server.database.replace_record, "orders", changed, {"status": "processing"})
+        return written
+
+    monkeypatch.setattr(server.order_archive, "append", append_while_admin_edits)
+    delivered_before = _delivered_archived()
+    moved = client.portal.call(server.archive_old_records)
+
+    assert moved["orders"] == 1
+    assert server.find_order(changed["id"])["status"] == "processing"
+    assert server.order_archive.get("orders", changed["id"]) is None
+    assert server.find_order(untouched["id"]) is None
+    assert server.order_archive.get("orders", untouched["id"])["status"] == "delivered"
+    assert _delivered_archived() == delivered_before + 1
+
+def test_append_skips_already_archived_ids(client):
+    order = _old_order(amount=7.0)
+    server._analytics_index = None
+    before = server.get_analytics_index().state()
+
+    # As if a crash hit between the archive write and the hot save: the order is in both tiers
+    payload = order.to_dict()
+    server.order_archive.append("orders", [payload])
+    entry = server.order_archive.index["orders"][order["id"]]
+    stats = server.order_archive.stats["order_status"]["delivered"]
+    assert server.order_archive.append("orders", [payload]) == 0
+    assert server.order_archive.index["orders"][order["id"]] == entry
+    assert server.order_archive.stats["order_status"]["delivered"] == stats
+
+    server._analytics_index = None
+    after = server.get_analytics_index().state()
+    assert after["order_status"]["delivered"] == before["order_status"]["delivered"]
+    assert after["revenue"] == before["revenue"]
+
+    # The next run finishes the move without counting the order again
+    client.portal.call(server.archive_old_records)
+    assert server.find_order(order["id"]) is None
+    assert server.order_archive.stats["order_status"]["delivered"] == stats
@@ -0,0 +1,62 @@
+from datetime import datetime, timezone
+import json
+import subprocess
+import sys
+
+from benchmarks import datasets
+from benchmarks.run_api import BACKEND_DIR, compare, percentile, record_baselines
+
+def test_generate_is_deterministic_and_consistent():
+    now = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    data = datasets.generate("1k", seed=7, now=now)
+    assert datasets.generate("1k", seed=7, now=now)["products"] == data["products"]
+    assert len(data["products"]) == datasets.SIZES["1k"]["products"]
+    product_ids = {p["id"] for p in data["products"]}
+    for order in data["orders"][:50]:
+        assert order["user_id"] in data["users"]
+        assert all(item["product_id"] in product_ids for item in order["items"])
+
+def test_write_round_trips(tmp_path):
+    data = datasets.generate("1k", seed=1)
+    datasets.write(data, tmp_path)
+    assert json.loads((tmp_path / "products.json").read_text(encoding="utf-8")) == data["products"]
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert percentile([], 95) == 0.0
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile(values, 100) == 100
+    assert percentile([5], 1) == 5
+
+def test_compare_flags_regressions_beyond_tolerance():
+    baselines = {"inprocess/1k/search": {"throughput_rps": 100.0, "p95_ms": 10.0, "p99_ms": 20.0}}
+    ok = {"search": {"throughput_rps": 90.0, "p95_ms": 12.0, "p99_ms": 24.0}}
+    assert compare(ok, baselines, "inprocess/1k", 0.25) == []
+    slow = {"search": {"throughput_rps": 50.0, "p95_ms": 30.0, "p99_ms": 20.0}}
+    regressions = compare(slow, baselines, "inprocess/1k", 0.25)
+    assert len(regressions) == 2
+    assert compare(slow, {}, "inprocess/1k", 0.25) == []  # No baseline, nothing to compare
+
+def test_record_baselines(tmp_path):
+    path = tmp_path / "baselines.json"
+    baselines = {}
+    record_baselines(baselines, {"search": {"throughput_rps": 1.0, "p95_ms": 2.0}}, "inprocess/1k", ["search"], path)
+    assert json.loads(path.read_text())["inprocess/1k/search"]["p95_ms"] == 2.0
+
+def test_inprocess_scenario_records_then_compares(tmp_path):
+    baseline_file = tmp_path / "baselines.json"
+    output = tmp_path / "report.json"
+    command = [
+        sys.executable, "-m", "benchmarks.run_api", "--size", "1k", "--mode", "inprocess",
+        "--scenario", "browse_catalog", "--iterations", "16", "--concurrency", "2",
+        "--baseline-file", str(baseline_file), "--output", str(output),
+        "--data-dir", str(tmp_path / "data"),
+    ]
+    # Run outside this process: server.py binds DATA_DIR at import time
+    first = subprocess.run(command, cwd=BACKEND_DIR, capture_output=True, text=True)
+    assert first.returncode == 0, first.stdout + first.stderr
+    assert "Recorded first baselines" in first.stdout
+    result = json.loads(output.read_text())["inprocess/1k"]["browse_catalog"]
+    assert result["requests"] > 0 and result["errors"] == 0
+    assert "inprocess/1k/browse_catalog" in json.loads(baseline_file.read_text())
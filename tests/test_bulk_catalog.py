@@ -0,0 +1,66 @@
+import json
+import threading
+import uuid
+
+import server
+
+def _product(**overrides):
+    return {"name": "Bulk Bot", "description": "x", "price": 100, "category": "Bot", "image_url": "x", "stock": 3,
+            **overrides}
+
+def _ids(prefix):
+    return [f"{prefix}-{uuid.uuid4().hex[:8]}" for _ in range(2)]
+
+def _exists(product_id):
+    return any(p["id"] == product_id for p in server.database.products)
+
+def test_atomic_batch_rolls_back_on_one_bad_row(client, admin_headers):
+    good, bad = _ids("atomic")
+    response = client.post("/api/admin/catalog/bulk", headers=admin_headers, json={"operations": [
+        {"op": "upsert", "type": "product", "id": good, "data": _product()},
+        {"op": "upsert", "type": "product", "id": bad, "data": _product(price="free")},
+    ]})
+    body = response.json()
+    assert response.status_code == 200
+    assert (body["applied"], body["errors"]) == (False, 1)
+    assert body["results"][0]["status"] == "created"
+    assert body["results"][1]["status"] == "error" and "price" in body["results"][1]["error"]
+    assert not _exists(good) and not _exists(bad)
+
+def test_dry_run_validates_off_the_loop_without_writing(client, admin_headers, monkeypatch):
+    threads = []
+    stage = server.CatalogBatch.stage
+    monkeypatch.setattr(server.CatalogBatch, "stage", lambda *args: (threads.append(threading.current_thread()), stage(*args))[1])
+    product_id, _ = _ids("dry")
+    version = server.database.versions["products"]
+    response = client.post("/api/admin/catalog/bulk", params={"dry_run": True}, headers=admin_headers, json={
+        "operations": [{"op": "upsert", "type": "product", "id": product_id, "data": _product()}]
+    })
+    body = response.json()
+    assert (body["applied"], body["errors"], body["results"][0]["status"]) == (False, 0, "created")
+    assert not _exists(product_id)
+    assert server.database.versions["products"] == version
+    assert threads and threads[0] is not threading.main_thread()
+
+def test_ndjson_reports_invalid_lines_per_row(client, admin_headers):
+    first, second = _ids("ndjson")
+    lines = [
+        json.dumps({"op": "upsert", "type": "product", "id": first, "data": _product()}),
+        '{"op": "upsert", "type": ',
+        json.dumps({"op": "upsert", "type": "product", "id": second, "data": _product()}),
+    ]
+    response = client.post(
+        "/api/admin/catalog/bulk", params={"atomic": False}, content="\n".join(lines) + "\n",
+        headers={**admin_headers, "Content-Type": "application/x-ndjson"}
+    )
+    body = response.json()
+    assert (body["applied"], body["total"], body["errors"]) == (True, 3, 1)
+    assert body["results"][1]["line"] == 2
+    assert body["results"][1]["error"].startswith("Invalid JSON")
+    assert _exists(first) and _exists(second)
+
+def test_too_many_rows_is_413(client, admin_headers, monkeypatch):
+    monkeypatch.setattr(server, "BULK_MAX_ROWS", 2)
+    operations = [{"op": "delete", "type": "product", "id": product_id} for product_id in _ids("limit") * 2]
+    response = client.post("/api/admin/catalog/bulk", headers=admin_headers, json={"operations": operations})
+    assert response.status_code == 413
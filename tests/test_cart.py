@@ -0,0 +1,91 @@
+import json
+import threading
+import uuid
+
+import server
+
+def _user(client):
+    response = client.post("/api/auth/register", json={
+        "email": f"cart-{uuid.uuid4().hex[:8]}@example.com", "name": "Sepet", "password": "secret123"
+    })
+    return {"Authorization": f"Bearer {response.json()['token']}"}
+
+def _new_product(client, admin_headers, price=100.0):
+    return client.post("/api/products", headers=admin_headers, json={
+        "name": "Sepet Bot", "description": "x", "price": price, "category": "Bot", "image_url": "x", "stock": 5
+    }).json()
+
+def test_cart_is_priced_from_the_catalog(client, admin_headers):
+    headers = _user(client)
+    product = _new_product(client, admin_headers, price=100.0)
+    # No price in the request; the cart uses the catalog price
+    assert client.post("/api/cart", headers=headers, json={"product_id": product["id"], "quantity": 2}).status_code == 200
+    assert client.get("/api/cart", headers=headers).json()["total"] == 200.0
+
+    client.put(f"/api/products/{product['id']}", headers=admin_headers, json={
+        **{k: product[k] for k in ("name", "description", "category", "image_url", "stock")}, "price": 150.0
+    })
+    cart = client.get("/api/cart", headers=headers).json()
+    assert cart["items"][0]["price"] == 150.0
+    assert cart["total"] == 300.0
+
+def test_unknown_product_is_404(client):
+    headers = _user(client)
+    response = client.post("/api/cart", headers=headers, json={"product_id": "missing", "quantity": 1})
+    assert response.status_code == 404
+
+def test_cart_changes_of_one_user_are_serialized(client, admin_headers, monkeypatch):
+    headers = _user(client)
+    product = _new_product(client, admin_headers)
+    user_id = client.get("/api/auth/me", headers=headers).json()["id"]
+    gates = []
+    save_cart = server.database.save_cart
+
+    def gated_save(uid):
+        gate = threading.Event()
+        gates.append(gate)
+        gate.wait(5)
+        save_cart(uid)
+
+    def add():
+        client.post("/api/cart", headers=headers, json={"product_id": product["id"], "quantity": 1})
+
+    monkeypatch.setattr(server.database, "save_cart", gated_save)
+    first, second = threading.Thread(target=add), threading.Thread(target=add)
+    first.start()
+    while not gates:
+        threading.Event().wait(0.01)
+    second.start()
+    threading.Event().wait(0.2)
+    # The second add waits for the first one's save instead of changing the cart under it
+    assert len(gates) == 1
+    assert server.database.carts[user_id].items[(product["id"], None)].quantity == 1
+    gates[0].set()
+    first.join()
+    while len(gates) < 2:
+        threading.Event().wait(0.01)
+    gates[1].set()
+    second.join()
+    assert server.database.carts[user_id].items[(product["id"], None)].quantity == 2
+
+def test_legacy_carts_file_migrates_to_per_user_files(client):
+    legacy = {
+        "legacy-a": {"id": "ca", "user_id": "legacy-a", "items": [{"product_id": "p1", "quantity": 1, "price": 5.0}],
+                     "updated_at": "2026-01-01T00:00:00+00:00"},
+        "legacy-b": {"id": "cb-old", "user_id": "legacy-b", "items": [], "updated_at": "2026-01-01T00:00:00+00:00"},
+    }
+    server.database.save_carts()  # Carts of earlier tests go to their own files first
+    server.CARTS_FILE.write_text(json.dumps(legacy))
+    newer = {**legacy["legacy-b"], "id": "cb-new"}
+    (server.CARTS_DIR / "legacy-b.json").write_text(json.dumps(newer))
+
+    server.database.preload("carts", reload=True)
+    assert server.database.carts["legacy-a"]["items"][("p1", None)].quantity == 1
+    assert server.database.carts["legacy-b"]["id"] == "cb-new"  # Per-user files win over carts.json
+
+    server.database.save_cart("legacy-a")  # The first cart save migrates them all
+    assert not server.CARTS_FILE.exists()
+    assert server.CARTS_FILE.with_name("carts.json.migrated").exists()
+    assert json.loads((server.CARTS_DIR / "legacy-a.json").read_text())["id"] == "ca"
+    server.database.preload("carts", reload=True)
+    assert set(legacy) <= set(server.database.carts)
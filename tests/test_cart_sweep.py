@@ -0,0 +1,20 @@
+import asyncio
+import json
+
+import server
+
+def test_sweep_publishes_evictions_to_change_feed(client, monkeypatch, tmp_path):
+    feed = server.ChangeFeed(tmp_path / "changes.log", 1 << 20)
+    monkeypatch.setattr(server.database, "change_feed", feed)
+    monkeypatch.setattr(server, "CART_TTL", 3600)
+    monkeypatch.setattr(server, "CART_ARCHIVE_DIR", tmp_path / "cart-archive")
+
+    cart = server.CartRecord.new("sweep-user")
+    cart.updated_at = "2000-01-01T00:00:00+00:00"
+    server.database.carts["sweep-user"] = cart
+    server.database.save_cart("sweep-user")
+
+    assert asyncio.run(server.sweep_carts()) >= 1
+    assert "sweep-user" not in server.database.carts
+    entries = [json.loads(line) for line in (tmp_path / "changes.log").read_text().splitlines()]
+    assert {"collection": "carts", "key": "sweep-user"}.items() <= entries[-1].items()
@@ -0,0 +1,20 @@
+import server
+
+def test_header_profiling_refused_without_token(monkeypatch, client):
+    monkeypatch.setattr(server, "DIAGNOSTICS_TOKEN", None)
+    assert not server.diagnostics.should_profile("/api/products", "1")
+    assert not server.diagnostics.should_profile("/api/products", "1", "Bearer not-a-jwt")
+
+def test_header_profiling_with_token(monkeypatch, client):
+    monkeypatch.setattr(server, "DIAGNOSTICS_TOKEN", "s3cret")
+    assert server.diagnostics.should_profile("/api/products", "s3cret")
+    assert not server.diagnostics.should_profile("/api/products", "guess")
+
+def test_header_profiling_with_admin_jwt(monkeypatch, admin_headers):
+    monkeypatch.setattr(server, "DIAGNOSTICS_TOKEN", None)
+    assert server.diagnostics.should_profile("/api/products", "1", admin_headers["Authorization"])
+
+def test_path_toggle_does_not_need_header(monkeypatch):
+    monkeypatch.setattr(server.diagnostics, "profile_path_prefix", "/api/orders")
+    assert server.diagnostics.should_profile("/api/orders/1", None)
+    assert not server.diagnostics.should_profile("/api/products", None)
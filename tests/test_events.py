@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+import server
+
+def _user(user_id="u1", is_admin=False):
+    return {"id": user_id, "is_admin": is_admin}
+
+def test_replay_from_buffer():
+    broker = server.EventBroker(10)
+    broker.publish("order.status", "u1", {"n": 1})
+    first_id = broker.buffer[0][0]
+    broker.publish("order.status", "u2", {"n": 2})
+    broker.publish("order.status", "u1", {"n": 3})
+    _, replay = broker.subscribe(_user(), first_id)
+    assert len(replay) == 1 and b'"n": 3' in replay[0]
+
+def test_last_event_id_with_empty_buffer_resyncs():
+    # After a restart the buffer is empty: the client cannot be told what it missed
+    broker = server.EventBroker(10)
+    assert broker.subscribe(_user(), 12345)[1] is None
+    assert broker.subscribe(_user(), None)[1] == []
+
+def test_last_event_id_outside_buffer_resyncs():
+    broker = server.EventBroker(2)
+    for n in range(5):
+        broker.publish("order.status", "u1", {"n": n})
+    assert broker.subscribe(_user(), broker.buffer[0][0] - 5)[1] is None
+
+def test_ticket_is_single_use(client, admin_headers):
+    ticket = client.post("/api/events/ticket", headers=admin_headers).json()["ticket"]
+    assert server.redeem_stream_ticket(ticket)["is_admin"]
+    with pytest.raises(HTTPException):
+        server.redeem_stream_ticket(ticket)
+
+def test_ticket_is_not_a_bearer_token(client, admin_headers):
+    ticket = client.post("/api/events/ticket", headers=admin_headers).json()["ticket"]
+    response = client.get("/api/admin/jobs", headers={"Authorization": f"Bearer {ticket}"})
+    assert response.status_code == 401
+
+def test_jwt_in_query_string_is_rejected(client, admin_headers):
+    jwt = admin_headers["Authorization"][7:]
+    assert client.get("/api/events", params={"token": jwt}).status_code == 401
+    assert client.get("/api/events", params={"ticket": jwt}).status_code == 401
+
+def test_stream_opens_with_ticket(client, admin_headers):
+    ticket = client.post("/api/events/ticket", headers=admin_headers).json()["ticket"]
+    # TestClient buffers whole bodies, so read the first frames of the endless stream directly
+    request = Request({"type": "http", "method": "GET", "path": "/api/events", "headers": [], "query_string": b""})
+
+    async def first_frames():
+        response = await server.get_events(request, ticket=ticket, last_event_id=1)
+        frames = response.body_iterator
+        try:
+            return response, [await frames.__anext__(), await frames.__anext__()]
+        finally:
+            await frames.aclose()
+
+    response, frames = asyncio.run(first_frames())
+    assert response.media_type == "text/event-stream"
+    assert frames == [b"retry: 3000\n\n", b"event: resync\ndata: {}\n\n"]
@@ -0,0 +1,24 @@
+import server
+
+def test_failed_job_without_workers_goes_dead(client, admin_headers):
+    queue = server.JobQueue(workers=0)  # Never started, like a deployment without the lifespan
+    calls = []
+
+    @queue.handler("test.fails")
+    async def fails(payload):
+        calls.append(payload)
+        raise RuntimeError("mail server down")
+
+    job = client.portal.call(queue.enqueue, "test.fails", {"n": 1})
+    assert calls == [{"n": 1}]  # Ran inline, once
+    stored = queue._find(job["id"])
+    assert stored["status"] == "dead"
+    assert stored["last_error"] == "RuntimeError: mail server down"
+
+    dead = client.get("/api/admin/jobs", headers=admin_headers).json()["dead"]
+    assert job["id"] in {j["id"] for j in dead}
+
+    # An admin retry runs it inline again and it stays visible if it fails again
+    assert client.portal.call(queue.retry, job["id"])["status"] == "pending"
+    assert len(calls) == 2
+    assert queue._find(job["id"])["status"] == "dead"
@@ -0,0 +1,54 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+import pytest
+
+import server
+
+class SlowOrderedDict(OrderedDict):
+    """Yields to other threads between looking a bucket up and using it"""
+    def get(self, key, default=None):
+        value = super().get(key, default)
+        time.sleep(0)
+        return value
+
+def _hammer(store, keys, takes_per_thread: int, threads: int = 8, capacity: int = 100, rate: float = 1e-6):
+    barrier = threading.Barrier(threads)
+
+    def run(worker: int) -> int:
+        barrier.wait()
+        allowed = 0
+        for i in range(takes_per_thread):
+            allowed += store.take(keys[(worker + i) % len(keys)], capacity, rate)[0]
+        return allowed
+
+    with ThreadPoolExecutor(threads) as pool:
+        return sum(pool.map(run, range(threads)))
+
+def test_memory_store_survives_concurrent_eviction():
+    store = server.MemoryBucketStore(max_keys=50)
+    store.buckets = SlowOrderedDict()
+    keys = [f"login:10.0.0.{i}" for i in range(60)]
+    # Raised KeyError from move_to_end before the store was locked
+    _hammer(store, keys, takes_per_thread=2000)
+    assert len(store) <= 50
+
+@pytest.mark.parametrize("backend", ["memory", "sqlite"])
+def test_concurrent_takes_never_exceed_budget(backend, tmp_path):
+    if backend == "memory":
+        store = server.MemoryBucketStore(max_keys=1000)
+        store.buckets = SlowOrderedDict()
+    else:
+        store = server.SQLiteBucketStore(str(tmp_path / "buckets.db"), max_keys=1000)
+    assert _hammer(store, ["writes:user-1"], takes_per_thread=50) == 100
+
+def test_route_returns_429_with_retry_after(client, monkeypatch):
+    monkeypatch.setattr(server, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setattr(server, "bucket_store", server.MemoryBucketStore(max_keys=100))
+    monkeypatch.setitem(server.RATE_LIMITS, "login", (2, 1e-6))
+    body = {"email": "nobody@example.com", "password": "wrong"}
+    statuses = [client.post("/api/auth/login", json=body).status_code for _ in range(3)]
+    assert statuses[:2] == [401, 401]
+    assert statuses[2] == 429
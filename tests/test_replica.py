@@ -0,0 +1,101 @@
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import server
+
+@pytest.fixture
+def feed(tmp_path, client):
+    primary = server.ChangeFeed(tmp_path / "changes.log", max_bytes=1 << 20)
+    primary.append("products")  # Something written before the replica started
+    follower = server.ReplicaFollower(primary.path)
+    client.portal.call(follower.poll)  # Positions at the end of the feed
+    return primary, follower
+
+def _write_cart(user_id, quantity):
+    (server.CARTS_DIR / f"{user_id}.json").write_text(json.dumps({
+        "id": f"cart-{user_id}", "user_id": user_id, "updated_at": "2026-01-01T00:00:00+00:00",
+        "items": [{"product_id": "p1", "quantity": quantity, "price": 5.0}]
+    }))
+
+def test_follower_tails_the_feed(client, feed):
+    primary, follower = feed
+    server.database.carts  # Loaded, so cart entries are applied
+    assert follower.applied_seq == primary.seq
+
+    _write_cart("replica-a", 2)
+    primary.append("carts", "replica-a")
+    changes, position = follower.read()
+    assert "replica-a" not in server.database.carts  # Parsed, not applied yet
+    follower.apply(changes, position)
+    assert server.database.carts["replica-a"].items[("p1", None)].quantity == 2
+    assert follower.applied_seq == primary.seq
+
+    (server.CARTS_DIR / "replica-a.json").unlink()
+    primary.append("carts", "replica-a")
+    client.portal.call(follower.poll)
+    assert "replica-a" not in server.database.carts
+
+def test_unparseable_file_is_retried(client, feed):
+    primary, follower = feed
+    server.database.carts
+    (server.CARTS_DIR / "replica-b.json").write_text('{"id": "cart-')  # Caught mid-write
+    primary.append("carts", "replica-b")
+    client.portal.call(follower.poll)
+    assert follower.applied_seq < primary.seq
+
+    _write_cart("replica-b", 1)
+    client.portal.call(follower.poll)
+    assert follower.applied_seq == primary.seq
+    assert "replica-b" in server.database.carts
+    server.database.carts.pop("replica-b")
+    (server.CARTS_DIR / "replica-b.json").unlink()
+
+def test_rotation_reloads_loaded_collections(client, feed):
+    primary, follower = feed
+    server.database.save_shipping()  # The file matches memory, so a reload changes nothing
+    reloads = follower.reloads
+    primary.max_bytes = 1
+    primary.append("shipping")  # Rotates to changes.log.1
+    primary.max_bytes = 1 << 20
+    primary.append("shipping")  # First entry of the new log
+    client.portal.call(follower.poll)
+    assert follower.reloads >= reloads + len(server.database.loaded_collections())
+    assert follower.offset == primary.path.stat().st_size
+    assert follower.applied_seq == primary.seq
+
+@pytest.fixture
+def replica_app(feed, monkeypatch):
+    primary, follower = feed
+    monkeypatch.setattr(server, "replica_follower", follower)
+    monkeypatch.setattr(server, "REPLICA_WAIT_SECONDS", 0.05)
+    app = FastAPI()
+    app.add_middleware(server.ReplicationMiddleware)
+
+    @app.get("/api/ping")
+    async def ping():
+        return {"ok": True}
+
+    with TestClient(app) as c:
+        yield c, primary, follower
+
+def test_min_version_routing(replica_app, monkeypatch):
+    c, primary, follower = replica_app
+    response = c.get("/api/ping", headers={"X-Min-Version": str(follower.applied_seq)})
+    assert response.status_code == 200
+    assert response.headers["X-Data-Version"] == str(follower.applied_seq)
+
+    # Not applied yet: no primary configured, so the client is told to retry
+    response = c.get("/api/ping", headers={"X-Min-Version": str(follower.applied_seq + 1)})
+    assert (response.status_code, response.headers["Retry-After"]) == (503, "1")
+
+    monkeypatch.setattr(server, "REPLICA_PRIMARY_URL", "http://primary:8000")
+    response = c.get("/api/ping?x=1", headers={"X-Min-Version": str(follower.applied_seq + 1)},
+                     follow_redirects=False)
+    assert (response.status_code, response.headers["Location"]) == (307, "http://primary:8000/api/ping?x=1")
+    assert c.post("/api/ping", follow_redirects=False).status_code == 307  # Writes always go to the primary
+
+    monkeypatch.setattr(server, "REPLICA_MAX_STALENESS", -1)
+    assert c.get("/api/ping", follow_redirects=False).status_code == 307
@@ -0,0 +1,93 @@
+import asyncio
+import threading
+
+import server
+
+def _order(client, admin_headers):
+    product = client.get("/api/products").json()[0]
+    return client.post("/api/orders", headers=admin_headers, json={
+        "items": [{"product_id": product["id"], "quantity": 1, "price": product["price"]}],
+        "shipping_address": {}, "billing_address": {}, "buyer_info": {}
+    }).json()
+
+def test_snapshot_records_are_not_changed_by_updates(client, admin_headers):
+    order = _order(client, admin_headers)
+    before = server.database.snapshot("orders")
+    old = next(o for o in before.records if o["id"] == order["id"])
+
+    response = client.put(f"/api/admin/orders/{order['id']}", params={"status": "processing"}, headers=admin_headers)
+    assert response.status_code == 200
+    assert old["status"] == "pending"  # Copy-on-write: the snapshot's record is untouched
+    after = server.database.snapshot("orders")
+    assert after.version > before.version
+    assert next(o for o in after.records if o["id"] == order["id"])["status"] == "processing"
+
+def test_record_replace_copies():
+    record = server.OrderRecord.from_dict({"id": "o1", "status": "pending", "note": "x"})
+    changed = record.replace({"status": "paid", "note": "y"})
+    assert (record["status"], record["note"]) == ("pending", "x")
+    assert (changed["status"], changed["note"], changed["id"]) == ("paid", "y", "o1")
+
+def test_replace_record_builds_on_latest_version(client, admin_headers):
+    order = _order(client, admin_headers)
+    stale = server.find_order(order["id"])
+    server.database.replace_record("orders", stale, {"status": "paid"})
+    # A second update through the now stale reference still finds the order and keeps the first change
+    latest = server.database.replace_record("orders", stale, {"payment_id": "p-1"})
+    assert (latest["status"], latest["payment_id"]) == ("paid", "p-1")
+    assert sum(1 for o in server.database.orders if o["id"] == order["id"]) == 1
+
+def test_persist_writes_off_the_event_loop(client, monkeypatch):
+    threads = []
+    save_json = server.database._save_json
+    monkeypatch.setattr(server.database, "_save_json", lambda *a, **k: (threads.append(threading.current_thread()), save_json(*a, **k)))
+
+    async def persist():
+        await server.database.persist("products")
+        return threading.current_thread()
+
+    loop_thread = asyncio.run(persist())
+    assert threads and threads[0] is not loop_thread
+
+def _statuses(state):
+    return {status: count for status, count in state["order_status"].items() if count}
+
+def test_index_updates_land_before_the_write_is_awaited(client, admin_headers, monkeypatch):
+    paid_later = _order(client, admin_headers)
+    expected = server.Counter(_statuses(server.get_analytics_index().state()))
+    expected.update({"pending": 1 - 1, "paid": 1})  # Order A created, paid_later paid
+    orders_file = server.database.COLLECTIONS["orders"][0]
+    gates = []
+    save_json = server.database._save_json
+
+    def gated_save(filepath, *args, **kwargs):
+        if filepath == orders_file:
+            gate = threading.Event()
+            gates.append(gate)
+            gate.wait(5)
+        return save_json(filepath, *args, **kwargs)
+
+    def wait_for_gates(count):
+        for _ in range(500):
+            if len(gates) >= count:
+                return
+            threading.Event().wait(0.01)
+        raise AssertionError("save never started")
+
+    monkeypatch.setattr(server.database, "_save_json", gated_save)
+    # Order A's save is in flight while stats are read and another order is paid
+    create = threading.Thread(target=_order, args=(client, admin_headers))
+    create.start()
+    wait_for_gates(1)
+    assert client.get("/api/admin/stats", headers=admin_headers).status_code == 200
+    pay = threading.Thread(target=client.put, args=(f"/api/admin/orders/{paid_later['id']}",),
+                           kwargs={"params": {"status": "paid"}, "headers": admin_headers})
+    pay.start()
+    wait_for_gates(2)
+    gates[0].set()
+    create.join()
+
+    # Both changes counted once, even though the second write has not finished
+    assert _statuses(server.get_analytics_index().state()) == dict(+expected)
+    gates[1].set()
+    pay.join()
@@ -0,0 +1,47 @@
+"""
+Search suggestions: the trie is built and swapped in the background, never on
+the request path.
+"""
+
+import server
+
+
+def test_suggest_serves_background_built_index(client, admin_headers):
+    assert client.portal.call(server.rebuild_suggestions)
+    index = server.get_suggest_index()
+
+    body = {"name": "Zarif Ipek Terlik", "description": "x", "price": 100,
+            "category": "Terlik", "image_url": "x", "stock": 5}
+    product_id = client.post("/api/products", json=body, headers=admin_headers).json()["id"]
+    suggestions = client.get("/api/products/suggest", params={"q": "ipek"}).json()
+    assert {"text": "Zarif Ipek Terlik", "type": "product", "product_id": product_id} in suggestions
+    assert server.get_suggest_index() is index  # Applied incrementally
+
+    client.delete(f"/api/products/{product_id}", headers=admin_headers)
+    assert client.get("/api/products/suggest", params={"q": "ipek"}).json() == []
+
+
+def test_stale_index_keeps_serving_until_rebuild(client, monkeypatch):
+    assert client.portal.call(server.rebuild_suggestions)
+    index = server.get_suggest_index()
+    # An event the running refresher is not waiting on, so it stays asleep
+    monkeypatch.setattr(server, "_suggest_stale", server.asyncio.Event())
+    server.database.mark_changed("products")  # A change the trie never saw
+
+    client.get("/api/products/suggest", params={"q": "a"})
+    assert server.get_suggest_index() is index
+    assert server._suggest_stale.is_set()
+
+    assert client.portal.call(server.rebuild_suggestions)
+    assert server.get_suggest_index() is not index
+    assert server.get_suggest_index().versions == server._suggest_versions()
+
+
+def test_ties_rank_the_same_however_built():
+    products = [{"id": str(i), "name": "Deri Bot", "category": "Bot"} for i in range(5)]
+    units = server.Counter()
+    built = server.SuggestIndex(products, units, (0,))
+    grown = server.SuggestIndex([], units, (0,))
+    for product in reversed(products):
+        grown.upsert_product(product)
+    assert built.suggest("deri", 10) == grown.suggest("deri", 10)
@@ -0,0 +1,47 @@
+import asyncio
+
+import pytest
+
+from benchmarks.fakes import start_image_host
+from update_images import ImageValidator, plan_updates
+
+@pytest.fixture
+def image_host():
+    base_url, httpd = start_image_host()
+    yield base_url
+    httpd.shutdown()
+    httpd.server_close()
+
+def test_check_against_stand_in_host(image_host):
+    validator = ImageValidator(concurrency=4, timeout=2)
+    assert validator.check(f"{image_host}/ok/shoe.jpg")["ok"]
+    page = validator.check(f"{image_host}/html/page")
+    assert page["status"] == 200 and not page["ok"]  # Not an image
+    missing = validator.check(f"{image_host}/missing.jpg")
+    assert missing["status"] == 404 and not missing["ok"]
+
+def test_validate_dedupes_and_caches(image_host, tmp_path):
+    cache = tmp_path / "checks.json"
+    urls = [f"{image_host}/ok/{i}.jpg" for i in range(10)] + [f"{image_host}/ok/0.jpg", f"{image_host}/gone"]
+    validator = ImageValidator(concurrency=4, timeout=2, cache_path=cache)
+    results = asyncio.run(validator.validate(urls))
+    assert len(results) == 11
+    assert sum(r["ok"] for r in results.values()) == 10
+
+    # A second validator answers from the cache file without touching the network
+    offline = ImageValidator(concurrency=4, timeout=2, cache_path=cache)
+    offline.check = lambda url: pytest.fail(f"unexpected check of {url}")
+    assert asyncio.run(offline.validate(urls)) == results
+
+def test_plan_updates_prefers_unused_images():
+    products = [
+        {"id": "1", "category": "Bot", "image_url": "a"},
+        {"id": "2", "category": "Ayakkabı", "image_url": "broken"},
+        {"id": "3", "category": "Kemer", "image_url": "x"},  # Not a shoe category
+    ]
+    validity = {"a": {"ok": True}, "broken": {"ok": False}}
+    operations = plan_updates(products, ["img1", "img2"], validity, only_broken=False)
+    assert [op["id"] for op in operations] == ["1", "2"]
+    assert {op["data"]["image_url"] for op in operations} == {"img1", "img2"}
+    only_broken = plan_updates(products, ["img1"], validity, only_broken=True)
+    assert [op["id"] for op in only_broken] == ["2"]